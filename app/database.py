@@ -2,6 +2,7 @@
 # MongoDB istemcisi
 from pymongo import MongoClient
 from pymongo.operations import SearchIndexModel # İndeks oluşturmak için gerekli
+import os
 import sys
 
 # Bağlantı bilgilerini config dosyasından alıyoruz
@@ -38,9 +39,64 @@ try:
     # AI görevlerinin tutulduğu collection
     tasks_col = db.tasks
 
+    # IMAP senkron checkpoint'leri (hesap + klasör başına UIDVALIDITY / son UID / HIGHESTMODSEQ)
+    # {account_id, folder, uidvalidity, last_uid, highestmodseq, pending_uids, updated_at}
+    sync_state_col = db.sync_state
+
+    # AI analiz iş kuyruğu (mail kaydedildikten sonra LLM analizi burada bekler)
+    # {mail_id, status: PENDING/RUNNING/DONE/DEAD, attempts, next_run_at, lease_until, worker, last_error, created_at, finished_at}
+    analysis_jobs_col = db.analysis_jobs
+
+    # LLM cevap önbelleği (aynı model + prompt + format + options -> aynı cevap, temperature 0)
+    # {_id: sha256 anahtar, model, format, response, hits, created_at, last_hit_at}
+    llm_cache_col = db.llm_cache
+
+    # Mail vektörleri (paketlenmiş float32/float16 binary). Liste sorguları mails'e gider,
+    # vektörler ayrı durur. {_id: mail_id, vector, dtype, dim, model, user_email, updated_at}
+    mail_vectors_col = db.mail_vectors
+
+    # Uzun maillerin ek parça vektörleri (ilk parça mail_vectors'ta). MiniLM 256 word-piece'ten
+    # sonrasını kestiği için uzun gövde örtüşen parçalara bölünür.
+    # {_id: "mail_id#n", mail_id, chunk, vector, dtype, dim, model, user_email, updated_at}
+    mail_chunks_col = db.mail_chunks
+
+    # Yeniden vektörleme işinin checkpoint'i (model etiketi başına tek kayıt)
+    # {_id: model, status: RUNNING/STOPPED/DONE/FAILED, last_id, scanned, embedded, failed, total, started_at, updated_at, finished_at, last_error}
+    reembed_state_col = db.reembed_state
+
     print("✅ MongoDB bağlantısı başarıyla kuruldu.")
 
     # --- OTOMATİK INDEX KURULUMU (INIT_DB) ---
+    def _ensure_vector_index(collection, name: str, path: str, filter_path: str = "_id"):
+        """Atlas Vector Search indeksi yoksa oluşturur (mail id filtresi: filtreli hibrit arama için)."""
+        # Mevcut arama indekslerini listele
+        index_names = [index.get("name") for index in collection.list_search_indexes()]
+        if name in index_names:
+            print(f"✅ '{name}' zaten mevcut, her şey hazır.")
+            return
+
+        print(f"⚙️ '{name}' bulunamadı, otomatik oluşturuluyor... (1-2 dk sürebilir)")
+        # Atlas Vector Search İndeks Tanımı
+        # Local model (MiniLM) kullandığımız için boyut 384 olarak ayarlandı.
+        index_model = SearchIndexModel(
+            definition={
+                "fields": [
+                    {
+                        "type": "vector",
+                        "path": path,
+                        "numDimensions": 384, # all-MiniLM-L6-v2 modelinin vektör boyutu
+                        "similarity": "cosine"
+                    },
+                    {"type": "filter", "path": filter_path}
+                ]
+            },
+            name=name,
+            type="vectorSearch"
+        )
+        # İndeksi oluştur
+        collection.create_search_index(model=index_model)
+        print(f"✅ '{name}' oluşturma komutu gönderildi. Atlas arka planda hazırlıyor.")
+
     def init_db():
         """
         Veritabanı başlatıldığında çalışır.
@@ -48,39 +104,80 @@ try:
         Manuel ayar yapma derdini ortadan kaldırır.
         """
         print("⏳ Veritabanı arama indeksleri kontrol ediliyor...")
+
+        # Normal (B-tree) indeksler: Yerel MongoDB'de de çalışır
+        try:
+            sync_state_col.create_index([("account_id", 1), ("folder", 1)], unique=True)
+        except Exception as e:
+            print(f"⚠️ Checkpoint indeksi oluşturulamadı: {e}")
+
+        try:
+            # Her mail için tek iş; işçiler sıradaki işi (status, next_run_at) ile bulur
+            analysis_jobs_col.create_index("mail_id", unique=True)
+            analysis_jobs_col.create_index([("status", 1), ("next_run_at", 1)])
+            analysis_jobs_col.create_index([("status", 1), ("lease_until", 1)])
+            # Biten işler 7 gün sonra silinir (DEAD olanlar inceleme için kalır)
+            analysis_jobs_col.create_index(
+                "finished_at", expireAfterSeconds=7 * 24 * 3600,
+                partialFilterExpression={"status": "DONE"}
+            )
+        except Exception as e:
+            print(f"⚠️ Analiz kuyruğu indeksleri oluşturulamadı: {e}")
+
+        try:
+            # Önbellek kayıtları LLM_CACHE_TTL_DAYS sonra kendiliğinden silinir;
+            # boyut sınırı aşılınca en uzun süredir kullanılmayanlar (last_hit_at) atılır
+            ttl_days = int(os.getenv("LLM_CACHE_TTL_DAYS", "7"))
+            llm_cache_col.create_index("created_at", expireAfterSeconds=ttl_days * 24 * 3600)
+            llm_cache_col.create_index("last_hit_at")
+        except Exception as e:
+            print(f"⚠️ LLM önbellek indeksleri oluşturulamadı: {e}")
         
         try:
-            # Mevcut arama indekslerini listele
+            # Hibrit aramanın kelime ayağı ($text). Dil "none": TR/EN karışık, kök bulma yok,
+            # fatura no / hata kodu gibi ifadeler olduğu gibi eşleşir
+            mails_col.create_index(
+                [("subject", "text"), ("from", "text"), ("body_clean", "text"), ("body", "text")],
+                name="mail_text_index",
+                weights={"subject": 5, "from": 3, "body_clean": 2, "body": 1},
+                default_language="none"
+            )
+        except Exception as e:
+            print(f"⚠️ Metin arama indeksi oluşturulamadı: {e}")
+
+        try:
+            # Aynı hesabı aynı anda tarayan iki tur (poll + IDLE, checkpoint kaybı) aynı maili
+            # iki kez ekleyemesin: message_id upsert'ü ancak benzersiz indeksle yarışsızdır.
+            # user_email dahil: aynı mail bir hesabın Sent'inde, diğerinin Inbox'ında olabilir.
+            mails_col.create_index(
+                [("message_id", 1), ("user_email", 1)],
+                name="mail_message_id_unique", unique=True,
+                partialFilterExpression={"message_id": {"$type": "string"}}
+            )
+        except Exception as e:
+            print(f"⚠️ Message-ID indeksi oluşturulamadı (mükerrer kayıtlar olabilir): {e}")
+
+        try:
+            # Gelen kutusu listesi: durum filtresi + created_at sıralaması (keyset sayfalama)
+            mails_col.create_index([("status", 1), ("created_at", -1), ("_id", -1)])
+        except Exception as e:
+            print(f"⚠️ Gelen kutusu indeksi oluşturulamadı: {e}")
+
+        try:
+            mail_vectors_col.create_index("user_email")
+            mail_chunks_col.create_index("mail_id")
+            # Yerel indeks başka süreçlerin yazdıklarını updated_at ile yetiştirir
+            mail_vectors_col.create_index("updated_at")
+            mail_chunks_col.create_index("updated_at")
+        except Exception as e:
+            print(f"⚠️ Vektör koleksiyonu indeksi oluşturulamadı: {e}")
+        
+        try:
+            # Eski (inline dizi) vektörler ve yan koleksiyondaki float32 BSON vektörler
             # Not: Bu özellik sadece MongoDB Atlas'ta çalışır.
-            existing_indexes = list(mails_col.list_search_indexes())
-            index_names = [index.get("name") for index in existing_indexes]
-            
-            if "vector_index" not in index_names:
-                print("⚙️ 'vector_index' bulunamadı, otomatik oluşturuluyor... (1-2 dk sürebilir)")
-                
-                # Atlas Vector Search İndeks Tanımı
-                # Local model (MiniLM) kullandığımız için boyut 384 olarak ayarlandı.
-                index_model = SearchIndexModel(
-                    definition={
-                        "fields": [
-                            {
-                                "type": "vector",
-                                "path": "embedding",
-                                "numDimensions": 384, # all-MiniLM-L6-v2 modelinin vektör boyutu
-                                "similarity": "cosine"
-                            }
-                        ]
-                    },
-                    name="vector_index",
-                    type="vectorSearch"
-                )
-                
-                # İndeksi oluştur
-                mails_col.create_search_index(model=index_model)
-                print("✅ 'vector_index' oluşturma komutu gönderildi. Atlas arka planda hazırlıyor.")
-            else:
-                print("✅ 'vector_index' zaten mevcut, her şey hazır.")
-                
+            _ensure_vector_index(mails_col, "vector_index", "embedding")
+            _ensure_vector_index(mail_vectors_col, "mail_vector_index", "vector")
+            _ensure_vector_index(mail_chunks_col, "mail_chunk_index", "vector", filter_path="mail_id")
         except Exception as e:
             # Eğer yerel MongoDB (Community Edition) kullanılıyorsa bu özellik çalışmaz, uyarı verip geçeriz.
             print(f"⚠️ İndeks kontrolü uyarısı: {e}")
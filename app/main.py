@@ -27,6 +27,14 @@ load_dotenv(ENV_PATH)
 from app.routes import ui, voice 
 from app.services.mail_listener import check_all_inboxes
 from app.services.sent_mail_listener import check_all_sent
+from app.services.imap_idle import is_push_mode, sync_idle_listeners, stop_idle_listeners
+from app.services.analysis_queue import start_analysis_workers, stop_analysis_workers, get_queue_stats
+from app.services.ollama_service import get_llm_metrics
+from app.services.model_residency import residency
+from app.rag.embeddings import get_embedding_stats
+from app.rag.vector_store import local_index, local_index_enabled
+from app.rag.reembed import stop_reembed, get_reembed_status
+from app.rag.search_cache import get_search_cache_stats
 
 # --- Zamanlayıcı (Scheduler) ---
 scheduler = BackgroundScheduler()
@@ -42,17 +50,42 @@ async def lifespan(app: FastAPI):
         # Böylece login sayfası hemen açılır; taramalar 1-2 sn sonra başlar.
         print("🕑 Mail kontrolü arka planda başlatılıyor...", flush=True)
 
-        # Periyodik kontrolü başlat (15 saniyede bir)
-        scheduler.add_job(check_all_inboxes, 'interval', seconds=15)
-        # Sent kutusu biraz daha seyrek taransın (Gmail UI reply'leri buradan yakalanır)
-        scheduler.add_job(check_all_sent, 'interval', seconds=20)
+        # AI analiz işçileri: Dinleyiciler maili hemen kaydeder, LLM işleri kuyruktan yürür
+        start_analysis_workers()
+
+        # Model(ler)i arka planda belleğe yükle: ilk mail/tıklama yükleme süresini ödemesin.
+        # Boşta kalıp Ollama tarafından atılan model dakikada bir kontrol edilip tekrar yüklenir.
+        scheduler.add_job(residency.warm_all, 'date', run_date=datetime.now() + timedelta(seconds=1))
+        scheduler.add_job(residency.rewarm_idle, 'interval', seconds=60, max_instances=1, coalesce=True)
+
+        # Yerel vektör indeksi (Atlas'sız anlamsal arama): diskten yükle / yoksa Mongo'dan kur.
+        # Periyodik bakım: diske yazma, silinenlerin sıkıştırılması, büyük kutularda IVF eğitimi.
+        if local_index_enabled():
+            scheduler.add_job(local_index.load, 'date', run_date=datetime.now() + timedelta(seconds=2))
+            scheduler.add_job(local_index.maintain, 'interval', minutes=5, max_instances=1, coalesce=True)
+
+        if is_push_mode():
+            # PUSH MODU: Her hesap için kalıcı IMAP oturumu + IDLE.
+            # Scheduler sadece hesap listesini dinleyicilerle eşitler (yeni/silinen hesaplar).
+            scheduler.add_job(sync_idle_listeners, 'interval', seconds=60)
+            scheduler.add_job(sync_idle_listeners, 'date', run_date=datetime.now() + timedelta(seconds=1))
+        else:
+            # Periyodik kontrolü başlat (15 saniyede bir).
+            # Hesaplar paralel taranır ve asılı hesap MAIL_ACCOUNT_TIMEOUT sonra beklenmez;
+            # tur yine de uzarsa kaçırılan çalıştırmalar tek seferde birleştirilir (coalesce).
+            scheduler.add_job(check_all_inboxes, 'interval', seconds=15, coalesce=True)
+            # İlk taramayı scheduler'a "hemen çalıştır" olarak ekle (arka plan thread'inde)
+            scheduler.add_job(check_all_inboxes, 'date', run_date=datetime.now() + timedelta(seconds=1))
 
-        # İlk taramaları scheduler'a "hemen çalıştır" olarak ekle (arka plan thread'inde)
-        scheduler.add_job(check_all_inboxes, 'date', run_date=datetime.now() + timedelta(seconds=1))
+        # Sent kutusu biraz daha seyrek taransın (Gmail UI reply'leri buradan yakalanır)
+        scheduler.add_job(check_all_sent, 'interval', seconds=20, coalesce=True)
         scheduler.add_job(check_all_sent, 'date', run_date=datetime.now() + timedelta(seconds=2))
 
         scheduler.start()
-        print("📥 Multi-Account Mail Dinleyicisi Aktif! (Periyot: 15 sn)", flush=True)
+        if is_push_mode():
+            print("📡 Multi-Account Mail Dinleyicisi Aktif! (Mod: IMAP IDLE)", flush=True)
+        else:
+            print("📥 Multi-Account Mail Dinleyicisi Aktif! (Periyot: 15 sn)", flush=True)
         print("📤 Sent Mail Dinleyicisi Aktif! (Periyot: 20 sn)", flush=True)
     else:
         print("⚠️ Yapılandırma bulunamadı. Web üzerinden kurulum bekleniyor (/setup)...", flush=True)
@@ -65,6 +98,11 @@ async def lifespan(app: FastAPI):
     # --- SUNUCU KAPANIRKEN ---
     if scheduler.running:
         scheduler.shutdown()
+    stop_idle_listeners()
+    stop_analysis_workers()
+    stop_reembed()  # Checkpoint korunur, sonraki başlatmada kaldığı yerden sürer
+    if local_index_enabled():
+        local_index.flush()
     print("🛑 Sistem Kapanıyor...", flush=True)
 
 # FastAPI Uygulaması
@@ -92,9 +130,29 @@ def health():
     return {
         "status": "OK", 
         "configured": os.path.exists(ENV_PATH),
-        "voice_module": "Active" # Ses modülünün aktif olduğunu belirtelim
+        "voice_module": "Active", # Ses modülünün aktif olduğunu belirtelim
+        "analysis_queue": _safe_queue_stats(),
+        "llm": get_llm_metrics(),
+        "model_residency": residency.status(),
+        "embeddings": get_embedding_stats(),
+        "vector_index": local_index.status() if local_index_enabled() else None,
+        "search_cache": get_search_cache_stats(),
+        "reembed": _safe_reembed_status()
     }
 
+def _safe_queue_stats():
+    try:
+        return get_queue_stats()
+    except Exception:
+        return None
+
+def _safe_reembed_status():
+    try:
+        status = get_reembed_status()
+        return {k: status.get(k) for k in ("model", "status", "running", "progress", "embedded", "failed", "mails_per_sec")}
+    except Exception:
+        return None
+
 if __name__ == "__main__":
     import uvicorn
     # host="0.0.0.0" yaparak ağdaki diğer cihazlardan da erişebilirsin
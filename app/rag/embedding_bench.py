@@ -0,0 +1,136 @@
+"""
+Embedding backend'lerini karşılaştırır: yükleme süresi, metin/sn, bellek (RSS) ve
+torch vektörleriyle kosinüs uyumu.
+
+Her backend ayrı bir süreçte ölçülür (torch bir kez yüklenince RSS'ten düşmez).
+
+Kullanım:
+  python -m app.rag.embedding_bench
+  python -m app.rag.embedding_bench --backends torch onnx-int8 --texts 1000 --batch 32
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+# Tipik mail uzunlukları: tek satırdan birkaç paragrafa
+_SENTENCES = [
+    "Toplantı notlarını ekte paylaşıyorum.",
+    "Fatura INV-2024-{n} için ödeme onayı bekleniyor.",
+    "Could you review the proposal before the meeting on Thursday?",
+    "Sipariş {n} numaralı kargo yarın teslim edilecek.",
+    "The build failed with exit code {n}, logs are attached.",
+    "Yıllık izin planlamasını bu hafta tamamlamamız gerekiyor.",
+]
+
+
+def bench_texts(count: int) -> list:
+    texts = []
+    for i in range(count):
+        repeat = 1 + (i % 8) * 4  # 1..29 cümle
+        texts.append(" ".join(
+            _SENTENCES[(i + j) % len(_SENTENCES)].format(n=1000 + i) for j in range(repeat)
+        ))
+    return texts
+
+
+def _rss_mb():
+    """(anlık RSS, tepe RSS) MB; ölçülemezse None."""
+    current = peak = None
+    try:
+        import psutil
+        current = psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux KB, macOS byte döner
+        peak = maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+    except ImportError:
+        pass
+    return (round(current, 1) if current else None), (round(peak, 1) if peak else None)
+
+
+def run_single(backend: str, count: int, batch: int, out_path: str) -> dict:
+    """Bu süreçte tek backend'i ölçer (backend seçimi import'tan önce yapılmalı)."""
+    os.environ["EMBEDDING_BACKEND"] = backend
+    from app.rag import embeddings
+
+    texts = bench_texts(count)
+    start = time.monotonic()
+    model = embeddings.get_model()
+    load_s = time.monotonic() - start
+
+    model.encode(texts[:batch], batch_size=batch, normalize_embeddings=True)  # ısınma
+    start = time.monotonic()
+    vectors = model.encode(texts, batch_size=batch, normalize_embeddings=True, show_progress_bar=False)
+    elapsed = time.monotonic() - start
+    np.save(out_path, np.asarray(vectors, dtype=np.float32))
+
+    rss, peak = _rss_mb()
+    return {
+        "backend": backend,
+        "active": embeddings.get_embedding_stats()["backend"],
+        "load_s": round(load_s, 2),
+        "texts_per_sec": round(len(texts) / elapsed, 1),
+        "rss_mb": rss,
+        "peak_rss_mb": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend karşılaştırması")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--single", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.single, args.texts, args.batch, args.out)))
+        return
+
+    results, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            out_path = os.path.join(tmp, f"{backend}.npy")
+            print(f"⏱️ {backend} ölçülüyor...")
+            proc = subprocess.run(
+                [sys.executable, "-m", "app.rag.embedding_bench", "--single", backend,
+                 "--texts", str(args.texts), "--batch", str(args.batch), "--out", out_path],
+                capture_output=True, text=True
+            )
+            lines = proc.stdout.strip().splitlines()
+            if proc.returncode != 0 or not lines:
+                print(f"❌ {backend} çalışmadı:\n{proc.stderr.strip()[-500:]}")
+                continue
+            result = json.loads(lines[-1])
+            if result["active"] != backend:
+                print(f"⚠️ {backend} yüklenemedi, {result['active']} kullanıldı (sonuç atlanıyor).")
+                continue
+            results.append(result)
+            vectors[backend] = np.load(out_path)
+
+    if not results:
+        return
+    reference = vectors.get("torch")
+    print(f"\n{'backend':<10} {'yükleme sn':>10} {'metin/sn':>10} {'RSS MB':>8} {'tepe MB':>8} {'min cos':>8}")
+    for r in results:
+        cos = "-"
+        if reference is not None and r["backend"] != "torch":
+            cos = f"{float((reference * vectors[r['backend']]).sum(axis=1).min()):.4f}"
+        print(f"{r['backend']:<10} {r['load_s']:>10} {r['texts_per_sec']:>10} "
+              f"{r['rss_mb'] or '-':>8} {r['peak_rss_mb'] or '-':>8} {cos:>8}")
+
+
+if __name__ == "__main__":
+    main()
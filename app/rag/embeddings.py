@@ -1,17 +1,51 @@
+import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 
 # Modelin diskteki yolu (download_model.py ile buraya indirdik)
 MODEL_PATH = os.path.join("models", "embedding_model")
 
+# Vektörler üreten modelin etiketiyle saklanır; model değişince eski vektörler "bayat" sayılır
+# ve yeniden vektörleme işi (app/rag/reembed.py) onları günceller.
+# download_model.py etiketi model klasörüne yazar; EMBEDDING_MODEL_TAG ile elle de verilebilir.
+MODEL_INFO_FILE = "model_info.json"
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_MODEL_VERSION = "1"
+_model_tag = None
+
+def get_model_tag() -> str:
+    """Aktif embedding modelinin etiketi: "<ad>@<sürüm>" (ör. all-MiniLM-L6-v2@1)"""
+    global _model_tag
+    if _model_tag is None:
+        tag = os.getenv("EMBEDDING_MODEL_TAG", "").strip()
+        if not tag:
+            info = {}
+            try:
+                with open(os.path.join(MODEL_PATH, MODEL_INFO_FILE), encoding="utf-8") as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                pass
+            tag = f"{info.get('name', DEFAULT_MODEL_NAME)}@{info.get('version', DEFAULT_MODEL_VERSION)}"
+        _model_tag = tag
+    return _model_tag
+
+# Çıkarım motoru: "torch" (SentenceTransformer), "onnx" veya "onnx-int8" (onnxruntime, torch yüklenmez).
+# ONNX dosyaları "python -m app.rag.onnx_backend" ile üretilir; yoksa/doğrulanamadıysa torch kullanılır.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+
 # Modeli bellekte tutmak için global değişken (Singleton Pattern)
 # Böylece her seferinde tekrar tekrar yükleyip zaman kaybetmeyiz.
 _embedding_model = None
+_active_backend = None
 
 def get_model():
     """
     Modeli yükler ve döner. Eğer zaten yüklüyse hafızadakini kullanır.
     """
-    global _embedding_model
+    global _embedding_model, _active_backend
     
     # Varsayılan: embeddings AÇIK.
     # Login gecikmesini önlemek için model import'u ve yükleme lazy (ilk kullanımda) yapılır.
@@ -26,37 +60,181 @@ def get_model():
                 "Lütfen önce ana dizindeki 'download_model.py' dosyasını çalıştırın."
             )
         
-        print(f"🧠 Embedding modeli yükleniyor... ({MODEL_PATH})")
-        # Local modeli yükle
-        from sentence_transformers import SentenceTransformer  # lazy import (startup hızlansın)
-        _embedding_model = SentenceTransformer(MODEL_PATH)
+        print(f"🧠 Embedding modeli yükleniyor... ({MODEL_PATH}, {EMBEDDING_BACKEND})")
+        _embedding_model = _load_onnx() if EMBEDDING_BACKEND in ("onnx", "onnx-int8") else None
+        _active_backend = EMBEDDING_BACKEND
+        if _embedding_model is None:
+            # Local modeli yükle
+            from sentence_transformers import SentenceTransformer  # lazy import (startup hızlansın)
+            _embedding_model = SentenceTransformer(MODEL_PATH)
+            _active_backend = "torch"
         print("✅ Model belleğe yüklendi.")
     
     return _embedding_model
 
+def _load_onnx():
+    """ONNX modelini yükler; kurulu değilse veya vektör uyumluluğu doğrulanamadıysa None."""
+    try:
+        from app.rag.onnx_backend import OnnxEmbedder, get_verification
+        check = get_verification(MODEL_PATH, EMBEDDING_BACKEND)
+        if check and not check.get("passed"):
+            print(f"⚠️ {EMBEDDING_BACKEND} vektörleri torch ile uyumsuz (min cos {check.get('min_cosine')}), torch kullanılıyor.")
+            return None
+        if not check:
+            print(f"⚠️ {EMBEDDING_BACKEND} modeli doğrulanmamış (python -m app.rag.onnx_backend).")
+        return OnnxEmbedder(MODEL_PATH, EMBEDDING_BACKEND)
+    except Exception as e:
+        print(f"⚠️ ONNX embedding yüklenemedi ({e}), torch kullanılıyor.")
+        return None
+
+# --- MİKRO-BATCH EMBEDDING SERVİSİ ---
+# Tek metinle encode() çağırmak CPU'nun SIMD kapasitesini boşa harcar. Farklı thread'lerden
+# (listener'lar, analiz aşamaları, arama) gelen istekler kuyrukta toplanır, en fazla
+# EMBED_BATCH_SIZE metin veya EMBED_BATCH_WAIT_MS beklemeyle tek encode() çağrısında işlenir.
+EMBED_BATCH_SIZE = max(1, int(os.getenv("EMBED_BATCH_SIZE", "32")))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "10"))
+# Senkron çağıranın bir vektör için en fazla bekleme süresi (ilk çağrıda model yüklemesi dahil)
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "120"))
+
+
+class EmbeddingBatcher:
+    """
+    Metinleri kuyrukta toplayıp toplu encode eden arka plan servisi.
+    submit(text) -> Future[list[float]]
+    """
+
+    def __init__(self, max_batch: int = EMBED_BATCH_SIZE, max_wait_ms: float = EMBED_BATCH_WAIT_MS):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {"texts": 0, "batches": 0, "errors": 0, "encode_ms": 0.0, "max_batch_seen": 0}
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True, name="embedding-batcher")
+                self.thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._ensure_started()
+        self.queue.put((text, future))
+        return future
+
+    def _collect(self) -> list:
+        """İlk isteği bekler, ardından max_wait süresince (veya batch dolana kadar) toplar."""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # İptal edilmiş (timeout'a düşmüş) istekleri encode etme
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.monotonic()
+            try:
+                model = get_model()
+                # normalize_embeddings=True -> Cosine Similarity için vektörleri normalize eder
+                vectors = model.encode(
+                    [text for text, _ in batch],
+                    batch_size=len(batch),
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                )
+            except Exception as e:
+                with self.lock:
+                    self.stats["errors"] += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            elapsed_ms = (time.monotonic() - start) * 1000
+            with self.lock:
+                self.stats["texts"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["encode_ms"] += elapsed_ms
+                self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+
+            for (_, future), vector in zip(batch, vectors):
+                # Numpy array'i Python listesine çevir (MongoDB list ister)
+                future.set_result(vector.tolist())
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["queued"] = self.queue.qsize()
+        stats["avg_batch_size"] = round(stats["texts"] / stats["batches"], 2) if stats["batches"] else None
+        stats["avg_ms_per_text"] = round(stats["encode_ms"] / stats["texts"], 2) if stats["texts"] else None
+        stats["encode_ms"] = round(stats["encode_ms"], 1)
+        return stats
+
+
+_batcher = EmbeddingBatcher()
+
+def _prepare(text) -> str:
+    if not text or not isinstance(text, str):
+        return ""
+    # Metni temizle (Yeni satırları boşlukla değiştir - önerilen pratik)
+    return text.replace("\n", " ")
+
+def _embeddings_enabled() -> bool:
+    return os.getenv("EMBEDDINGS_ENABLED", "1").strip() == "1"
+
+def submit_embedding(text: str):
+    """Asenkron: vektör için Future döner (boş metin / kapalı embedding -> None)."""
+    text = _prepare(text)
+    if not text or not _embeddings_enabled():
+        return None
+    return _batcher.submit(text)
+
+def get_embeddings(texts: list) -> list:
+    """
+    Birden fazla metni aynı anda kuyruğa koyar (toplu işlenir).
+    Sıra korunur; başarısız/boş olanlar için [] döner.
+    """
+    futures = [submit_embedding(text) for text in texts]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(timeout=EMBED_TIMEOUT) if future else [])
+        except Exception:
+            if future:
+                future.cancel()
+            results.append([])
+    return results
+
 def get_embedding(text: str) -> list[float]:
     """
     Verilen metni vektöre (sayı listesine) çevirir.
     MongoDB Vector Search için bu format gereklidir.
+    Diğer thread'lerden gelen isteklerle aynı batch'te işlenir.
     """
-    if not text or not isinstance(text, str):
-        return []
-
     # Embeddings kapalıysa veya model yüklenemiyorsa sessizce boş dön (fallback)
-    try:
-        model = get_model()
-    except Exception:
-        return []
-    
-    # Metni temizle (Yeni satırları boşlukla değiştir - önerilen pratik)
-    text = text.replace("\n", " ")
-    
-    # Vektörü oluştur
-    # normalize_embeddings=True -> Cosine Similarity için vektörleri normalize eder (0-1 arası denge)
-    embedding = model.encode(text, normalize_embeddings=True)
-    
-    # Numpy array'i Python listesine çevirip döndür (MongoDB list ister)
-    return embedding.tolist()
+    return get_embeddings([text])[0]
+
+def get_embedding_stats() -> dict:
+    """Batch istatistikleri (/health için)."""
+    stats = _batcher.get_stats()
+    stats["enabled"] = _embeddings_enabled()
+    stats["model"] = get_model_tag()
+    stats["backend"] = _active_backend or EMBEDDING_BACKEND
+    stats["max_batch"] = EMBED_BATCH_SIZE
+    stats["max_wait_ms"] = EMBED_BATCH_WAIT_MS
+    return stats
 
 # Test Bloğu (Dosya doğrudan çalıştırılırsa test yapar)
 if __name__ == "__main__":
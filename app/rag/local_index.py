@@ -0,0 +1,450 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# --- YEREL VEKTÖR İNDEKSİ (Atlas olmadan anlamsal arama) ---
+# MongoDB Community Edition'da $vectorSearch yok. Vektörler models/ yanında diskte
+# memory-mapped bir matris olarak tutulur; arama NumPy ile vektörize kosinüs top-k'dır.
+#   vectors.npy : (kapasite, boyut) float32/float16 matris (mmap)
+#   ids.json    : satır -> anahtar (mail_id; uzun maillerin ek parçaları "mail_id#n")
+#   alive.npy   : silinen satırlar (tombstone) False
+#   ivf.npz     : (opsiyonel) yaklaşık arama için küme merkezleri ve satır atamaları
+# İndeks yoksa / bozuksa Mongo'dan (mail_vectors + eski mails.embedding) yeniden kurulur.
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join("models", "vector_index"))
+LOCAL_INDEX_DTYPE = os.getenv(
+    "LOCAL_INDEX_DTYPE",
+    "float16" if os.getenv("VECTOR_STORAGE", "float32").strip().lower() == "float16" else "float32"
+).strip().lower()
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+
+# Yaklaşık arama (IVF): "auto" -> satır sayısı LOCAL_INDEX_APPROX_MIN_ROWS'u geçince, "1" -> hep, "0" -> hiç
+LOCAL_INDEX_APPROX = os.getenv("LOCAL_INDEX_APPROX", "auto").strip().lower()
+APPROX_MIN_ROWS = int(os.getenv("LOCAL_INDEX_APPROX_MIN_ROWS", "200000"))
+# Yaklaşık aramada taranacak en yakın küme sayısı (fazlası = daha isabetli, daha yavaş)
+NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+# Silinen satır oranı bunu geçince sıkıştırma (compaction) yapılır
+COMPACT_RATIO = 0.2
+# Başka süreçlerin yazdığı vektörler yetiştirilirken saat farkı için pay (sn)
+CATCH_UP_MARGIN = 60
+# Tam aramada matris bu kadar satırlık parçalarla okunur (float16 -> float32 dönüşümü bellekte sınırlı kalsın)
+_SEARCH_CHUNK = 65536
+_MIN_CAPACITY = 1024
+
+
+def _decode(data, dtype: str) -> np.ndarray:
+    """mail_vectors.vector binary'sini NumPy'a çevirir (vector_store.pack_vector'ın tersi)."""
+    raw = bytes(data)
+    if dtype == "float16":
+        return np.frombuffer(raw, dtype="<f2").astype(np.float32)
+    # BSON vector (subtype 9): 2 bayt başlık (dtype + padding), ardından float32 little-endian
+    return np.frombuffer(raw[2:], dtype="<f4")
+
+
+def _normalize(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else v
+
+
+class LocalVectorIndex:
+    """Disk üzerinde memory-mapped, artımlı güncellenen vektör indeksi."""
+
+    def __init__(self, path: str = LOCAL_INDEX_DIR, dim: int = EMBEDDING_DIM, dtype: str = LOCAL_INDEX_DTYPE):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.float16 if dtype == "float16" else np.float32
+        self.lock = threading.RLock()
+        self.matrix = None                      # (kapasite, dim) memmap
+        self.count = 0                          # Kullanılan satır sayısı
+        self.ids = []                           # satır -> mail_id (str)
+        self.rows = {}                          # anahtar -> satır
+        self.children = {}                      # mail_id -> {"mail_id#n", ...} (parça vektörleri)
+        self.alive = np.zeros(0, dtype=bool)
+        self.centroids = None                   # (nlist, dim) IVF merkezleri
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.ready = False
+        self.building = False
+        self.dirty = False
+        self.pending = []                       # Kurulum sırasında gelen eklemeler
+        self.synced_at = None                   # Mongo'daki değişikliklerin en son çekildiği an
+        self.stats = {"searches": 0, "last_search_ms": None, "last_build_s": None, "compactions": 0}
+
+    # --- Dosyalar ---
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _open_matrix(self, capacity: int, copy_rows: int = 0):
+        """Verilen kapasitede yeni mmap dosyası açar; mevcut ilk copy_rows satırı taşır."""
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file("vectors.npy.tmp")
+        new = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.dtype, shape=(capacity, self.dim))
+        if copy_rows and self.matrix is not None:
+            new[:copy_rows] = self.matrix[:copy_rows]
+        new.flush()
+        del new
+        # Windows'ta açık mmap'in üzerine yazılamaz: önce eskiyi bırak
+        self.matrix = None
+        os.replace(tmp, self._file("vectors.npy"))
+        self.matrix = np.load(self._file("vectors.npy"), mmap_mode="r+")
+
+    def _ensure_capacity(self, needed: int):
+        capacity = 0 if self.matrix is None else self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        self._open_matrix(max(_MIN_CAPACITY, capacity * 2, needed), copy_rows=self.count)
+
+    def flush(self):
+        """Değişiklikleri diske yazar (meta dosyaları atomik olarak değiştirilir)."""
+        with self.lock:
+            if not self.dirty or self.matrix is None:
+                return
+            self.matrix.flush()
+            os.makedirs(self.path, exist_ok=True)
+
+            np.save(self._file("alive.npy.tmp.npy"), self.alive[:self.count])
+            os.replace(self._file("alive.npy.tmp.npy"), self._file("alive.npy"))
+            if self.centroids is not None:
+                np.savez(self._file("ivf.tmp.npz"), centroids=self.centroids, assign=self.assign[:self.count])
+                os.replace(self._file("ivf.tmp.npz"), self._file("ivf.npz"))
+            elif os.path.exists(self._file("ivf.npz")):
+                os.remove(self._file("ivf.npz"))
+
+            # saved_at: bu andan sonra Mongo'ya yazılanlar yüklemede yetiştirilir
+            saved_at = self.synced_at or datetime.utcnow()
+            with open(self._file("ids.json.tmp"), "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "dtype": np.dtype(self.dtype).name, "count": self.count,
+                           "saved_at": saved_at.isoformat(), "ids": self.ids}, f)
+            os.replace(self._file("ids.json.tmp"), self._file("ids.json"))
+            self.dirty = False
+
+    def load(self) -> bool:
+        """Diskteki indeksi açar; yoksa veya uyumsuzsa Mongo'dan kurar."""
+        with self.lock:
+            if self.ready:
+                return True
+            try:
+                with open(self._file("ids.json"), encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta["dim"] != self.dim or meta["dtype"] != np.dtype(self.dtype).name:
+                    raise ValueError("boyut/dtype değişmiş")
+                self.matrix = np.load(self._file("vectors.npy"), mmap_mode="r+")
+                self.count = meta["count"]
+                self.ids = meta["ids"]
+                self.alive = np.zeros(self.matrix.shape[0], dtype=bool)
+                self.alive[:self.count] = np.load(self._file("alive.npy"))
+                self._set_rows({mid: i for i, mid in enumerate(self.ids) if self.alive[i]})
+                self.assign = np.zeros(self.matrix.shape[0], dtype=np.int32)
+                if os.path.exists(self._file("ivf.npz")):
+                    ivf = np.load(self._file("ivf.npz"))
+                    self.centroids = ivf["centroids"]
+                    self.assign[:self.count] = ivf["assign"]
+                self.ready = True
+                self._apply_pending()
+            except (OSError, ValueError, KeyError) as e:
+                if os.path.exists(self._file("ids.json")):
+                    print(f"⚠️ Yerel vektör indeksi okunamadı ({e}), yeniden kuruluyor...")
+                meta = None
+
+        if meta is None or not self.ready:
+            return self.rebuild()
+        # İndeks kapalıyken (başka süreç, taşıma komutu) yazılan vektörleri yetiştir
+        caught_up = self._catch_up(meta.get("saved_at"))
+        print(f"✅ Yerel vektör indeksi yüklendi: {len(self.rows)} vektör, {caught_up} yeni ({self.path})")
+        return True
+
+    def _catch_up(self, saved_at) -> int:
+        """
+        saved_at'ten sonra Mongo'ya yazılan vektörleri ekler (başka süreçler: taşıma ve
+        yeniden vektörleme komutları). Saat farkı için küçük bir pay bırakılır.
+        """
+        from app.database import mail_vectors_col, mail_chunks_col
+
+        if not saved_at:
+            self.synced_at = datetime.utcnow()
+            return 0
+        count = 0
+        try:
+            since = datetime.fromisoformat(saved_at) if isinstance(saved_at, str) else saved_at
+            since -= timedelta(seconds=CATCH_UP_MARGIN)
+            synced_at = datetime.utcnow()
+            for col in (mail_vectors_col, mail_chunks_col):
+                for doc in col.find({"updated_at": {"$gt": since}}, {"vector": 1, "dtype": 1}):
+                    self.add(doc["_id"], _decode(doc["vector"], doc.get("dtype", "float32")))
+                    count += 1
+            self.synced_at = synced_at
+        except Exception as e:
+            print(f"⚠️ Yerel vektör indeksi güncellenemedi: {e}")
+        return count
+
+    def _apply_pending(self):
+        # Yükleme/kurulum sırasında kaydedilen yeni mailler
+        for mail_id, vector in self.pending:
+            self._add_locked(mail_id, vector)
+        self.pending = []
+
+    def rebuild(self) -> bool:
+        """İndeksi Mongo'daki vektörlerden sıfırdan kurar."""
+        from app.database import mails_col, mail_vectors_col, mail_chunks_col
+
+        with self.lock:
+            if self.building:
+                return False
+            self.building = True
+            self.ready = False
+        start = time.monotonic()
+        synced_at = datetime.utcnow()
+        try:
+            # Python float listesine açmadan doğrudan NumPy'a (100k vektörde bellek farkı büyük)
+            ids = []
+            staging = np.zeros((_MIN_CAPACITY, self.dim), dtype=self.dtype)
+
+            def stage(mail_id, vector):
+                nonlocal staging
+                if vector.shape[0] != self.dim:
+                    return
+                if len(ids) == staging.shape[0]:
+                    staging = np.concatenate([staging, np.zeros_like(staging)])
+                staging[len(ids)] = _normalize(vector)
+                ids.append(str(mail_id))
+
+            for doc in mail_vectors_col.find({}, {"vector": 1, "dtype": 1}):
+                stage(doc["_id"], _decode(doc["vector"], doc.get("dtype", "float32")))
+            for doc in mail_chunks_col.find({}, {"vector": 1, "dtype": 1}):
+                stage(doc["_id"], _decode(doc["vector"], doc.get("dtype", "float32")))
+            seen = set(ids)
+            for doc in mails_col.find({"embedding.0": {"$exists": True}}, {"embedding": 1}):
+                if str(doc["_id"]) not in seen:
+                    stage(doc["_id"], np.asarray(doc["embedding"], dtype=np.float32))
+
+            with self.lock:
+                self.matrix = None
+                self.count = 0
+                self.ids, self.rows = [], {}
+                self.centroids = None
+                self._open_matrix(max(_MIN_CAPACITY, len(ids)))
+                self.matrix[:len(ids)] = staging[:len(ids)]
+                self.count = len(ids)
+                self.ids = ids
+                self._set_rows({mid: i for i, mid in enumerate(ids)})
+                self.alive = np.zeros(self.matrix.shape[0], dtype=bool)
+                self.alive[:self.count] = True
+                self.assign = np.zeros(self.matrix.shape[0], dtype=np.int32)
+                if self._approx_wanted():
+                    self.train_ivf()
+                self.ready = True
+                self.dirty = True
+                self.synced_at = synced_at
+                self._apply_pending()
+                self.flush()
+        except Exception as e:
+            print(f"⚠️ Yerel vektör indeksi kurulamadı: {e}")
+            return False
+        finally:
+            with self.lock:
+                self.building = False
+
+        elapsed = time.monotonic() - start
+        self.stats["last_build_s"] = round(elapsed, 1)
+        print(f"✅ Yerel vektör indeksi kuruldu: {len(self.rows)} vektör ({elapsed:.1f} sn)")
+        return True
+
+    # --- Güncelleme ---
+    def _set_rows(self, rows: dict):
+        self.rows = rows
+        self.children = {}
+        for key in rows:
+            if "#" in key:
+                self.children.setdefault(key.split("#", 1)[0], set()).add(key)
+
+    def _add_locked(self, mail_id: str, vector):
+        v = _normalize(vector)
+        if v.shape[0] != self.dim:
+            return
+        row = self.rows.get(mail_id)
+        if row is None:
+            self._ensure_capacity(self.count + 1)
+            if self.alive.shape[0] < self.matrix.shape[0]:
+                self.alive = np.concatenate([self.alive, np.zeros(self.matrix.shape[0] - self.alive.shape[0], bool)])
+                self.assign = np.concatenate([self.assign, np.zeros(self.matrix.shape[0] - self.assign.shape[0], np.int32)])
+            row = self.count
+            self.count += 1
+            self.ids.append(mail_id)
+            self.rows[mail_id] = row
+            if "#" in mail_id:
+                self.children.setdefault(mail_id.split("#", 1)[0], set()).add(mail_id)
+            self.alive[row] = True
+        self.matrix[row] = v
+        if self.centroids is not None:
+            self.assign[row] = int(np.argmax(self.centroids @ v))
+        self.dirty = True
+
+    def add(self, mail_id, vector):
+        """Yeni (veya güncellenen) mail vektörünü ekler."""
+        if vector is None or len(vector) == 0:
+            return
+        with self.lock:
+            if not self.ready:
+                # İndeks henüz yüklenmedi: yüklenince eklenir (kurulamazsa bellek şişmesin)
+                if len(self.pending) < 50000:
+                    self.pending.append((str(mail_id), vector))
+                return
+            self._add_locked(str(mail_id), vector)
+
+    def remove(self, mail_ids):
+        """
+        Silinen mailleri (ve parça vektörlerini) tombstone ile işaretler
+        (satırlar compaction'da atılır). Tek parça anahtarı ("mail_id#n") da verilebilir.
+        """
+        with self.lock:
+            for mail_id in mail_ids:
+                key = str(mail_id)
+                keys = [key] + list(self.children.pop(key, ()))
+                if "#" in key:
+                    self.children.get(key.split("#", 1)[0], set()).discard(key)
+                for k in keys:
+                    row = self.rows.pop(k, None)
+                    if row is not None:
+                        self.alive[row] = False
+                        self.dirty = True
+
+    def compact(self):
+        """Silinmiş satırları atıp matrisi yeniden yazar."""
+        with self.lock:
+            keep = np.nonzero(self.alive[:self.count])[0]
+            vectors = np.array(self.matrix[keep])
+            ids = [self.ids[i] for i in keep]
+
+            self.matrix = None
+            self._open_matrix(max(_MIN_CAPACITY, len(ids) * 2))
+            self.matrix[:len(ids)] = vectors
+            self.count = len(ids)
+            self.ids = ids
+            self._set_rows({mid: i for i, mid in enumerate(ids)})
+            self.alive = np.zeros(self.matrix.shape[0], dtype=bool)
+            self.alive[:self.count] = True
+            self.assign = np.zeros(self.matrix.shape[0], dtype=np.int32)
+            self.centroids = None
+            if self._approx_wanted():
+                self.train_ivf()
+            self.dirty = True
+            self.stats["compactions"] += 1
+            self.flush()
+
+    # --- Yaklaşık arama (IVF) ---
+    def _approx_wanted(self) -> bool:
+        if LOCAL_INDEX_APPROX in ("1", "true", "yes"):
+            return self.count >= 1000
+        if LOCAL_INDEX_APPROX == "auto":
+            return len(self.rows) >= APPROX_MIN_ROWS
+        return False
+
+    def train_ivf(self, iterations: int = 8):
+        """Küresel k-means ile küme merkezlerini öğrenir ve tüm satırları atar."""
+        with self.lock:
+            live = np.nonzero(self.alive[:self.count])[0]
+            if len(live) == 0:
+                return
+            nlist = int(min(4096, max(16, np.sqrt(len(live)))))
+            rng = np.random.default_rng(0)
+            sample = np.asarray(self.matrix[rng.choice(live, size=min(len(live), nlist * 64), replace=False)],
+                                dtype=np.float32)
+            centroids = sample[rng.choice(len(sample), size=min(nlist, len(sample)), replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(len(centroids)):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroids[c] = _normalize(members.sum(axis=0))
+            self.centroids = centroids
+
+            for start in range(0, self.count, _SEARCH_CHUNK):
+                block = np.asarray(self.matrix[start:start + _SEARCH_CHUNK], dtype=np.float32)
+                self.assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            self.dirty = True
+
+    # --- Arama ---
+    def search(self, query_vector, k: int = 10, approximate: bool = None, allowed: set = None) -> list:
+        """
+        Kosinüs benzerliğine göre en yakın k vektör.
+        allowed: Verilirse sadece bu mail id'leri (str) ve parçaları puanlanır (filtreler puanlamadan önce).
+        return: [(anahtar(str), score), ...] (azalan; parça anahtarları "mail_id#n")
+        """
+        if not self.ready and not self.load():
+            return []
+        start = time.monotonic()
+        q = _normalize(query_vector)
+
+        with self.lock:
+            if q.shape[0] != self.dim or self.count == 0:
+                return []
+            if approximate is None:
+                approximate = self.centroids is not None and self._approx_wanted()
+
+            if allowed is not None:
+                # Filtreli arama: sadece izin verilen satırlar okunur (yaklaşık moda gerek yok)
+                keys = [key for mid in allowed for key in [mid, *self.children.get(mid, ())]]
+                rows = np.array(sorted(self.rows[key] for key in keys if key in self.rows), dtype=np.int64)
+                scores = (np.asarray(self.matrix[rows], dtype=np.float32) @ q
+                          if len(rows) else np.zeros(0, dtype=np.float32))
+            elif approximate and self.centroids is not None:
+                probes = np.argsort(self.centroids @ q)[-NPROBE:]
+                rows = np.nonzero(self.alive[:self.count] & np.isin(self.assign[:self.count], probes))[0]
+                scores = np.asarray(self.matrix[rows], dtype=np.float32) @ q
+            else:
+                rows = None
+                scores = np.empty(self.count, dtype=np.float32)
+                for s in range(0, self.count, _SEARCH_CHUNK):
+                    block = np.asarray(self.matrix[s:s + _SEARCH_CHUNK][:self.count - s], dtype=np.float32)
+                    scores[s:s + len(block)] = block @ q
+                scores[~self.alive[:self.count]] = -np.inf
+
+            k = min(k, len(scores))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = [
+                (self.ids[rows[i] if rows is not None else i], float(scores[i]))
+                for i in top if np.isfinite(scores[i])
+            ]
+
+        self.stats["searches"] += 1
+        self.stats["last_search_ms"] = round((time.monotonic() - start) * 1000, 2)
+        return results
+
+    # --- Bakım ---
+    def maintain(self):
+        """Periyodik: gerekirse yükler, sıkıştırır, IVF'i eğitir ve diske yazar."""
+        if not self.ready:
+            self.load()
+            return
+        # Başka süreçlerin yazdıkları (python -m app.rag.reembed / migrate_vectors)
+        self._catch_up(self.synced_at)
+        with self.lock:
+            dead = self.count - len(self.rows)
+            if self.count and dead / self.count > COMPACT_RATIO:
+                self.compact()
+                return
+            if self.centroids is None and self._approx_wanted():
+                self.train_ivf()
+        self.flush()
+
+    def status(self) -> dict:
+        with self.lock:
+            return dict(self.stats, **{
+                "ready": self.ready,
+                "building": self.building,
+                "vectors": len(self.rows),
+                "tombstones": self.count - len(self.rows),
+                "capacity": 0 if self.matrix is None else int(self.matrix.shape[0]),
+                "dtype": np.dtype(self.dtype).name,
+                "approximate": self.centroids is not None,
+                "path": self.path,
+            })
+
+
+local_index = LocalVectorIndex()
@@ -0,0 +1,90 @@
+"""
+Eski vektörleri kompakt saklamaya taşır:
+  mails.embedding (384 double dizi) -> mail_vectors (paketlenmiş float32/float16 binary)
+
+Kullanım:
+  python -m app.rag.migrate_vectors                 # VECTOR_STORAGE biçimine taşı
+  python -m app.rag.migrate_vectors --dtype float16 # yan koleksiyondakileri de yeniden paketler
+  python -m app.rag.migrate_vectors --keep-inline   # mails.embedding alanını silme
+
+Taşınan maillerden embedding alanı silindiği için komut yarıda kesilirse kaldığı yerden devam eder.
+"""
+import argparse
+import time
+
+from pymongo import ReplaceOne
+
+from app.database import mails_col, mail_vectors_col
+from app.rag.vector_store import VECTOR_STORAGE, vector_doc, unpack_vector
+
+
+def migrate_inline(dtype: str, batch_size: int, keep_inline: bool) -> int:
+    """mails.embedding dizilerini yan koleksiyona yazar."""
+    query = {"embedding.0": {"$exists": True}}
+    if keep_inline:
+        # Alan silinmeyeceği için zaten taşınmış olanları atla
+        done = mail_vectors_col.distinct("_id")
+        query["_id"] = {"$nin": done}
+
+    moved = 0
+    while True:
+        batch = list(mails_col.find(query, {"embedding": 1, "embedding_model": 1, "user_email": 1}).limit(batch_size))
+        if not batch:
+            break
+
+        mail_vectors_col.bulk_write([
+            # Etiketsiz eski vektörler "" modeliyle taşınır (reembed onları bayat sayar)
+            ReplaceOne({"_id": m["_id"]}, vector_doc(
+                m["_id"], m["embedding"], m.get("user_email", ""), dtype, model=m.get("embedding_model", "")
+            ), upsert=True)
+            for m in batch
+        ], ordered=False)
+        ids = [m["_id"] for m in batch]
+        if keep_inline:
+            query["_id"]["$nin"].extend(ids)
+        else:
+            mails_col.update_many({"_id": {"$in": ids}}, {"$unset": {"embedding": ""}})
+
+        moved += len(batch)
+        print(f"   ↪ {moved} mail vektörü taşındı...")
+    return moved
+
+
+def repack_side(dtype: str, batch_size: int) -> int:
+    """Yan koleksiyonda farklı biçimde saklanan vektörleri yeniden paketler."""
+    repacked = 0
+    while True:
+        batch = list(mail_vectors_col.find({"dtype": {"$ne": dtype}}).limit(batch_size))
+        if not batch:
+            break
+        mail_vectors_col.bulk_write([
+            ReplaceOne({"_id": d["_id"]}, vector_doc(
+                d["_id"], unpack_vector(d["vector"], d.get("dtype", "float32")), d.get("user_email", ""), dtype,
+                model=d.get("model", "")
+            ))
+            for d in batch
+        ], ordered=False)
+        repacked += len(batch)
+        print(f"   ↪ {repacked} vektör {dtype} olarak yeniden paketlendi...")
+    return repacked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mail vektörlerini kompakt binary saklamaya taşır.")
+    parser.add_argument("--dtype", choices=["float32", "float16"],
+                        default=VECTOR_STORAGE if VECTOR_STORAGE != "inline" else "float32")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--keep-inline", action="store_true", help="mails.embedding alanını silme")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    print(f"🔄 Vektör taşıma başladı (hedef: {args.dtype})")
+    moved = migrate_inline(args.dtype, args.batch, args.keep_inline)
+    repacked = repack_side(args.dtype, args.batch)
+    print(f"✅ Bitti: {moved} taşındı, {repacked} yeniden paketlendi ({time.monotonic() - start:.1f} sn)")
+    if args.dtype == "float16":
+        print("ℹ️ float16 vektörleri Atlas arayamaz: .env içinde VECTOR_STORAGE=float16 olmalı (uygulama içi arama).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Embedding modelinin ONNX (isteğe bağlı int8) sürümü: torch yüklemeden onnxruntime ile CPU'da çalışır.
+
+SentenceTransformer ilk kullanımda torch'u yükler (birkaç saniye, yüzlerce MB RSS) ve fp32
+çalışır. Model bir kez ONNX'e çevrilir, ardından EMBEDDING_BACKEND=onnx veya onnx-int8 ile
+sadece onnxruntime + tokenizers kullanılır. Vektörler mevcut (torch) vektörlerle uyumlu
+olmalı: dışa aktarım sonrası örnek metinlerde kosinüs benzerliği ölçülür, eşiğin altında
+kalan varyant kullanılmaz.
+
+Kullanım (torch + onnx + onnxruntime gerekir, sadece bir kez):
+  python -m app.rag.onnx_backend             # model.onnx + model_int8.onnx üret ve doğrula
+  python -m app.rag.onnx_backend --no-int8   # sadece fp32 ONNX
+Karşılaştırma: python -m app.rag.embedding_bench
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+ONNX_SUBDIR = "onnx"
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+VERIFY_FILE = "verify.json"
+
+# Torch vektörleriyle en düşük kosinüs benzerliği (örnek metinlerin en kötüsü)
+COSINE_TOLERANCE = {"onnx": 0.999, "onnx-int8": 0.97}
+
+# Doğrulama metinleri: kısa/uzun, TR/EN, kod ve numara içeren tipik mail içerikleri
+SAMPLE_TEXTS = [
+    "Toplantı yarın saat 14:00'te yapılacak, lütfen sunumu hazırlayın.",
+    "Fatura INV-2024-001 ödemesi gecikti, hatırlatma gönderebilir misiniz?",
+    "Could you send me the updated contract by Friday?",
+    "Sipariş numaranız 458921 kargoya verildi.",
+    "Merhaba, geçen haftaki görüşmemizle ilgili teklif dosyasını ekte bulabilirsiniz.",
+    "The server returned error 503 during the deployment last night.",
+    "İzin talebim 12-16 Ağustos tarihleri için onay bekliyor.",
+    "Thanks for your quick reply, we will proceed with option B.",
+    "Şifre sıfırlama bağlantınız 24 saat geçerlidir.",
+    "Quarterly report attached. Revenue grew 12% compared to Q2.",
+    "Yeni ürün lansmanı için pazarlama bütçesini gözden geçirmemiz gerekiyor. "
+    "Ekteki tabloda kanal bazında harcamalar ve geçen yılın sonuçları var. " * 12,
+    "ok",
+]
+
+
+def onnx_path(model_path: str, variant: str) -> str:
+    return os.path.join(model_path, ONNX_SUBDIR, ONNX_FILES[variant])
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_verification(model_path: str, variant: str) -> dict:
+    """Dışa aktarımda yazılan doğrulama sonucu ({} -> hiç doğrulanmamış)."""
+    return _read_json(os.path.join(model_path, ONNX_SUBDIR, VERIFY_FILE)).get(variant, {})
+
+
+class OnnxEmbedder:
+    """
+    SentenceTransformer.encode ile aynı arayüz (models/embedding_model'in ONNX sürümü).
+    Tokenizer: tokenizer.json (tokenizers), havuzlama: 1_Pooling/config.json (mean/cls).
+    """
+
+    def __init__(self, model_path: str, variant: str = "onnx"):
+        import onnxruntime as ort  # lazy: sadece ONNX backend seçilirse
+        from tokenizers import Tokenizer
+
+        path = onnx_path(model_path, variant)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"ONNX modeli bulunamadı: {path}\n"
+                "Önce 'python -m app.rag.onnx_backend' ile dışa aktarın."
+            )
+
+        max_len = _read_json(os.path.join(model_path, "sentence_bert_config.json")).get("max_seq_length", 256)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_len)
+        self.tokenizer.enable_padding()
+        pooling = _read_json(os.path.join(model_path, "1_Pooling", "config.json"))
+        self.cls_pooling = bool(pooling.get("pooling_mode_cls_token"))
+
+        options = ort.SessionOptions()
+        threads = int(os.getenv("EMBED_ONNX_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.variant = variant
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feed["token_type_ids"] = np.array([e.type_ids for e in encoded], dtype=np.int64)
+        hidden = self.session.run(None, feed)[0]  # (batch, seq, dim)
+
+        if self.cls_pooling:
+            return hidden[:, 0]
+        # Mean pooling (padding hariç)
+        weights = mask[..., None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = False,
+               show_progress_bar: bool = False) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        # Benzer uzunluktaki metinler aynı batch'e: padding az olur
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = np.zeros((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            vectors = self._encode_batch([texts[i] for i in idx]).astype(np.float32)
+            if out.shape[1] == 0:
+                out = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[idx] = vectors
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+
+# --- Dışa aktarım ve doğrulama (torch gerekir) ---
+def export_onnx(model_path: str, int8: bool = True) -> list:
+    """Transformer gövdesini ONNX'e çevirir, istenirse int8 (dinamik) kuantize eder."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir = os.path.join(model_path, ONNX_SUBDIR)
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path).eval()
+
+    sample = tokenizer(["Merhaba dünya", "Hello world, this is a test"], padding=True, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "sequence"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = onnx_path(model_path, "onnx")
+    print(f"📦 ONNX'e aktarılıyor: {fp32_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[n] for n in names), fp32_path,
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes=axes, opset_version=14, do_constant_folding=True
+        )
+    variants = ["onnx"]
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = onnx_path(model_path, "onnx-int8")
+        print(f"📦 int8 kuantizasyon: {int8_path}")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        variants.append("onnx-int8")
+    return variants
+
+
+def cosine_report(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Satır satır kosinüs benzerliği (iki taraf da normalize varsayılmaz)."""
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cos = (ref * cand).sum(axis=1)
+    return {"min_cosine": round(float(cos.min()), 6), "mean_cosine": round(float(cos.mean()), 6)}
+
+
+def verify(model_path: str, variants: list, texts: list = SAMPLE_TEXTS) -> dict:
+    """ONNX varyantlarını torch çıktısıyla karşılaştırır, sonucu verify.json'a yazar."""
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_path).encode(texts, normalize_embeddings=True)
+    results = _read_json(os.path.join(model_path, ONNX_SUBDIR, VERIFY_FILE))
+    for variant in variants:
+        report = cosine_report(reference, OnnxEmbedder(model_path, variant).encode(texts, normalize_embeddings=True))
+        report["tolerance"] = COSINE_TOLERANCE[variant]
+        report["passed"] = report["min_cosine"] >= COSINE_TOLERANCE[variant]
+        report["texts"] = len(texts)
+        results[variant] = report
+        icon = "✅" if report["passed"] else "❌"
+        print(f"{icon} {variant}: min cos {report['min_cosine']}, ort. {report['mean_cosine']} "
+              f"(eşik {report['tolerance']})")
+
+    with open(os.path.join(model_path, ONNX_SUBDIR, VERIFY_FILE), "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+def main():
+    from app.rag.embeddings import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Embedding modelini ONNX'e aktarır ve doğrular.")
+    parser.add_argument("--no-int8", action="store_true", help="int8 kuantize sürümü üretme")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    variants = export_onnx(args.model_path, int8=not args.no_int8)
+    results = verify(args.model_path, variants)
+    if not all(results[v]["passed"] for v in variants):
+        print("⚠️ Eşiği geçemeyen varyant EMBEDDING_BACKEND olarak seçilirse torch kullanılır.")
+    else:
+        print("ℹ️ .env içine EMBEDDING_BACKEND=onnx veya EMBEDDING_BACKEND=onnx-int8 yazarak etkinleştirin.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Eksik veya bayat mail vektörlerini arka planda (yeniden) üretir.
+
+Vektörü hiç oluşmamış mailler (EMBEDDINGS_ENABLED=0, model klasörü yok, encode hatası)
+ve başka bir modelle üretilmiş vektörler (download_model.py'de model/sürüm değişti)
+bulunur, partiler halinde vektörlenip kaydedilir.
+
+- Kaldığı yerden devam eder: her partiden sonra son mail _id'si reembed_state'e yazılır
+  (model etiketi başına tek kayıt). Yarıda kesilen iş tekrar başlatılınca oradan sürer.
+- Canlı mail alımını aç bırakmaz: metinler embedding batch boyutunda dilimlenir, kuyrukta
+  canlı istek varken beklenir, partiler arasında REEMBED_PAUSE_MS kadar durulur.
+
+Kullanım:
+  python -m app.rag.reembed              # eksik/bayat vektörleri üret (kaldığı yerden)
+  python -m app.rag.reembed --reset      # checkpoint'i sil, baştan tara
+  python -m app.rag.reembed --force      # güncel olanlar dahil hepsini yeniden üret
+  Sunucu çalışırken: POST /ui/admin/reembed (durum: GET /ui/admin/reembed)
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+
+# Veritabanı Bağlantıları
+from app.database import mails_col, mail_vectors_col, reembed_state_col
+from app.rag.vector_store import VECTOR_STORAGE, mail_texts, save_mail_vectors
+from app.rag.search_cache import invalidate_results
+from app.utils.body_clean import clean_body
+
+# Embedding motoru
+try:
+    from app.rag.embeddings import get_embeddings, get_model_tag, get_embedding_stats, EMBED_BATCH_SIZE
+except ImportError:
+    get_embeddings = None
+
+# Parti başına mail sayısı (checkpoint bu aralıkla yazılır)
+REEMBED_BATCH = max(1, int(os.getenv("REEMBED_BATCH", "32")))
+# Partiler arası bekleme: canlı alım ve arama için CPU bırakılır
+REEMBED_PAUSE_MS = float(os.getenv("REEMBED_PAUSE_MS", "250"))
+# Embedding kuyruğunda canlı istek varken en fazla bu kadar beklenir (sn), sonra devam edilir
+REEMBED_MAX_YIELD = float(os.getenv("REEMBED_MAX_YIELD", "5"))
+
+# Vektörlenmeyen kayıtlar (kullanıcının kendi taslakları)
+_EXCLUDED_STATUSES = ["DRAFT"]
+
+_lock = threading.Lock()
+_thread = None
+_stop_event = threading.Event()
+
+
+def _yield_to_live():
+    """Embedding kuyruğunda bekleyen (canlı) istek varsa onların işlenmesini bekler."""
+    deadline = time.monotonic() + REEMBED_MAX_YIELD
+    while get_embedding_stats().get("queued", 0) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _embed_throttled(texts: list) -> list:
+    """Metinleri batch boyutunda dilimleyerek vektörler; dilimler arasında canlı isteklere yol verir."""
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        _yield_to_live()
+        vectors.extend(get_embeddings(texts[start:start + EMBED_BATCH_SIZE]))
+    return vectors
+
+
+def _fresh_ids(batch: list, model: str) -> set:
+    """Partide vektörü aktif modelle üretilmiş olan mailler."""
+    if VECTOR_STORAGE == "inline":
+        return {m["_id"] for m in batch if m.get("embedding") and m.get("embedding_model") == model}
+    ids = [m["_id"] for m in batch]
+    return {d["_id"] for d in mail_vectors_col.find({"_id": {"$in": ids}, "model": model}, {"_id": 1})}
+
+
+def _process_batch(batch: list, model: str, force: bool, update_local: bool) -> dict:
+    """return: {"embedded", "skipped", "failed", "empty"} sayıları"""
+    counts = {"embedded": 0, "skipped": 0, "failed": 0, "empty": 0}
+    fresh = set() if force else _fresh_ids(batch, model)
+
+    todo, texts = [], []
+    for m in batch:
+        if m["_id"] in fresh:
+            counts["skipped"] += 1
+            continue
+        if m.get("body_clean") is None:
+            m["body_clean"] = clean_body(m.get("body", ""), m.get("body_html", ""))
+            mails_col.update_one({"_id": m["_id"]}, {"$set": {"body_clean": m["body_clean"]}})
+        mail_chunks = mail_texts(m.get("subject", ""), m["body_clean"])
+        if not mail_chunks[0]:
+            counts["empty"] += 1
+            continue
+        todo.append((m, len(texts), len(mail_chunks)))
+        texts.extend(mail_chunks)
+
+    # Partideki tüm maillerin parçaları birlikte vektörlenir (toplu encode)
+    vectors = _embed_throttled(texts) if texts else []
+    for m, start, size in todo:
+        mail_vectors = vectors[start:start + size]
+        if not mail_vectors or not mail_vectors[0]:
+            counts["failed"] += 1
+            continue
+        save_mail_vectors(m["_id"], mail_vectors, user_email=m.get("user_email", ""), update_local=update_local)
+        counts["embedded"] += 1
+    return counts
+
+
+def _save_state(model: str, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    reembed_state_col.update_one({"_id": model}, {"$set": fields}, upsert=True)
+
+
+def run_reembed(force: bool = False, reset: bool = False, batch_size: int = REEMBED_BATCH,
+                update_local: bool = True) -> dict:
+    """
+    Yeniden vektörleme işini bu thread'de çalıştırır (bitene veya durdurulana kadar).
+    update_local=False: ayrı süreçte (CLI) çalışırken yerel indekse dokunma.
+    return: son durum kaydı
+    """
+    if get_embeddings is None:
+        raise RuntimeError("Embedding modülü yüklenemedi (sentence-transformers kurulu mu?)")
+    if not get_embedding_stats().get("enabled"):
+        raise RuntimeError("Embeddings kapalı (EMBEDDINGS_ENABLED=1 olmalı).")
+
+    model = get_model_tag()
+    state = None if reset else reembed_state_col.find_one({"_id": model})
+    # Bitmiş iş tekrar başlatılırsa yeni tur: baştan taranır
+    if state and state.get("status") == "DONE":
+        state = None
+    if state:
+        state.pop("_id")
+        force = state["force"] = force or state.get("force", False)
+        print(f"♻️ Yeniden vektörleme kaldığı yerden sürüyor ({model}, {state.get('scanned', 0)} mail taranmıştı)")
+    else:
+        state = {"last_id": None, "scanned": 0, "embedded": 0, "skipped": 0, "failed": 0, "empty": 0,
+                 "started_at": datetime.utcnow(), "force": force}
+        print(f"🔄 Yeniden vektörleme başladı (model: {model}, force: {force})")
+
+    query = {"status": {"$nin": _EXCLUDED_STATUSES}}
+    if state["last_id"] is not None:
+        query["_id"] = {"$gt": state["last_id"]}
+    total = state["scanned"] + mails_col.count_documents(query)
+    _save_state(model, **dict(state, status="RUNNING", total=total, finished_at=None, last_error=None))
+
+    projection = {"subject": 1, "body": 1, "body_html": 1, "body_clean": 1, "user_email": 1}
+    if VECTOR_STORAGE == "inline":
+        projection.update({"embedding": {"$slice": 1}, "embedding_model": 1})
+
+    run_start = time.monotonic()
+    run_embedded = 0
+    status = "DONE"
+    try:
+        while not _stop_event.is_set():
+            batch = list(mails_col.find(query, projection).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+
+            counts = _process_batch(batch, model, force, update_local)
+            # Model yüklenemiyor: hiçbiri üretilemediyse boşuna tüm kutuyu tarama
+            if counts["failed"] and not counts["embedded"] and not run_embedded:
+                raise RuntimeError("Vektör üretilemedi (model klasörü / EMBEDDINGS_ENABLED kontrol edin).")
+
+            state["last_id"] = batch[-1]["_id"]
+            query["_id"] = {"$gt": state["last_id"]}
+            state["scanned"] += len(batch)
+            for key, value in counts.items():
+                state[key] += value
+            run_embedded += counts["embedded"]
+            if counts["embedded"]:
+                invalidate_results()
+
+            elapsed = time.monotonic() - run_start
+            rate = run_embedded / elapsed if elapsed else 0.0
+            _save_state(model, **dict(state, status="RUNNING", mails_per_sec=round(rate, 2)))
+            print(f"   ↪ {state['scanned']}/{total} tarandı, {state['embedded']} vektörlendi "
+                  f"({rate:.1f} mail/sn)")
+
+            time.sleep(REEMBED_PAUSE_MS / 1000)
+        if _stop_event.is_set():
+            status = "STOPPED"
+    except Exception as e:
+        _save_state(model, status="FAILED", last_error=str(e))
+        print(f"❌ Yeniden vektörleme durdu: {e}")
+        raise
+    except KeyboardInterrupt:
+        status = "STOPPED"
+
+    fields = {"status": status}
+    if status == "DONE":
+        fields["finished_at"] = datetime.utcnow()
+    _save_state(model, **fields)
+    print(f"✅ Yeniden vektörleme {'bitti' if status == 'DONE' else 'durduruldu'}: "
+          f"{state['embedded']} vektörlendi, {state['skipped']} güncel, {state['failed']} hata "
+          f"({time.monotonic() - run_start:.1f} sn)")
+    return get_reembed_status()
+
+
+def _run_in_background(force: bool, reset: bool):
+    try:
+        run_reembed(force=force, reset=reset)
+    except Exception:
+        pass  # Durum kaydına FAILED olarak yazıldı
+
+
+def start_reembed(force: bool = False, reset: bool = False) -> bool:
+    """İşi arka plan thread'inde başlatır. Zaten çalışıyorsa False döner."""
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        _stop_event.clear()
+        _thread = threading.Thread(
+            target=_run_in_background, args=(force, reset), daemon=True, name="reembed"
+        )
+        _thread.start()
+    return True
+
+
+def stop_reembed():
+    """Çalışan işi mevcut parti bitince durdurur (checkpoint korunur)."""
+    _stop_event.set()
+
+
+def get_reembed_status() -> dict:
+    """Aktif model için checkpoint/ilerleme kaydı (admin ve /health için)."""
+    model = get_model_tag() if get_embeddings is not None else ""
+    state = reembed_state_col.find_one({"_id": model}) or {"status": "IDLE"}
+    state["model"] = state.pop("_id", model)
+    state["last_id"] = str(state["last_id"]) if state.get("last_id") else None
+    state["running"] = _thread is not None and _thread.is_alive()
+    if state.get("total"):
+        state["progress"] = round(state.get("scanned", 0) / state["total"], 4)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eksik/bayat mail vektörlerini yeniden üretir.")
+    parser.add_argument("--force", action="store_true", help="Güncel vektörleri de yeniden üret")
+    parser.add_argument("--reset", action="store_true", help="Checkpoint'i yok say, baştan tara")
+    parser.add_argument("--batch", type=int, default=REEMBED_BATCH)
+    args = parser.parse_args()
+
+    # Sunucunun yerel indeksi yeni vektörleri bakım turunda Mongo'dan çeker
+    run_reembed(force=args.force, reset=args.reset, batch_size=args.batch, update_local=False)
+
+
+if __name__ == "__main__":
+    main()
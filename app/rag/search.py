@@ -0,0 +1,208 @@
+import re
+import time
+from datetime import datetime, timedelta
+
+# Veritabanı Bağlantıları
+from app.database import mails_col
+from app.rag.vector_store import vector_search
+from app.rag import search_cache
+
+# Semantik Arama İçin Vektör Motoru
+try:
+    from app.rag.embeddings import get_embedding
+except ImportError:
+    def get_embedding(text): return []
+
+# --- HİBRİT ARAMA (Kelime + Anlam, Reciprocal Rank Fusion) ---
+# MiniLM fatura numarası, isim, hata kodu gibi birebir ifadeleri zayıf sıralar; Mongo text
+# indeksi ise anlamı kaçırır. İki listenin sıraları RRF ile birleştirilir:
+#   skor(mail) = Σ 1 / (RRF_K + sıra)
+RRF_K = 60
+# Her aşamadan alınacak aday sayısı (sayfalama bu birleşik liste üzerinden yapılır)
+CANDIDATES = 200
+# Filtre verilince vektör araması bu kadar mail id'si ile önceden daraltılır;
+# daha fazla eşleşme varsa filtre aday havuzuna sonradan uygulanır
+PREFILTER_MAX_IDS = 50000
+MAX_PAGE_SIZE = 50
+
+# Arama dışında tutulan kayıtlar (kullanıcının kendi taslakları)
+_EXCLUDED_STATUSES = ["DRAFT"]
+
+
+def build_filter(account_id: str = None, status: str = None, tag: str = None,
+                 date_from: str = None, date_to: str = None) -> dict:
+    """UI filtrelerini Mongo sorgusuna çevirir. Tarihler YYYY-MM-DD (date_to dahil)."""
+    query = {"status": {"$nin": _EXCLUDED_STATUSES}}
+    if account_id:
+        query["account_id"] = account_id
+    if status:
+        query["status"] = status
+    if tag:
+        query["tags"] = tag
+    created = {}
+    if date_from:
+        created["$gte"] = datetime.strptime(date_from, "%Y-%m-%d")
+    if date_to:
+        created["$lt"] = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)
+    if created:
+        query["created_at"] = created
+    return query
+
+
+def _lexical_stage(q: str, query: dict) -> list:
+    """Mongo text indeksi ($text) -> [mail_id, ...] (alaka sırasına göre)"""
+    # Rakam/tire içeren birebir ifadeler (INV-2024-001) ayrıca tam ifade olarak aranır
+    exact = [t for t in re.findall(r"\S+", q) if re.search(r"\d|[-_/#.]", t)]
+    search = q + "".join(f' "{t}"' for t in exact[:1])
+    cursor = mails_col.find(
+        dict(query, **{"$text": {"$search": search}}),
+        {"_id": 1, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(CANDIDATES)
+    ids = [doc["_id"] for doc in cursor]
+
+    # Tam ifade şartı sonuç bırakmadıysa ifadesiz tekrar dene
+    if not ids and exact:
+        cursor = mails_col.find(
+            dict(query, **{"$text": {"$search": q}}),
+            {"_id": 1, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).limit(CANDIDATES)
+        ids = [doc["_id"] for doc in cursor]
+    return ids
+
+
+def _vector_stage(query_vector: list, query: dict, filtered: bool) -> list:
+    """Vektör araması -> [mail_id, ...]. Filtre varsa aday id'leri önceden daraltılır."""
+    allowed = None
+    if filtered:
+        allowed = [d["_id"] for d in mails_col.find(query, {"_id": 1}).limit(PREFILTER_MAX_IDS + 1)]
+        if not allowed:
+            return []
+        if len(allowed) > PREFILTER_MAX_IDS:
+            allowed = None
+
+    hits = vector_search(query_vector, limit=CANDIDATES, num_candidates=CANDIDATES * 5, allowed_ids=allowed)
+    ids = [mail_id for mail_id, _ in hits]
+    if allowed is None and filtered and ids:
+        # Çok geniş filtre: aday havuzuna uygula
+        matching = {d["_id"] for d in mails_col.find(dict(query, _id={"$in": ids}), {"_id": 1})}
+        ids = [mail_id for mail_id in ids if mail_id in matching]
+    return ids
+
+
+def _fuse(*rankings) -> list:
+    """Reciprocal Rank Fusion -> [(mail_id, skor, {aşama: sıra}), ...] (azalan)"""
+    scores, ranks = {}, {}
+    for name, ids in rankings:
+        for rank, mail_id in enumerate(ids, start=1):
+            scores[mail_id] = scores.get(mail_id, 0.0) + 1.0 / (RRF_K + rank)
+            ranks.setdefault(mail_id, {})[name] = rank
+    fused = sorted(scores, key=lambda mid: scores[mid], reverse=True)
+    return [(mail_id, scores[mail_id], ranks[mail_id]) for mail_id in fused]
+
+
+def _query_vector(q: str) -> list:
+    """Sorgu vektörü (aynı sorgu tekrar vektörlenmez)."""
+    key = search_cache.normalize_query(q)
+    vector = search_cache.query_vectors.get(key)
+    if vector is None:
+        vector = get_embedding(q)
+        if vector:
+            search_cache.query_vectors.put(key, vector)
+    return vector
+
+
+def _ms(start: float) -> float:
+    return round((time.monotonic() - start) * 1000, 1)
+
+
+def hybrid_search(q: str, page: int = 1, page_size: int = 10, **filters) -> dict:
+    """
+    Kelime + anlam araması. Filtreler (account_id, status, tag, date_from, date_to)
+    puanlamadan ÖNCE uygulanır.
+    return: {"results", "page", "page_size", "total", "has_more", "timings", "cached"}
+    """
+    total_start = time.monotonic()
+    page = max(1, page)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    query = build_filter(**filters)
+
+    # Aynı arama kısa süre önce yapıldıysa (ve arada yeni mail gelmediyse) doğrudan dön
+    cache_key = search_cache.result_key(q, page, page_size, filters)
+    cached = search_cache.get_result(cache_key)
+    if cached is not None:
+        return dict(cached, cached=True, timings={"total_ms": _ms(total_start)})
+    generation = search_cache.current_generation()
+
+    timings = {}
+    degraded = False
+
+    start = time.monotonic()
+    try:
+        lexical = _lexical_stage(q, query)
+    except Exception as e:
+        # Text indeksi henüz yok / kurulamadı: sadece anlamsal arama
+        print(f"⚠️ Kelime araması yapılamadı: {e}")
+        lexical = []
+        degraded = True
+    timings["lexical_ms"] = _ms(start)
+
+    start = time.monotonic()
+    query_vector = _query_vector(q)
+    timings["embedding_ms"] = _ms(start)
+
+    start = time.monotonic()
+    semantic = []
+    if query_vector:
+        try:
+            semantic = _vector_stage(query_vector, query, filtered=any(filters.values()))
+        except Exception as e:
+            print(f"⚠️ Anlamsal arama yapılamadı: {e}")
+            degraded = True
+    timings["vector_ms"] = _ms(start)
+
+    start = time.monotonic()
+    fused = _fuse(("lexical", lexical), ("vector", semantic))
+    page_items = fused[(page - 1) * page_size: page * page_size]
+    timings["fusion_ms"] = _ms(start)
+
+    start = time.monotonic()
+    mails = {m["_id"]: m for m in mails_col.find(
+        {"_id": {"$in": [mail_id for mail_id, _, _ in page_items]}},
+        {"subject": 1, "from": 1, "body_clean": 1, "body": 1, "created_at": 1, "status": 1, "tags": 1}
+    )}
+    timings["fetch_ms"] = _ms(start)
+
+    # Her iki listede de 1. olan mail = 1.0 (UI yüzde olarak gösterir)
+    best = 2.0 / (RRF_K + 1)
+    results = []
+    for mail_id, score, ranks in page_items:
+        m = mails.get(mail_id)
+        if not m:
+            continue  # Mail silinmiş, vektörü/indeksi kalmış
+        created_at = m.get("created_at")
+        results.append({
+            "_id": str(mail_id),
+            "subject": m.get("subject"),
+            "sender": m.get("from"),
+            "snippet": (m.get("body_clean") or m.get("body") or "")[:150],
+            "date": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+            "status": m.get("status"),
+            "tags": m.get("tags", []),
+            "score": round(score / best, 3),
+            "ranks": ranks,
+        })
+
+    timings["total_ms"] = _ms(total_start)
+    response = {
+        "results": results,
+        "page": page,
+        "page_size": page_size,
+        "total": len(fused),
+        "has_more": page * page_size < len(fused),
+        "timings": timings,
+        "cached": False,
+    }
+    # Bir ayağı hata veren (eksik) sonuç önbelleğe alınmaz
+    if not degraded:
+        search_cache.store_result(cache_key, generation, response)
+    return response
@@ -0,0 +1,115 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# --- ARAMA ÖNBELLEĞİ ---
+# Kullanıcılar gün içinde aynı birkaç aramayı tekrarlar; her tuşta /ui/search-api sorgu
+# vektörünü yeniden üretir ve tam vektör araması yapar.
+#   1) Sorgu vektörü LRU: normalize sorgu metni -> vektör (model değişmedikçe geçerli)
+#   2) Sonuç önbelleği: (sorgu, filtreler, sayfa) -> cevap, kısa TTL. Parti başına bir kez
+#      (yeni mail partisi, analiz kuyruğu boşalınca, yeniden vektörleme partisi, mail silme)
+#      nesil (generation) artar, eski sonuçlar geçersiz olur. Arada kalan değişiklikleri TTL sınırlar.
+QUERY_CACHE_SIZE = int(os.getenv("SEARCH_QUERY_CACHE_SIZE", "512"))
+RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("SEARCH_RESULT_CACHE_TTL", "30"))
+
+
+class LRUCache:
+    """Thread-safe LRU (isteğe bağlı TTL). Kapasite 0 -> önbellek kapalı."""
+
+    def __init__(self, max_entries: int, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0, "expired": 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and self.ttl is not None and entry[0] < time.monotonic():
+                del self.data[key]
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.data[key] = (expires, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats, size=len(self.data), max_entries=self.max_entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+        return stats
+
+
+query_vectors = LRUCache(QUERY_CACHE_SIZE)
+results = LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+
+_generation = 0
+_invalidations = 0
+_gen_lock = threading.Lock()
+
+
+def normalize_query(q: str) -> str:
+    """Büyük/küçük harf ve boşluk farkları aynı sorgu sayılır (MiniLM ve $text harf duyarsız)."""
+    return re.sub(r"\s+", " ", (q or "").strip().lower())
+
+
+def current_generation() -> int:
+    return _generation
+
+
+def invalidate_results():
+    """Yeni mail / vektör yazıldı veya mail silindi: önbellekteki sonuçlar eskidi."""
+    global _generation, _invalidations
+    with _gen_lock:
+        _generation += 1
+        _invalidations += 1
+    results.clear()
+
+
+def result_key(q: str, page: int, page_size: int, filters: dict) -> tuple:
+    return (normalize_query(q), page, page_size, tuple(sorted((k, v) for k, v in filters.items() if v)))
+
+
+def get_result(key: tuple):
+    entry = results.get(key)
+    # Arama sürerken yeni mail geldiyse o cevap eski nesle aittir
+    if entry is None or entry[0] != _generation:
+        return None
+    return entry[1]
+
+
+def store_result(key: tuple, generation: int, value: dict):
+    """generation: arama BAŞLARKEN okunan nesil (arada geçersiz kılındıysa kaydedilmez)."""
+    if generation == _generation:
+        results.put(key, (generation, value))
+
+
+def get_search_cache_stats() -> dict:
+    """İsabet oranları (/health için)."""
+    return {
+        "query_vectors": query_vectors.get_stats(),
+        "results": dict(results.get_stats(), ttl_s=RESULT_CACHE_TTL, invalidations=_invalidations),
+    }
@@ -0,0 +1,254 @@
+import os
+import struct
+from datetime import datetime
+
+from bson import ObjectId
+from bson.binary import Binary, BinaryVectorDtype
+from pymongo.errors import OperationFailure
+
+# Veritabanı Bağlantıları
+from app.database import mails_col, mail_vectors_col, mail_chunks_col
+from app.utils.body_clean import chunk_text
+
+# Embedding motoru (toplu encode)
+try:
+    from app.rag.embeddings import get_embeddings, get_model_tag
+except ImportError:
+    def get_embeddings(texts): return [[] for _ in texts]
+    def get_model_tag(): return ""
+
+# --- KOMPAKT VEKTÖR SAKLAMA ---
+# 384 double'lık BSON dizisi mail başına ~3.4 KB tutar ve her projeksiyonsuz find() ile
+# UI'a taşınır. Vektörler mails yerine "mail_vectors" yan koleksiyonunda paketlenmiş
+# binary olarak saklanır:
+#   float32 -> BSON vector (binData subtype 9), Atlas $vectorSearch doğrudan arayabilir (1.5 KB)
+#   float16 -> ham little-endian binary (768 B); Atlas arayamaz, arama uygulama içinde yapılır
+#   inline  -> eski davranış: mails.embedding dizisi
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32").strip().lower()
+if VECTOR_STORAGE not in ("float32", "float16", "inline"):
+    print(f"⚠️ Geçersiz VECTOR_STORAGE={VECTOR_STORAGE}, float32 kullanılıyor.")
+    VECTOR_STORAGE = "float32"
+
+# Arama motoru: "atlas" -> sadece $vectorSearch, "local" -> sadece yerel NumPy indeksi,
+# "auto" -> Atlas, kullanılamazsa (Community Edition) yerel indeks
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "auto").strip().lower()
+
+# Yerel indeks (NumPy yoksa devre dışı)
+try:
+    from app.rag.local_index import local_index
+except ImportError:
+    local_index = None
+
+_atlas_unavailable = False
+
+def local_index_enabled() -> bool:
+    return local_index is not None and VECTOR_INDEX != "atlas"
+
+# Atlas indeksleri (database.init_db oluşturur)
+LEGACY_INDEX = "vector_index"       # mails.embedding
+SIDE_INDEX = "mail_vector_index"    # mail_vectors.vector
+CHUNK_INDEX = "mail_chunk_index"    # mail_chunks.vector
+
+
+def pack_vector(vector: list, dtype: str = VECTOR_STORAGE) -> Binary:
+    """list[float] -> paketlenmiş BSON binary"""
+    if dtype == "float16":
+        return Binary(struct.pack(f"<{len(vector)}e", *vector))
+    return Binary.from_vector([float(x) for x in vector], BinaryVectorDtype.FLOAT32)
+
+
+def unpack_vector(data, dtype: str) -> list:
+    """Paketlenmiş binary (veya eski dizi) -> list[float]"""
+    if data is None:
+        return []
+    if isinstance(data, list):
+        return data
+    if dtype == "float16":
+        raw = bytes(data)
+        return list(struct.unpack(f"<{len(raw) // 2}e", raw))
+    # pymongo subtype 9 (vector) alanlarını Binary olarak döner
+    return list(data.as_vector().data)
+
+
+def vector_doc(mail_id, vector: list, user_email: str = "", dtype: str = VECTOR_STORAGE, model: str = None) -> dict:
+    """model: vektörü üreten modelin etiketi (None -> aktif model)"""
+    return {
+        "_id": mail_id,
+        "vector": pack_vector(vector, dtype),
+        "dtype": dtype,
+        "dim": len(vector),
+        "model": get_model_tag() if model is None else model,
+        "user_email": user_email,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def save_vector(mail_id, vector: list, user_email: str = "", update_local: bool = True):
+    """
+    Mail vektörünü seçili saklama biçimine göre yazar.
+    Boş vektör (embedding kapalı / hata) yazılmaz.
+    update_local=False: yerel indekse dokunma (ayrı süreçte çalışan komutlar; sunucu
+    indeksi değişiklikleri bakım turunda Mongo'dan çeker).
+    """
+    if not vector:
+        return
+    if VECTOR_STORAGE == "inline":
+        mails_col.update_one({"_id": mail_id}, {"$set": {"embedding": vector, "embedding_model": get_model_tag()}})
+    else:
+        mail_vectors_col.replace_one({"_id": mail_id}, vector_doc(mail_id, vector, user_email), upsert=True)
+    if update_local and local_index_enabled():
+        local_index.add(mail_id, vector)
+
+
+def chunk_key(mail_id, n: int) -> str:
+    return f"{mail_id}#{n}"
+
+
+def mail_texts(subject: str, body_clean: str) -> list:
+    """Vektörlenecek metinler: [konu + ilk parça, parça2, ...] (uzun gövde örtüşen parçalara bölünür)"""
+    chunks = chunk_text(body_clean) or [""]
+    return [f"{subject} {chunks[0]}".strip()] + chunks[1:]
+
+
+def embed_mail(subject: str, body_clean: str) -> list:
+    """
+    Mailin vektörlerini üretir. Tüm parçalar TEK toplu encode çağrısında işlenir.
+    return: [ana_vektör, parça1, parça2, ...] (embedding kapalıysa [[]])
+    """
+    return get_embeddings(mail_texts(subject, body_clean))
+
+
+def save_mail_vectors(mail_id, vectors: list, user_email: str = "", update_local: bool = True):
+    """Ana vektörü ve (varsa) ek parça vektörlerini yazar."""
+    if not vectors:
+        return
+    save_vector(mail_id, vectors[0], user_email=user_email, update_local=update_local)
+    save_chunk_vectors(mail_id, [v for v in vectors[1:] if v], user_email=user_email, update_local=update_local)
+
+
+def save_chunk_vectors(mail_id, vectors: list, user_email: str = "", update_local: bool = True):
+    """
+    Ek parça vektörlerini mail_chunks'a yazar. Eski parçalar silinir
+    (mail yeniden analiz edilmiş, parça sayısı değişmiş olabilir).
+    inline saklamada parça vektörü tutulmaz (eski tek vektör davranışı).
+    """
+    old_keys = [d["_id"] for d in mail_chunks_col.find({"mail_id": mail_id}, {"_id": 1})]
+    if old_keys:
+        mail_chunks_col.delete_many({"_id": {"$in": old_keys}})
+        if update_local and local_index_enabled():
+            local_index.remove(old_keys)
+    if not vectors or VECTOR_STORAGE == "inline":
+        return
+
+    docs = []
+    for n, vector in enumerate(vectors, start=1):
+        doc = vector_doc(chunk_key(mail_id, n), vector, user_email)
+        doc.update({"mail_id": mail_id, "chunk": n})
+        docs.append(doc)
+    mail_chunks_col.insert_many(docs)
+    if update_local and local_index_enabled():
+        for doc, vector in zip(docs, vectors):
+            local_index.add(doc["_id"], vector)
+
+
+def get_vector(mail_id) -> list:
+    """Tek mailin vektörü (yan koleksiyon, yoksa eski inline alan)."""
+    doc = mail_vectors_col.find_one({"_id": mail_id}, {"vector": 1, "dtype": 1})
+    if doc:
+        return unpack_vector(doc["vector"], doc.get("dtype", "float32"))
+    mail = mails_col.find_one({"_id": mail_id}, {"embedding": 1})
+    return (mail or {}).get("embedding") or []
+
+
+def _max_sim(hits, limit: int) -> list:
+    """Parça eşleşmelerini maile indirger: mailin skoru = en benzer parçasının skoru."""
+    best = {}
+    for mail_id, score in hits:
+        if score > best.get(mail_id, float("-inf")):
+            best[mail_id] = score
+    return sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def _local_search(query_vector: list, limit: int, allowed_ids=None) -> list:
+    if local_index is None:
+        return []
+    allowed = {str(mail_id) for mail_id in allowed_ids} if allowed_ids is not None else None
+    # Aynı mailin birden fazla parçası gelebilir: fazladan aday iste
+    hits = local_index.search(query_vector, k=limit * 3, allowed=allowed)
+    return _max_sim(((ObjectId(key.split("#", 1)[0]), score) for key, score in hits), limit)
+
+
+def vector_search(query_vector: list, limit: int = 10, num_candidates: int = 100, allowed_ids: list = None) -> list:
+    """
+    Anlamsal arama. return: [(mail_id, score), ...] (skora göre azalan)
+    allowed_ids: Verilirse sadece bu mailler puanlanır (filtre puanlamadan önce).
+    Atlas: $vectorSearch (yan koleksiyon), sonuç yoksa eski mails indeksi.
+    Yerel: models/ altındaki NumPy indeksi (Community Edition ve float16 saklama;
+           Atlas float16 vektörleri arayamaz).
+    """
+    global _atlas_unavailable
+    if VECTOR_INDEX == "local" or VECTOR_STORAGE == "float16" or _atlas_unavailable:
+        return _local_search(query_vector, limit, allowed_ids)
+
+    try:
+        return _atlas_search(query_vector, limit, num_candidates, allowed_ids)
+    except Exception as e:
+        if not local_index_enabled():
+            raise
+        # $vectorSearch yok (yerel MongoDB): bu süreç boyunca yerel indeksi kullan
+        _atlas_unavailable = True
+        print(f"ℹ️ Atlas vektör araması kullanılamadı, yerel indekse geçildi: {e}")
+        return _local_search(query_vector, limit, allowed_ids)
+
+
+def _run_vector_search(collection, index: str, path: str, stage: dict, allowed_ids, id_field: str = "_id") -> list:
+    """$vectorSearch -> [(mail_id, score), ...]. id_field: sonucu maile bağlayan alan."""
+    search = dict(stage, index=index, path=path)
+    if allowed_ids is not None:
+        search["filter"] = {id_field: {"$in": list(allowed_ids)}}
+    pipeline = [
+        {"$vectorSearch": search},
+        {"$project": {id_field: 1, "score": {"$meta": "vectorSearchScore"}}}
+    ]
+    try:
+        return [(d[id_field], d["score"]) for d in collection.aggregate(pipeline)]
+    except OperationFailure:
+        if allowed_ids is None:
+            raise
+        # İndeks mail id'sini filtre alanı olarak tanımlamıyor (eski indeks): geniş ara, sonra süz
+        allowed = set(allowed_ids)
+        wide = dict(stage, limit=stage["numCandidates"])
+        hits = _run_vector_search(collection, index, path, wide, None, id_field)
+        return [(mail_id, score) for mail_id, score in hits if mail_id in allowed][:stage["limit"]]
+
+
+def _atlas_search(query_vector: list, limit: int, num_candidates: int, allowed_ids=None) -> list:
+    stage = {"queryVector": query_vector, "numCandidates": max(num_candidates, limit), "limit": limit}
+    results = []
+    if VECTOR_STORAGE == "float32":
+        results = _run_vector_search(mail_vectors_col, SIDE_INDEX, "vector", stage, allowed_ids)
+        # Uzun maillerin ek parçaları (koleksiyon boşsa/indeks yoksa sadece ana vektörler)
+        if results and mail_chunks_col.estimated_document_count():
+            chunk_stage = dict(stage, limit=limit * 3, numCandidates=max(stage["numCandidates"], limit * 3))
+            try:
+                chunk_hits = _run_vector_search(
+                    mail_chunks_col, CHUNK_INDEX, "vector", chunk_stage, allowed_ids, id_field="mail_id"
+                )
+            except OperationFailure as e:
+                print(f"⚠️ Parça vektör araması yapılamadı: {e}")
+                chunk_hits = []
+            results = _max_sim(results + chunk_hits, limit)
+
+    # Henüz taşınmamış kayıtlar için eski indeks
+    if not results:
+        results = _run_vector_search(mails_col, LEGACY_INDEX, "embedding", stage, allowed_ids)
+    return results
+
+
+def delete_vectors(mail_ids: list):
+    """Silinen maillerin vektörlerini temizler."""
+    if mail_ids:
+        mail_vectors_col.delete_many({"_id": {"$in": list(mail_ids)}})
+        mail_chunks_col.delete_many({"mail_id": {"$in": list(mail_ids)}})
+        if local_index_enabled():
+            local_index.remove(mail_ids)
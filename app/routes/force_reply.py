@@ -2,6 +2,7 @@ from fastapi import APIRouter
 from bson import ObjectId
 from app.database import mails_col
 from app.services.reply_generator import generate_reply
+from app.utils.body_clean import body_for_task
 
 router = APIRouter()
 
@@ -13,7 +14,7 @@ def force_reply(mail_id: str):
     if not mail:
         return {"error": "MAIL_NOT_FOUND"}
 
-    reply = generate_reply(mail["body"], tone="formal")
+    reply = generate_reply(body_for_task(mail, "reply"), tone="formal")
 
     mails_col.update_one(
         {"_id": ObjectId(mail_id)},
@@ -9,6 +9,7 @@ from typing import Optional, List
 from fastapi import APIRouter, Request, Form, Depends, HTTPException, Body, Query
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv 
 from datetime import datetime
 from bson import ObjectId
@@ -18,14 +19,17 @@ from pydantic import BaseModel
 # Veritabanı ve Servisler
 from app.database import mails_col, contacts_col, tasks_col, users_col, accounts_col, tags_col
 from app.services.mail_sender import send_gmail_via_user
-from app.services.reply_generator import generate_reply, generate_decision_reply
+from app.services.reply_generator import (
+    generate_reply, generate_decision_reply, stream_reply, stream_decision_reply, clean_reply
+)
+from app.utils.body_clean import strip_quotes, body_for_task
 from app.core.security import encrypt_password, verify_master_password, hash_master_password, decrypt_password
 
-# --- YENİ EKLENEN: Semantik Arama Modülü ---
-try:
-    from app.rag.embeddings import get_embedding
-except ImportError:
-    def get_embedding(text): return []
+# --- Hibrit (Kelime + Semantik) Arama Modülü ---
+from app.rag.vector_store import delete_vectors
+from app.rag.search_cache import invalidate_results
+from app.rag.search import hybrid_search
+from app.rag.reembed import start_reembed, stop_reembed, get_reembed_status
 
 router = APIRouter()
 
@@ -93,30 +97,74 @@ def normalize_subject(subject):
         s = re.sub(clean_pattern, '', s)
     return s.strip()
 
-def clean_reply_body(body):
-    """Mail içeriğindeki alıntı satırlarını temizler."""
-    if not body: return ""
-    quote_patterns = [
-        r'On\s+.*,\s+.*at\s+.*wrote:', 
-        r'Le\s+.*à\s+.*a\s+écrit\s*:', 
-        r'El\s+.*,\s+.*escribió:',    
-        r'-----\s*Original Message\s*-----', 
-        r'From:\s*.*Sent:\s*.*To:\s*.*Subject:', 
-        r'________________________________',
+# --- GELEN KUTUSU LİSTESİ ---
+# Liste için gereken alanlar (body/body_html/vektör taşınmaz)
+INBOX_STATUSES = ["PENDING_ANALYSIS", "WAITING_APPROVAL", "REPLIED"]
+INBOX_FIELDS = {"subject": 1, "from": 1, "user_email": 1, "created_at": 1, "status": 1, "tags": 1, "is_read": 1}
+INBOX_PAGE_SIZE = int(os.getenv("INBOX_PAGE_SIZE", "50"))
+
+# normalize_subject'in Mongo karşılığı (subject_normalized alanı olmayan eski kayıtlar için)
+_THREAD_KEY = {"$ifNull": ["$subject_normalized", {"$let": {
+    "vars": {"m": {"$regexFind": {
+        "input": {"$toLower": {"$ifNull": ["$subject", ""]}},
+        "regex": r"^(?:\s*(?:re|fw|fwd)\s*:\s*)*(.*)$", "options": "s"
+    }}},
+    "in": {"$trim": {"input": {"$arrayElemAt": ["$$m.captures", 0]}}}
+}}]}
+
+def encode_cursor(mail: dict) -> Optional[str]:
+    """Sayfanın son grubundan sonraki sayfa için anahtar: "<created_at iso>_<mail id>" """
+    created_at = mail.get("created_at")
+    if not isinstance(created_at, datetime):
+        return None
+    return f"{created_at.isoformat()}_{mail['_id']}"
+
+def decode_cursor(cursor: Optional[str]):
+    """Geçersiz anahtar -> None (ilk sayfa)"""
+    try:
+        created_at, mail_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), ObjectId(mail_id)
+    except Exception:
+        return None
+
+def fetch_inbox_page(cursor: Optional[str] = None, limit: int = INBOX_PAGE_SIZE):
+    """
+    Bekleyen mailleri konuya göre gruplar (her konudan en yeni mail + thread_count) ve
+    created_at'e göre keyset sayfalama yapar.
+    return: (mails, next_cursor)  next_cursor: sonraki sayfa yoksa None
+    """
+    pipeline = [
+        {"$match": {"status": {"$in": INBOX_STATUSES}, "type": {"$ne": "outbound"}}},
+        {"$sort": {"created_at": -1, "_id": -1}},
+        {"$project": dict(INBOX_FIELDS, thread_key=_THREAD_KEY)},
+        {"$group": {"_id": "$thread_key", "head": {"$first": "$$ROOT"}, "thread_count": {"$sum": 1}}},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$head", {"thread_count": "$thread_count"}]}}},
     ]
-    lines = body.split('\n')
-    clean_lines = []
-    for line in lines:
-        is_quote_line = False
-        for pattern in quote_patterns:
-            if re.search(pattern, line, re.IGNORECASE):
-                is_quote_line = True
-                break
-        if is_quote_line: break 
-        clean_lines.append(line)
-    
-    cleaned_text = "\n".join(clean_lines).strip()
-    return cleaned_text if cleaned_text else body
+    # Anahtar gruplamadan SONRA uygulanır: önceki sayfadaki bir konunun eski mailleri tekrar grup olmaz
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, mail_id = position
+        pipeline.append({"$match": {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": mail_id}},
+        ]}})
+    pipeline += [
+        {"$sort": {"created_at": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {"thread_key": 0}},
+    ]
+
+    mails = list(mails_col.aggregate(pipeline, allowDiskUse=True))
+    next_cursor = encode_cursor(mails[limit - 1]) if len(mails) > limit else None
+    mails = mails[:limit]
+    for m in mails:
+        m["_id"] = str(m["_id"])
+        m.setdefault("is_read", False)
+    return mails, next_cursor
+
+def clean_reply_body(body):
+    """Mail içeriğindeki alıntı satırlarını temizler (body_clean ile aynı alıntı kalıpları)."""
+    return strip_quotes(body, drop_prefixed=False)
 
 def filter_thread_chain(candidates, target_id):
     """Sadece birbirine bağlı mailleri filtreler."""
@@ -386,50 +434,6 @@ def home_dashboard(request: Request):
     }
     urgent_tasks = list(tasks_col.find({"status": "CONFIRMED"}).sort([("urgency_score", -1), ("due_date", 1)]).limit(5))
     for t in urgent_tasks: t["_id"] = str(t["_id"])
-    
-    # --- GRUPLAMA MOTORU BAŞLANGIÇ ---
-    # 1. Bekleyen mailleri çek
-    raw_mails = list(mails_col.find({
-        "status": {"$in": ["WAITING_APPROVAL", "REPLIED"]},
-        "type": {"$ne": "outbound"}
-    }).sort("created_at", -1))
-    
-    # 2. Gruplama Mantığı
-    grouped_mails = {}
-    
-    for m in raw_mails:
-        # Konuyu normalize et
-        subj = m.get("subject_normalized")
-        if not subj:
-            subj = normalize_subject(m.get("subject", ""))
-            
-        if subj not in grouped_mails:
-            # İlk kez görülen konu
-            m["_id"] = str(m["_id"])
-            if "is_read" not in m: m["is_read"] = False
-            m["thread_count"] = 1
-            grouped_mails[subj] = m
-        else:
-            # Zaten var, sayacı artır
-            grouped_mails[subj]["thread_count"] += 1
-            
-            # En güncel maili göster
-            current_date = grouped_mails[subj].get("created_at")
-            new_date = m.get("created_at")
-            
-            if new_date and current_date and new_date > current_date:
-                m["_id"] = str(m["_id"])
-                m["thread_count"] = grouped_mails[subj]["thread_count"]
-                grouped_mails[subj] = m
-
-    # Listeye çevir ve sırala
-    final_mail_list = list(grouped_mails.values())
-    final_mail_list.sort(key=lambda x: x.get("created_at"), reverse=True)
-    # --- GRUPLAMA MOTORU BİTİŞ ---
-
-    # Etiketler
-    all_tags = list(tags_col.find({}))
-    tags_map = {t["slug"]: t for t in all_tags}
 
     return templates.TemplateResponse("home.html", {
         "request": request, 
@@ -462,46 +466,18 @@ async def delete_task(task_id: str):
     return RedirectResponse(url="/ui/tasks?msg=Silindi", status_code=303)
 
 @router.get("/ui", response_class=HTMLResponse)
-def inbox(request: Request):
+def inbox(request: Request, cursor: Optional[str] = None, limit: int = Query(INBOX_PAGE_SIZE, ge=1, le=200)):
     user = users_col.find_one({"is_active": True})
-    
-    # --- GRUPLAMA MOTORU (DASHBOARD İÇİN) ---
-    # 1. Bekleyen mailleri çek
-    raw_mails = list(mails_col.find({
-        "status": {"$in": ["WAITING_APPROVAL", "REPLIED"]},
-        "type": {"$ne": "outbound"}
-    }).sort("created_at", -1))
-    
-    # 2. Gruplama
-    grouped_mails = {}
-    
-    for m in raw_mails:
-        subj = m.get("subject_normalized")
-        if not subj:
-            subj = normalize_subject(m.get("subject", ""))
-            
-        if subj not in grouped_mails:
-            m["_id"] = str(m["_id"])
-            if "is_read" not in m: m["is_read"] = False
-            m["thread_count"] = 1
-            grouped_mails[subj] = m
-        else:
-            grouped_mails[subj]["thread_count"] += 1
-            current_date = grouped_mails[subj].get("created_at")
-            new_date = m.get("created_at")
-            if new_date and current_date and new_date > current_date:
-                m["_id"] = str(m["_id"])
-                m["thread_count"] = grouped_mails[subj]["thread_count"]
-                grouped_mails[subj] = m
 
-    final_mail_list = list(grouped_mails.values())
-    final_mail_list.sort(key=lambda x: x.get("created_at"), reverse=True)
+    # Konu bazlı gruplama Mongo'da yapılır, sadece bu sayfanın grupları gelir
+    mails, next_cursor = fetch_inbox_page(cursor, limit)
 
     all_tags = list(tags_col.find({}))
     tags_map = {t["slug"]: t for t in all_tags}
 
     return templates.TemplateResponse("dashboard.html", {
-        "request": request, "mails": final_mail_list, "user": user, "tags_map": tags_map
+        "request": request, "mails": mails, "user": user, "tags_map": tags_map,
+        "cursor": cursor, "next_cursor": next_cursor, "limit": limit
     })
 
 @router.get("/ui/drafts", response_class=HTMLResponse)
@@ -569,16 +545,9 @@ async def mail_editor(request: Request, mail_id: str):
     target_account = accounts_col.find_one({"email": target_email})
     account_signature = target_account.get("signature", "") if target_account else user.get("signature", "")
 
-    if not mail.get("reply_draft"):
-        draft = generate_reply(mail["body"], tone="formal")
-        mails_col.update_one(
-            {"_id": ObjectId(mail_id)}, 
-            {"$set": {"reply_draft": draft}, "$push": {"draft_history": {
-                "body": draft, "source": "AI", "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }}}
-        )
-        mail["reply_draft"] = draft
-        mail["draft_history"] = [{"body": draft, "source": "AI", "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}]
+    # Taslak yoksa sayfa beklemeden açılır; editor.js taslağı SSE ile kelime kelime akıtır
+    # (/ui/task_action/{mail_id}/draft/stream) ve bitince kaydeder.
+    stream_draft = not mail.get("reply_draft")
 
     # Thread Fetching
     subject_norm = mail.get("subject_normalized") or normalize_subject(mail.get("subject", ""))
@@ -593,7 +562,8 @@ async def mail_editor(request: Request, mail_id: str):
         m["is_owner"] = (m.get("type") == "outbound")
 
     return templates.TemplateResponse("editor.html", {
-        "request": request, "mail": mail, "user": user, "account_signature": account_signature, "thread": thread
+        "request": request, "mail": mail, "user": user, "account_signature": account_signature, "thread": thread,
+        "stream_draft": stream_draft
     })
 
 @router.post("/ui/task_action/{mail_id}/{action_type}")
@@ -602,13 +572,14 @@ async def task_action(mail_id: str, action_type: str):
     new_draft = ""
     decision_val = "neutral"
     if action_type == "approve":
-        new_draft = generate_decision_reply(mail["body"], decision="approve")
+        new_draft = generate_decision_reply(body_for_task(mail, "decision"), decision="approve")
         decision_val = "approve"
     elif action_type == "reject":
-        new_draft = generate_decision_reply(mail["body"], decision="reject")
+        new_draft = generate_decision_reply(body_for_task(mail, "decision"), decision="reject")
         decision_val = "reject"
     elif action_type == "regenerate":
-        new_draft = generate_reply(mail["body"], tone="formal")
+        # Açık "yeniden üret" isteği: önbellekteki aynı taslağı geri vermeyelim
+        new_draft = generate_reply(body_for_task(mail, "reply"), tone="formal", bypass_cache=True)
     
     add_draft_version(mail_id, new_draft, source="AI")
     mails_col.update_one(
@@ -617,9 +588,61 @@ async def task_action(mail_id: str, action_type: str):
     )
     return RedirectResponse(url=f"/ui/editor/{mail_id}", status_code=303)
 
+def _sse(data: dict, event: str = None) -> str:
+    """Server-Sent Events formatında tek mesaj."""
+    msg = f"event: {event}\n" if event else ""
+    return msg + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _stream_draft_events(chunks, on_complete=None):
+    """
+    LLM parçalarını SSE olarak iletir. Akış bitince temizlenmiş taslak 'done'
+    olayıyla gönderilir ve on_complete(draft) ile kaydedilir.
+    """
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield _sse({"token": chunk})
+    except Exception as e:
+        yield _sse({"message": str(e)}, event="error")
+        return
+
+    draft = clean_reply("".join(parts))
+    if not draft:
+        yield _sse({"message": "AI cevap üretemedi."}, event="error")
+        return
+    if on_complete:
+        on_complete(draft)
+    yield _sse({"draft": draft}, event="done")
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@router.post("/ui/task_action/{mail_id}/{action_type}/stream")
+def task_action_stream(mail_id: str, action_type: str):
+    """task_action'ın akışlı versiyonu (draft: editör ilk açıldığında taslak üretimi)."""
+    mail = mails_col.find_one({"_id": ObjectId(mail_id)})
+    if not mail or action_type not in ("draft", "regenerate", "approve", "reject"):
+        return JSONResponse(status_code=404, content={"error": "NOT_FOUND"})
+
+    if action_type in ("approve", "reject"):
+        chunks = stream_decision_reply(body_for_task(mail, "decision"), decision=action_type)
+    else:
+        chunks = stream_reply(body_for_task(mail, "reply"), tone="formal", bypass_cache=(action_type == "regenerate"))
+
+    def save(draft):
+        add_draft_version(mail_id, draft, source="AI")
+        update = {"reply_draft": draft, "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if action_type != "draft":
+            update["decision"] = action_type if action_type in ("approve", "reject") else "neutral"
+        mails_col.update_one({"_id": ObjectId(mail_id)}, {"$set": update})
+
+    return StreamingResponse(_stream_draft_events(chunks, save), media_type="text/event-stream", headers=_SSE_HEADERS)
+
 @router.post("/ui/mail/delete/{mail_id}")
 async def delete_mail(request: Request, mail_id: str):
     mails_col.delete_one({"_id": ObjectId(mail_id)})
+    delete_vectors([ObjectId(mail_id)])
+    invalidate_results()
     referer = request.headers.get("referer")
     if referer and "history" in referer: return RedirectResponse(url="/ui/history?msg=Silindi", status_code=303)
     elif referer and "drafts" in referer: return RedirectResponse(url="/ui/drafts?msg=Silindi", status_code=303)
@@ -749,7 +772,10 @@ async def delete_contact(contact_id: str = Form(...), delete_mode: str = Form(..
     if not contact: return RedirectResponse(url="/ui/contacts?error=Kisi+Bulunamadi", status_code=303)
     
     if delete_mode == "with_history":
-        mails_col.delete_many({"from": contact.get("email")})
+        mail_ids = [m["_id"] for m in mails_col.find({"from": contact.get("email")}, {"_id": 1})]
+        mails_col.delete_many({"_id": {"$in": mail_ids}})
+        delete_vectors(mail_ids)
+        invalidate_results()
     
     contacts_col.delete_one({"_id": ObjectId(contact_id)})
     return RedirectResponse(url="/ui/contacts?msg=Kisi+Silindi", status_code=303)
@@ -790,6 +816,24 @@ async def update_tag(tag_id: str, name: str = Form(...), color: str = Form(...),
     tags_col.update_one({"_id": ObjectId(tag_id)}, {"$set": {"name": name, "slug": slug, "color": color, "description": description, "updated_at": datetime.now()}})
     return RedirectResponse(url="/ui/settings?msg=msg_tag_updated", status_code=303)
 
+# --- YÖNETİM: Eksik/bayat vektörleri yeniden üretme ---
+@router.get("/ui/admin/reembed")
+async def reembed_status():
+    return JSONResponse(content=jsonable_encoder(get_reembed_status()))
+
+@router.post("/ui/admin/reembed")
+async def reembed_start(force: bool = False, reset: bool = False):
+    """Arka planda başlatır; yarıda kalmış iş varsa kaldığı yerden sürer."""
+    started = start_reembed(force=force, reset=reset)
+    status = get_reembed_status()
+    status["started"] = started
+    return JSONResponse(status_code=202 if started else 409, content=jsonable_encoder(status))
+
+@router.post("/ui/admin/reembed/stop")
+async def reembed_stop():
+    stop_reembed()
+    return JSONResponse(content=jsonable_encoder(get_reembed_status()))
+
 @router.get("/ui/writer", response_class=HTMLResponse)
 async def writer_page(request: Request, draft_id: Optional[str] = None):
     user = users_col.find_one({"is_active": True})
@@ -810,6 +854,14 @@ async def generate_writer_draft(prompt: str = Form(...)):
     except Exception as e:
         return {"draft": f"Hata: {str(e)}"}
 
+@router.post("/ui/writer/generate/stream")
+def generate_writer_draft_stream(prompt: str = Form(...)):
+    """Writer taslağını SSE ile akıtır; kaydetmeyi writer.js'in auto-save'i yapar."""
+    return StreamingResponse(
+        _stream_draft_events(stream_reply(prompt, tone="formal")),
+        media_type="text/event-stream", headers=_SSE_HEADERS
+    )
+
 @router.post("/ui/writer/send")
 async def send_writer_mail(sender_email: str = Form(...), to_email: str = Form(...), subject: str = Form(...), body: str = Form(...), draft_id: Optional[str] = Form(None)):
     user = users_col.find_one({"is_active": True})
@@ -831,24 +883,28 @@ async def send_writer_mail(sender_email: str = Form(...), to_email: str = Form(.
         return RedirectResponse(url=f"/ui/writer?error={msg}", status_code=303)
 
 @router.get("/ui/search-api")
-async def search_mails(q: str = Query(..., min_length=1)):
+def search_mails(
+    q: str = Query(..., min_length=1),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=50),
+    account_id: Optional[str] = None,
+    status: Optional[str] = None,
+    tag: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+):
+    """
+    Hibrit arama: kelime (text indeksi) + anlam (vektör), RRF ile birleştirilir.
+    Senkron (def): Mongo, embedding ve yerel indeks çağrıları bloklayıcıdır, FastAPI bunu
+    thread havuzunda çalıştırır; event loop (SSE akışları) beklemez.
+    """
     try:
-        query_vector = get_embedding(q)
-        if not query_vector:
-            return {"results": [], "message": "Vektör oluşturulamadı."}
-
-        pipeline = [
-            {"$vectorSearch": {
-                "index": "vector_index", "path": "embedding", "queryVector": query_vector,
-                "numCandidates": 100, "limit": 10
-            }},
-            {"$project": {
-                "_id": {"$toString": "$_id"}, "subject": 1, "sender": 1,
-                "snippet": {"$substr": ["$body", 0, 150]}, "date": 1,
-                "score": {"$meta": "vectorSearchScore"}
-            }}
-        ]
-        results = list(mails_col.aggregate(pipeline))
-        return {"results": results}
+        return hybrid_search(
+            q, page=page, page_size=page_size, account_id=account_id,
+            status=status, tag=tag, date_from=date_from, date_to=date_to
+        )
+    except ValueError as e:
+        # Hatalı tarih formatı vb.
+        return JSONResponse(status_code=400, content={"results": [], "error": str(e)})
     except Exception as e:
         return {"results": [], "error": str(e)}
\ No newline at end of file
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Veritabanı Bağlantıları
+from app.database import accounts_col, users_col
+
+# Aynı anda taranacak en fazla hesap sayısı (1 -> eski seri davranış)
+SCAN_WORKERS = max(1, int(os.getenv("MAIL_SCAN_WORKERS", "4")))
+# Tek bir hesabın taramasını bu süreden (sn) uzun beklemeyiz; tur diğer hesaplarla biter
+ACCOUNT_TIMEOUT = int(os.getenv("MAIL_ACCOUNT_TIMEOUT", "300"))
+
+# Tarama türü (inbox/sent) başına ayrı havuz: bir türde asılı kalan hesaplar diğerinin
+# thread'lerini tüketmesin
+_executors = {}
+_executors_guard = threading.Lock()
+
+# (tarama türü, hesap id) -> Lock : Aynı hesabın aynı kutusu iki kez paralel taranmasın
+_account_locks = {}
+_locks_guard = threading.Lock()
+
+def _get_executor(kind: str) -> ThreadPoolExecutor:
+    with _executors_guard:
+        if kind not in _executors:
+            _executors[kind] = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix=f"mail-scan-{kind}")
+        return _executors[kind]
+
+def _get_lock(kind: str, account_id: str) -> threading.Lock:
+    with _locks_guard:
+        return _account_locks.setdefault((kind, account_id), threading.Lock())
+
+def get_active_accounts() -> list:
+    """
+    Aktif hesapları döner. Accounts tablosu boşsa eski User tablosundaki
+    aktif kullanıcıları geçici hesap formatına çevirir (Migration/Fallback).
+    """
+    active_accounts = list(accounts_col.find({"is_active": True}))
+    if active_accounts:
+        return active_accounts
+
+    active_users = list(users_col.find({"is_active": True}))
+    if active_users:
+        print("ℹ️ Accounts tablosu boş, eski User tablosuna bakılıyor...")
+    return [
+        {
+            "_id": user["_id"],
+            "email": user["email"],
+            "password": user["app_password"],
+            "provider": "gmail"
+        }
+        for user in active_users
+    ]
+
+def _run_account(kind: str, account, worker, started: dict) -> dict:
+    """Tek hesabı izole şekilde tarar; hata diğer hesapları etkilemez."""
+    account_id = str(account.get("_id"))
+    result = {"email": account.get("email"), "status": "OK", "seconds": 0.0}
+
+    lock = _get_lock(kind, account_id)
+    if not lock.acquire(blocking=False):
+        # Önceki turdaki tarama (ör. asılı kalmış bağlantı) hala sürüyor
+        result["status"] = "BUSY"
+        return result
+
+    start = time.monotonic()
+    started[account_id] = start
+    try:
+        worker(account)
+    except Exception as e:
+        result["status"] = "ERROR"
+        result["error"] = str(e)
+        print(f"🚨 Hesap taraması hatası ({account.get('email')}): {e}")
+    finally:
+        result["seconds"] = time.monotonic() - start
+        lock.release()
+    return result
+
+def scan_accounts(accounts: list, worker, kind: str) -> list:
+    """
+    Hesapları sınırlı bir thread havuzunda paralel tarar.
+    Tur süresi hesapların toplamı değil, en yavaş hesap kadardır.
+    Çalışmaya başlayıp ACCOUNT_TIMEOUT'u aşan hesap beklenmez (arka planda biter,
+    kilidi bırakana kadar sonraki turlarda BUSY olarak atlanır).
+    return: Hesap başına {"email", "status", "seconds"} özet listesi
+    """
+    cycle_start = time.monotonic()
+    started = {}
+    executor = _get_executor(kind)
+    futures = {
+        executor.submit(_run_account, kind, account, worker, started): account
+        for account in accounts
+    }
+
+    results = []
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+        results.extend(f.result() for f in done)
+
+        now = time.monotonic()
+        for future in list(pending):
+            account = futures[future]
+            start = started.get(str(account.get("_id")))
+            if start is not None and now - start > ACCOUNT_TIMEOUT:
+                pending.discard(future)
+                results.append({"email": account.get("email"), "status": "TIMEOUT", "seconds": now - start})
+
+    _print_summary(kind, results, time.monotonic() - cycle_start)
+    return results
+
+def _print_summary(kind: str, results: list, total_seconds: float):
+    """Tur özeti: hesap başına süre ve durum."""
+    if not results:
+        return
+    slowest = max(results, key=lambda r: r["seconds"])
+    problems = [r for r in results if r["status"] != "OK"]
+    print(
+        f"📊 Tarama turu ({kind}): {len(results)} hesap, {total_seconds:.1f} sn | "
+        f"en yavaş: {slowest['email']} ({slowest['seconds']:.1f} sn) | sorunlu: {len(problems)}"
+    )
+    details = ", ".join(
+        f"{r['email']} {r['seconds']:.1f}sn" + ("" if r["status"] == "OK" else f" [{r['status']}]")
+        for r in sorted(results, key=lambda r: r["seconds"], reverse=True)
+    )
+    print(f"   ⏱️ {details}")
@@ -0,0 +1,231 @@
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Veritabanı Bağlantıları
+from app.database import analysis_jobs_col, mails_col
+from app.services.ollama_service import LLMUnavailableError, LLM_BREAKER_COOLDOWN
+from app.rag.search_cache import invalidate_results
+
+# Aynı anda çalışacak analiz işçisi sayısı (yerel LLM tek GPU'da çalıştığı için düşük tutulur)
+ANALYSIS_WORKERS = max(1, int(os.getenv("ANALYSIS_WORKERS", "2")))
+# İşçi bu süre içinde bitiremezse (çöktü / asıldı) iş başka bir işçiye devredilir
+LEASE_SECONDS = int(os.getenv("ANALYSIS_LEASE_SECONDS", "600"))
+# Bu kadar denemeden sonra iş DEAD (dead-letter) olur
+MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "5"))
+# Yeniden deneme beklemesi: 30 sn, 60 sn, 120 sn ... (üst sınır 30 dk)
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 1800
+# Kuyruk boşken yoklama aralığı (sn); yeni iş gelince işçiler hemen uyanır
+IDLE_POLL = 5
+
+# Aynı süreçte yeni iş eklenince bekleyen işçileri uyandırır
+_wake_event = threading.Event()
+
+def enqueue_analysis(mail_id):
+    """
+    Mail için analiz işi oluşturur. Aynı mail için ikinci kez çağrılırsa
+    mevcut iş korunur (idempotent).
+    """
+    now = datetime.utcnow()
+    try:
+        analysis_jobs_col.update_one(
+            {"mail_id": mail_id},
+            {"$setOnInsert": {
+                "mail_id": mail_id,
+                "status": "PENDING",
+                "attempts": 0,
+                "next_run_at": now,
+                "lease_until": None,
+                "worker": None,
+                "last_error": None,
+                "created_at": now,
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Paralel iki upsert yarıştı; iş zaten var
+        pass
+    _wake_event.set()
+
+def recover_pending_mails() -> int:
+    """
+    PENDING_ANALYSIS durumunda kalıp işi olmayan mailler için iş açar
+    (mail kaydedildikten hemen sonra, iş eklenmeden çökülmüş olabilir).
+    """
+    pending_ids = [doc["_id"] for doc in mails_col.find({"status": "PENDING_ANALYSIS"}, {"_id": 1})]
+    if not pending_ids:
+        return 0
+    # Tek sorguyla işi olanlar (mail başına find_one yerine)
+    queued = set(analysis_jobs_col.distinct("mail_id", {"mail_id": {"$in": pending_ids}}))
+    count = 0
+    for mail_id in pending_ids:
+        if mail_id not in queued:
+            enqueue_analysis(mail_id)
+            count += 1
+    if count:
+        print(f"♻️ İşi kaybolmuş {count} mail analiz kuyruğuna geri alındı.")
+    return count
+
+def lease_job(worker_id: str):
+    """
+    Sıradaki işi atomik olarak kiralar (lease). Süresi dolmuş RUNNING işler de
+    (çöken işçi) yeniden alınabilir. Deneme sayısı kiralamada artar; böylece
+    işçiyi çökerten bir mail de sonunda DEAD olur.
+    """
+    now = datetime.utcnow()
+    return analysis_jobs_col.find_one_and_update(
+        {"$or": [
+            {"status": "PENDING", "next_run_at": {"$lte": now}},
+            {"status": "RUNNING", "lease_until": {"$lt": now}},
+        ]},
+        {
+            "$set": {
+                "status": "RUNNING",
+                "worker": worker_id,
+                "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                "started_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("next_run_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def complete_job(job, worker_id: str):
+    """İşi DONE olarak işaretler (kira hala bu işçideyse)."""
+    analysis_jobs_col.update_one(
+        {"_id": job["_id"], "status": "RUNNING", "worker": worker_id},
+        {"$set": {"status": "DONE", "lease_until": None, "finished_at": datetime.utcnow()}}
+    )
+
+def fail_job(job, worker_id: str, error: str) -> str:
+    """
+    Başarısız işi üstel beklemeyle tekrar kuyruğa koyar; deneme hakkı
+    bittiyse DEAD yapar.
+    return: Yeni durum ("PENDING" / "DEAD")
+    """
+    now = datetime.utcnow()
+    attempts = job.get("attempts", 1)
+
+    if attempts >= MAX_ATTEMPTS:
+        update = {"status": "DEAD", "lease_until": None, "last_error": error, "finished_at": now}
+    else:
+        delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+        update = {"status": "PENDING", "lease_until": None, "last_error": error,
+                  "next_run_at": now + timedelta(seconds=delay)}
+
+    analysis_jobs_col.update_one(
+        {"_id": job["_id"], "status": "RUNNING", "worker": worker_id},
+        {"$set": update}
+    )
+    return update["status"]
+
+def defer_job(job, worker_id: str, delay: int):
+    """
+    İşi deneme hakkı harcamadan ertelenmiş olarak kuyruğa geri koyar
+    (LLM sunucusu geçici olarak sağlıksızken).
+    """
+    analysis_jobs_col.update_one(
+        {"_id": job["_id"], "status": "RUNNING", "worker": worker_id},
+        {
+            "$set": {"status": "PENDING", "lease_until": None,
+                     "next_run_at": datetime.utcnow() + timedelta(seconds=delay)},
+            "$inc": {"attempts": -1}
+        }
+    )
+
+def get_queue_stats() -> dict:
+    """Kuyruk durumu: {"PENDING": n, "RUNNING": n, "DONE": n, "DEAD": n}"""
+    stats = {"PENDING": 0, "RUNNING": 0, "DONE": 0, "DEAD": 0}
+    for row in analysis_jobs_col.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        stats[row["_id"]] = row["count"]
+    return stats
+
+
+class AnalysisWorker(threading.Thread):
+    """Kuyruktan iş kiralar ve handler(mail_id) ile maili analiz eder."""
+
+    def __init__(self, index: int, handler, stop_event: threading.Event):
+        super().__init__(daemon=True, name=f"analysis-worker-{index}")
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        self.handler = handler
+        self.stop_event = stop_event
+
+    def run(self):
+        # Son boşta kalıştan beri analiz edilen mail sayısı: arama sonuçları kuyruk
+        # boşalınca bir kez geçersiz kılınır (her mailde değil; arada TTL sınırlar)
+        analyzed = 0
+        while not self.stop_event.is_set():
+            # Kuyruğa bakmadan ÖNCE temizlenir: kiralama ile bekleme arasında gelen set() kaybolmaz
+            _wake_event.clear()
+            try:
+                job = lease_job(self.worker_id)
+            except Exception as e:
+                print(f"⚠️ Analiz kuyruğuna erişilemedi: {e}")
+                self.stop_event.wait(IDLE_POLL)
+                continue
+
+            if not job:
+                if analyzed:
+                    invalidate_results()
+                    analyzed = 0
+                _wake_event.wait(IDLE_POLL)
+                continue
+
+            try:
+                self.handler(job["mail_id"])
+                complete_job(job, self.worker_id)
+                analyzed += 1
+            except LLMUnavailableError:
+                # Devre kesici açık: hata sayılmaz, LLM toparlanınca tekrar denenir
+                defer_job(job, self.worker_id, int(LLM_BREAKER_COOLDOWN))
+                self.stop_event.wait(LLM_BREAKER_COOLDOWN)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                status = fail_job(job, self.worker_id, error)
+                print(f"🚨 Analiz hatası (mail {job['mail_id']}, deneme {job.get('attempts')}): {error} -> {status}")
+                if status == "DEAD":
+                    traceback.print_exc()
+                    _on_dead(job, error)
+
+
+def _on_dead(job, error: str):
+    """
+    Analizi hiç tamamlanamayan mail kullanıcıdan gizlenmesin: onay bekleyenlere
+    düşer (taslak editörde istenince üretilir), hata mail üzerinde saklanır.
+    """
+    mails_col.update_one(
+        {"_id": job["mail_id"], "status": "PENDING_ANALYSIS"},
+        {"$set": {"status": "WAITING_APPROVAL", "analysis_error": error}}
+    )
+
+
+_workers = []
+_stop_event = threading.Event()
+
+def start_analysis_workers(handler=None):
+    """Analiz işçi havuzunu başlatır (sunucu açılırken)."""
+    if _workers:
+        return
+    if handler is None:
+        from app.services.mail_analyzer import analyze_mail
+        handler = analyze_mail
+
+    _stop_event.clear()
+    recover_pending_mails()
+    for i in range(ANALYSIS_WORKERS):
+        worker = AnalysisWorker(i, handler, _stop_event)
+        _workers.append(worker)
+        worker.start()
+    print(f"🧠 Analiz kuyruğu aktif ({ANALYSIS_WORKERS} işçi).", flush=True)
+
+def stop_analysis_workers():
+    """İşçileri durdurur. Yarım kalan işlerin kirası dolunca başka işçi devralır."""
+    _stop_event.set()
+    _wake_event.set()
+    _workers.clear()
@@ -1,22 +1,19 @@
 import json
 import re
 from app.services.ollama_service import ask_llm
+from app.services.reply_generator import extract_json_safe, clean_reply
+from app.utils.prompt_templates import TONE_INSTRUCTIONS, SINGLE_PASS_PROMPT_TEMPLATE
 
-def extract_insights_and_tasks(mail_body, available_tags=None):
+CATEGORIES = ("Proposal", "Complaint", "Payment", "Question", "Meeting", "Other")
+
+def _format_tag_list(available_tags):
     """
-    Analyzes email content using Mistral (English Prompt).
-    outputs JSON with:
-    1. 'task': null or {title, date}
-    2. 'insight': string
-    3. 'category': "Proposal", "Complaint", "Payment", "Question", "Meeting", "Other"
-    4. 'urgency_score': 0-100
-    5. 'tags': List of slugs matched from available_tags
+    Prompt için etiket listesini hazırlar.
+    return: (prompt metni, geçerli slug kümesi)
     """
-
-    # Prepare tag list for the prompt
     tag_list_str = "[]"
     valid_slugs = set()
-    
+
     if available_tags:
         # [{slug: 'fatura', description: '...'}, ...]
         tag_lines = []
@@ -28,6 +25,22 @@ def extract_insights_and_tasks(mail_body, available_tags=None):
                 valid_slugs.add(slug)
         tag_list_str = "\n    " + "\n    ".join(tag_lines)
 
+    return tag_list_str, valid_slugs
+
+def extract_insights_and_tasks(mail_body, available_tags=None):
+    """
+    Analyzes email content using Mistral (English Prompt).
+    outputs JSON with:
+    1. 'task': null or {title, date}
+    2. 'insight': string
+    3. 'category': "Proposal", "Complaint", "Payment", "Question", "Meeting", "Other"
+    4. 'urgency_score': 0-100
+    5. 'tags': List of slugs matched from available_tags
+    """
+
+    # Prepare tag list for the prompt
+    tag_list_str, valid_slugs = _format_tag_list(available_tags)
+
     prompt = f"""
     You are a professional executive assistant. 
     Analyze the following email content and return only the result in JSON format.
@@ -71,7 +84,7 @@ def extract_insights_and_tasks(mail_body, available_tags=None):
 
     try:
         # Mistral with JSON mode
-        raw_response = ask_llm(prompt, json_mode=True)
+        raw_response = ask_llm(prompt, json_mode=True, task="extract")
         
         # Extract JSON
         json_match = re.search(r'\{.*\}', raw_response, re.DOTALL)
@@ -99,4 +112,89 @@ def extract_insights_and_tasks(mail_body, available_tags=None):
 
     except Exception as e:
         print(f"❌ Smart Extraction Error: {e}")
-        return {"task": None, "insight": None, "category": "Other", "urgency_score": 0, "is_proposal": False, "tags": []}
\ No newline at end of file
+        return {"task": None, "insight": None, "category": "Other", "urgency_score": 0, "is_proposal": False, "tags": []}
+
+
+def _validate_single_pass(data, valid_slugs):
+    """
+    Tek geçişli analiz JSON'unu şemaya göre doğrular ve normalize eder.
+    Karar veya tipler bozuksa None döner (çağıran eski yola düşer).
+    """
+    if not isinstance(data, dict):
+        return None
+
+    decision = str(data.get("decision", "")).strip().upper()
+    if decision not in ("YES", "NO"):
+        return None
+
+    reply = data.get("reply") or ""
+    if not isinstance(reply, str):
+        return None
+    reply = clean_reply(reply)
+    # Cevap gerekiyor dedi ama taslak yazmadıysa bu sonuca güvenmiyoruz
+    if decision == "YES" and not reply:
+        return None
+
+    try:
+        urgency = max(0, min(100, int(data.get("urgency_score", 0) or 0)))
+    except (TypeError, ValueError):
+        return None
+
+    category = data.get("category")
+    if category not in CATEGORIES:
+        category = "Other"
+
+    tags = data.get("tags") or []
+    if not isinstance(tags, list):
+        return None
+    tags = [t for t in tags if isinstance(t, str) and (not valid_slugs or t in valid_slugs)]
+
+    task = data.get("task")
+    if not (isinstance(task, dict) and task.get("title")):
+        task = None
+
+    insight = data.get("insight")
+    if not isinstance(insight, str) or not insight.strip():
+        insight = None
+
+    return {
+        "classifier": {
+            "should_reply": decision == "YES",
+            "decision": decision,
+            "raw_output": decision,
+            "source": "single_pass"
+        },
+        "analysis": {
+            "task": task,
+            "insight": insight,
+            "category": category,
+            "urgency_score": urgency,
+            "is_proposal": bool(data.get("is_proposal", False)),
+            "tags": tags
+        },
+        "reply_draft": reply if decision == "YES" else None
+    }
+
+def analyze_single_pass(mail_body, available_tags=None, tone="formal"):
+    """
+    Sınıflandırma (should_reply), çıkarım (extract_insights_and_tasks) ve cevap
+    taslağını (generate_reply) TEK JSON-mode LLM çağrısında üretir.
+    Mail gövdesi modele üç kez yerine bir kez gider.
+
+    return: {"classifier": {...}, "analysis": {...}, "reply_draft": str | None}
+            veya çıktı şemaya uymazsa None (çağıran ayrı ayrı fonksiyonlara düşer)
+    """
+    tag_list_str, valid_slugs = _format_tag_list(available_tags)
+    tone_instruction = TONE_INSTRUCTIONS.get((tone or "formal").lower(), TONE_INSTRUCTIONS["formal"])
+
+    prompt = SINGLE_PASS_PROMPT_TEMPLATE.format(
+        tag_list=tag_list_str,
+        tone_instruction=tone_instruction,
+        mail_text=mail_body
+    )
+
+    raw_response = ask_llm(prompt, json_mode=True, task="analysis")
+    result = _validate_single_pass(extract_json_safe(raw_response), valid_slugs)
+    if result is None:
+        print("⚠️ Tek geçişli analiz çıktısı şemaya uymadı, ayrı çağrılara dönülüyor.")
+    return result
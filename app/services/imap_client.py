@@ -0,0 +1,242 @@
+import imaplib
+import os
+import re
+
+# Güvenlik
+from app.core.security import decrypt_password
+
+# IMAP soket zaman aşımı (sn). Asılı kalan bir sunucu tüm taramayı kilitlemesin.
+IMAP_TIMEOUT = int(os.getenv("IMAP_TIMEOUT", "60"))
+
+
+def get_imap_host(account) -> str:
+    """Hesabın sağlayıcısına göre IMAP sunucusunu döner."""
+    host = "imap.gmail.com" # Varsayılan
+    if account.get("provider") == "outlook": host = "outlook.office365.com"
+    return host
+
+
+def connect_account(account):
+    """
+    Hesap için yeni bir IMAP oturumu açar ve login olur.
+    Şifre çözülemezse veya giriş başarısız olursa None döner.
+    """
+    email_user = account.get("email")
+
+    enc_pass = account.get("password")
+    if not enc_pass:
+        print(f"❌ {email_user} için veritabanında şifre bulunamadı.")
+        return None
+
+    try:
+        if not os.getenv("ENCRYPTION_KEY"):
+            print("🚨 KRİTİK HATA: .env dosyasında ENCRYPTION_KEY hala eksik!")
+            return None
+        email_pass = decrypt_password(enc_pass)
+    except Exception as e:
+        print(f"❌ Şifre çözme hatası ({email_user}): Anahtar uyuşmazlığı. {e}")
+        return None
+
+    mail = imaplib.IMAP4_SSL(get_imap_host(account), timeout=IMAP_TIMEOUT)
+    try:
+        mail.login(email_user, email_pass)
+    except imaplib.IMAP4.error:
+        print(f"⛔ Giriş Başarısız: {email_user} (Şifre Yanlış veya İzin Yok)")
+        safe_logout(mail)
+        return None
+
+    # Login sonrası yetenek listesi değişebilir (Gmail CONDSTORE'u ancak girişten sonra bildirir)
+    _refresh_capabilities(mail)
+    if "CONDSTORE" in mail.capabilities and "ENABLE" in mail.capabilities:
+        try:
+            mail.enable("CONDSTORE")
+        except Exception:
+            pass
+
+    return mail
+
+
+def _refresh_capabilities(mail):
+    try:
+        typ, dat = mail.capability()
+        if typ == "OK" and dat and dat[-1]:
+            mail.capabilities = tuple(dat[-1].decode(errors="ignore").upper().split())
+    except Exception:
+        pass
+
+
+def _int_response(mail, code):
+    """SELECT sonrası gelen [UIDVALIDITY n] gibi response code'ları int olarak okur."""
+    _, data = mail.response(code)
+    try:
+        return int(data[-1]) if data and data[-1] is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def select_folder(mail, folder: str = "INBOX") -> dict:
+    """
+    Klasörü seçer ve senkron için gereken durum bilgisini döner:
+    {"uidvalidity": int, "uidnext": int|None, "highestmodseq": int|None, "exists": int}
+    """
+    typ, data = mail.select(folder)
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"Klasör seçilemedi: {folder}")
+
+    return {
+        "uidvalidity": _int_response(mail, "UIDVALIDITY"),
+        "uidnext": _int_response(mail, "UIDNEXT"),
+        "highestmodseq": _int_response(mail, "HIGHESTMODSEQ"),
+        "exists": int(data[0]) if data and data[0] else 0,
+    }
+
+
+def uid_search(mail, *criteria) -> list:
+    """UID SEARCH sonucunu sıralı int listesi olarak döner."""
+    typ, data = mail.uid("SEARCH", None, *criteria)
+    if typ != "OK" or not data or not data[0]:
+        return []
+    return sorted(int(x) for x in data[0].split())
+
+
+def compress_uid_set(uids) -> str:
+    """[101, 102, 103, 107] -> "101:103,107" (tek komutta UID kümesi)"""
+    ranges = []
+    for uid in sorted(set(int(u) for u in uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+def safe_logout(mail):
+    """Bağlantıyı sessizce kapatır (zaten kopmuş olabilir)."""
+    if mail is None:
+        return
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+
+# =========================================================================
+# FETCH CEVABI AYRIŞTIRICI (BODYSTRUCTURE, BODY[...] literal'leri)
+# =========================================================================
+
+_LITERAL_RE = re.compile(rb"\{(\d+)\}\r\n")
+_WHITESPACE = b" \t\r\n"
+
+class _SexpReader:
+    """
+    IMAP cevaplarındaki parantezli listeleri okur.
+    Liste -> list, string/atom/literal -> bytes, NIL -> None
+    """
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.pos = 0
+
+    def at_end(self) -> bool:
+        self._skip_ws()
+        return self.pos >= len(self.raw)
+
+    def _skip_ws(self):
+        while self.pos < len(self.raw) and self.raw[self.pos] in _WHITESPACE:
+            self.pos += 1
+
+    def read(self):
+        self._skip_ws()
+        ch = self.raw[self.pos:self.pos + 1]
+
+        if ch == b"(":
+            self.pos += 1
+            items = []
+            while True:
+                self._skip_ws()
+                if self.raw[self.pos:self.pos + 1] == b")":
+                    self.pos += 1
+                    return items
+                if self.pos >= len(self.raw):
+                    raise ValueError("Kapanmamış parantez")
+                items.append(self.read())
+
+        if ch == b'"':
+            self.pos += 1
+            out = bytearray()
+            while self.pos < len(self.raw) and self.raw[self.pos:self.pos + 1] != b'"':
+                if self.raw[self.pos:self.pos + 1] == b"\\":
+                    self.pos += 1
+                out += self.raw[self.pos:self.pos + 1]
+                self.pos += 1
+            self.pos += 1
+            return bytes(out)
+
+        if ch == b"{":
+            m = _LITERAL_RE.match(self.raw, self.pos)
+            if not m:
+                raise ValueError("Bozuk literal")
+            size = int(m.group(1))
+            start = m.end()
+            self.pos = start + size
+            return self.raw[start:start + size]
+
+        # Atom: BODY[HEADER.FIELDS (MESSAGE-ID)]<0> gibi köşeli parantez içi boşluk içerebilir
+        start = self.pos
+        depth = 0
+        while self.pos < len(self.raw):
+            c = self.raw[self.pos:self.pos + 1]
+            if c == b"[":
+                depth += 1
+            elif c == b"]":
+                depth -= 1
+            elif depth == 0 and (c in (b"(", b")") or c in (b" ", b"\r", b"\n")):
+                break
+            self.pos += 1
+        atom = self.raw[start:self.pos]
+        return None if atom.upper() == b"NIL" else atom
+
+
+def _join_fetch_data(data) -> bytes:
+    """imaplib'in (head, literal) parçalarını tekrar tel formatına birleştirir."""
+    chunks = []
+    for item in data or []:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            chunks.append(item[0] + b"\r\n" + item[1])
+        else:
+            chunks.append(item)
+    return b" ".join(chunks)
+
+
+def parse_fetch_response(data) -> list:
+    """
+    FETCH cevabını mesaj başına sözlüklere çevirir:
+    [{"UID": 101, "BODYSTRUCTURE": [...], "BODY[HEADER]": b"...", "BODY[1.1]": b"..."}, ...]
+    """
+    reader = _SexpReader(_join_fetch_data(data))
+    messages = []
+    while not reader.at_end():
+        reader.read()  # Sıra numarası (sequence number)
+        items = reader.read()
+        if not isinstance(items, list):
+            continue
+        msg = {}
+        for i in range(0, len(items) - 1, 2):
+            key = (items[i] or b"").decode(errors="ignore").upper()
+            # BODY[1.2]<0> -> BODY[1.2]
+            key = re.sub(r"<\d+>$", "", key)
+            msg[key] = items[i + 1]
+        if "UID" in msg:
+            msg["UID"] = int(msg["UID"])
+        messages.append(msg)
+    return messages
+
+
+def fetch_item(msg: dict, prefix: str):
+    """Mesaj sözlüğünden anahtarı prefix ile başlayan ilk değeri döner (BODY[HEADER...] gibi)."""
+    for key, value in msg.items():
+        if key.startswith(prefix):
+            return value
+    return None
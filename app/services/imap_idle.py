@@ -0,0 +1,231 @@
+import imaplib
+import os
+import re
+import select
+import ssl
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# IMAP Bağlantı Yardımcıları
+from app.services.imap_client import connect_account, safe_logout
+from app.services.mail_listener import process_account_inbox
+from app.services.account_scanner import get_active_accounts
+
+# RFC 2177: Sunucu 30 dk sessiz kalan IDLE oturumunu düşürebilir, 25 dk'da yeniliyoruz.
+IDLE_TIMEOUT = int(os.getenv("IMAP_IDLE_TIMEOUT", "1500"))
+# IDLE desteklemeyen sunucular için aynı oturum üzerinden yoklama aralığı (sn)
+IDLE_FALLBACK_POLL = int(os.getenv("IMAP_IDLE_FALLBACK_POLL", "60"))
+# Bağlantı koptuğunda yeniden deneme beklemesi (üstel artar)
+RECONNECT_MIN_DELAY = 5
+RECONNECT_MAX_DELAY = 300
+# Durdurulan dinleyicinin bitmesi için beklenecek süre (sn). IDLE beklemesi 5 sn'lik
+# dilimlerle stop_event'e baktığından en az bu kadar olmalı.
+STOP_JOIN_TIMEOUT = 10
+
+# "* 12 EXISTS" / "* 3 RECENT" -> kutuya yeni mail düştü
+_NEW_MAIL_RE = re.compile(rb"^\* \d+ (EXISTS|RECENT)", re.IGNORECASE)
+
+def is_push_mode() -> bool:
+    """MAIL_PUSH_MODE=idle ise gelen kutusu periyodik tarama yerine IMAP IDLE ile dinlenir."""
+    return os.getenv("MAIL_PUSH_MODE", "poll").strip().lower() == "idle"
+
+@contextmanager
+def _raw_command(mail, command: bytes):
+    """
+    imaplib IDLE komutunu desteklemez; komut elle gönderilir ve cevabı satır satır okunur.
+    imaplib'in özel API'si (_new_tag, tagged_commands) SADECE burada kullanılır: tag imaplib'in
+    sayacından alınır (sonraki komutlarla çakışmasın) ve iş bitince bekleyen komut tablosundan
+    silinir. Python sürümü bu iç yapıyı değiştirirse düzeltilecek tek yer burasıdır.
+    """
+    tag = mail._new_tag()
+    mail.send(tag + b" " + command + b"\r\n")
+    try:
+        yield tag
+    finally:
+        mail.tagged_commands.pop(tag, None)
+
+def _has_buffered_data(mail) -> bool:
+    """
+    mail.readline() imaplib'in tamponlu dosyasından okur: aynı pakette gelen satırlar
+    (EXPUNGE + EXISTS gibi) tamponda bekler ve soket select'te okunabilir görünmez.
+    Tamponu bloklamadan yoklar (soket geçici olarak non-blocking yapılır).
+    """
+    sock = mail.sock
+    previous = sock.gettimeout()
+    sock.settimeout(0)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(previous)
+
+def _idle_wait(mail, timeout: int, stop_event: threading.Event) -> bool:
+    """
+    Seçili kutuda IDLE komutunu başlatır, sunucu yeni mail bildirene veya
+    süre dolana kadar bekler, ardından DONE ile IDLE'ı kapatır.
+    return: Yeni mail bildirimi geldiyse True
+    """
+    has_new = False
+    with _raw_command(mail, b"IDLE") as tag:
+        # Sunucunun "+ idling" devam satırını bekle
+        while True:
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("IDLE başlatılırken bağlantı koptu")
+            if line.startswith(b"+"):
+                break
+            if line.startswith(tag):
+                raise imaplib.IMAP4.error(f"IDLE reddedildi: {line!r}")
+            if _NEW_MAIL_RE.match(line):
+                has_new = True
+
+        # Bildirim bekle (stop_event'i kaçırmamak için kısa dilimlerle)
+        waited = 0
+        while not has_new and waited < timeout and not stop_event.is_set():
+            # Tamponda okunmamış satır varsa select'e girmeden önce onlar tüketilir
+            if not _has_buffered_data(mail):
+                slice_sec = min(5, timeout - waited)
+                readable, _, _ = select.select([mail.sock], [], [], slice_sec)
+                pending = getattr(mail.sock, "pending", lambda: 0)()
+                if not readable and not pending:
+                    waited += slice_sec
+                    continue
+
+            line = mail.readline()
+            if not line or line.startswith(b"* BYE"):
+                raise imaplib.IMAP4.abort("Sunucu IDLE oturumunu kapattı")
+            if _NEW_MAIL_RE.match(line):
+                has_new = True
+
+        # IDLE'ı bitir ve tagged cevabı tüket
+        mail.send(b"DONE\r\n")
+        while True:
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("IDLE kapatılırken bağlantı koptu")
+            if line.startswith(tag):
+                if b" OK" not in line.upper():
+                    raise imaplib.IMAP4.error(f"IDLE hatası: {line!r}")
+                break
+            if _NEW_MAIL_RE.match(line):
+                has_new = True
+
+    return has_new
+
+
+class IdleWorker(threading.Thread):
+    """
+    Tek bir hesap için kalıcı IMAP oturumu tutar.
+    Gelen kutusunda IDLE ile bekler; yeni mail bildirilince aynı oturum
+    üzerinden process_account_inbox çalıştırır. Kopmada yeniden bağlanır.
+    """
+
+    def __init__(self, account):
+        super().__init__(daemon=True, name=f"imap-idle-{account.get('email')}")
+        self.account = account
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        email_user = self.account.get("email")
+        delay = RECONNECT_MIN_DELAY
+
+        while not self.stop_event.is_set():
+            mail = None
+            try:
+                load_dotenv(override=True)
+                mail = connect_account(self.account)
+                if mail is None:
+                    # Şifre/giriş hatası: sunucuyu boşuna yormayalım
+                    self.stop_event.wait(RECONNECT_MAX_DELAY)
+                    continue
+
+                supports_idle = "IDLE" in mail.capabilities
+                if supports_idle:
+                    print(f"📡 {email_user}: IMAP IDLE oturumu açıldı.")
+                else:
+                    print(f"ℹ️ {email_user}: Sunucu IDLE desteklemiyor, {IDLE_FALLBACK_POLL} sn'de bir yoklanacak.")
+
+                # Bağlantı yokken gelmiş olabilecek mailleri hemen yakala
+                process_account_inbox(self.account, mail=mail)
+                delay = RECONNECT_MIN_DELAY
+
+                while not self.stop_event.is_set():
+                    if supports_idle:
+                        has_new = _idle_wait(mail, IDLE_TIMEOUT, self.stop_event)
+                    else:
+                        self.stop_event.wait(IDLE_FALLBACK_POLL)
+                        has_new = True
+
+                    if has_new and not self.stop_event.is_set():
+                        process_account_inbox(self.account, mail=mail)
+                    else:
+                        # Zaman aşımı: oturumun canlı olduğunu doğrula, sonra tekrar IDLE
+                        mail.noop()
+
+            except Exception as e:
+                if self.stop_event.is_set():
+                    break
+                print(f"⚠️ IDLE bağlantısı koptu ({email_user}): {e} -> {delay} sn sonra yeniden bağlanılacak")
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            finally:
+                safe_logout(mail)
+
+        print(f"🛑 {email_user}: IDLE dinleyicisi durdu.")
+
+
+# Hesap ID -> çalışan IdleWorker
+_workers = {}
+# Hesap ID -> durdurulmuş ama henüz bitmemiş IdleWorker (yenisi bu bitince başlar)
+_stopping = {}
+_workers_lock = threading.Lock()
+
+def sync_idle_listeners():
+    """
+    Çalışan IDLE thread'lerini aktif hesap listesiyle eşitler.
+    Yeni eklenen hesaplar için dinleyici başlatır; silinen, pasife alınan
+    veya şifresi değişen hesapların dinleyicisini durdurur/yeniler.
+    Scheduler tarafından periyodik çağrılır.
+    """
+    load_dotenv(override=True)
+    accounts = {str(acc["_id"]): acc for acc in get_active_accounts()}
+
+    with _workers_lock:
+        for key, worker in list(_workers.items()):
+            acc = accounts.get(key)
+            outdated = acc is None or acc.get("password") != worker.account.get("password")
+            if outdated or not worker.is_alive():
+                worker.stop()
+                del _workers[key]
+                _stopping[key] = worker
+        stopping = list(_stopping.values())
+
+    # Eski oturum bitmeden yenisi başlarsa ikisi aynı checkpoint'i ilerletmeye çalışır.
+    # Kilit dışında beklenir: diğer eşitleme / durdurma çağrıları bloklanmasın.
+    for worker in stopping:
+        worker.join(STOP_JOIN_TIMEOUT)
+
+    with _workers_lock:
+        for key, worker in list(_stopping.items()):
+            if worker.is_alive():
+                print(f"⏳ {worker.account.get('email')}: Eski IDLE dinleyicisi hala çalışıyor, yenisi sonraki turda başlatılacak.")
+            else:
+                del _stopping[key]
+
+        for key, acc in accounts.items():
+            if key not in _workers and key not in _stopping:
+                worker = IdleWorker(acc)
+                _workers[key] = worker
+                worker.start()
+
+def stop_idle_listeners():
+    """Tüm IDLE dinleyicilerini durdurur (sunucu kapanırken)."""
+    with _workers_lock:
+        for worker in _workers.values():
+            worker.stop()
+        _workers.clear()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+# Veritabanı Bağlantıları
+from app.database import llm_cache_col
+
+# LLM_CACHE=0 ile tamamen kapatılabilir
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1").strip().lower() not in ("0", "false", "no")
+# Koleksiyonda tutulacak en fazla kayıt (aşılınca en eski kullanılanlar silinir)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Boyut kontrolü her yazmada değil, bu kadar yazmada bir yapılır
+_EVICT_EVERY = 50
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "bypassed": 0, "evicted": 0}
+_writes_since_evict = 0
+
+def cache_key(model: str, prompt: str, fmt, options: dict) -> str:
+    """(model, prompt hash, format, options) -> içerik adresli anahtar (sha256)"""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw = json.dumps(
+        {"model": model, "prompt": prompt_hash, "format": fmt, "options": options or {}},
+        sort_keys=True
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+def get_cached(key: str):
+    """Önbellekteki cevabı döner, yoksa None. Mongo hatası önbelleği atlamak demektir."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        doc = llm_cache_col.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.utcnow()}},
+            projection={"response": 1}
+        )
+    except Exception as e:
+        print(f"⚠️ LLM önbellek okuma hatası: {e}")
+        return None
+
+    if doc is None:
+        _count("misses")
+        return None
+    _count("hits")
+    return doc.get("response")
+
+def store_cached(key: str, model: str, fmt, response: str):
+    """Cevabı önbelleğe yazar (boş cevaplar = hata, saklanmaz)."""
+    global _writes_since_evict
+    if not LLM_CACHE_ENABLED or not response:
+        return
+    now = datetime.utcnow()
+    try:
+        llm_cache_col.update_one(
+            {"_id": key},
+            {"$set": {"model": model, "format": fmt, "response": response,
+                      "created_at": now, "last_hit_at": now},
+             "$setOnInsert": {"hits": 0}},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"⚠️ LLM önbellek yazma hatası: {e}")
+        return
+
+    with _lock:
+        _stats["writes"] += 1
+        _writes_since_evict += 1
+        should_evict = _writes_since_evict >= _EVICT_EVERY
+        if should_evict:
+            _writes_since_evict = 0
+    if should_evict:
+        evict_overflow()
+
+def record_bypass():
+    """Kullanıcı açıkça yeniden üretim istedi (regenerate): okuma atlandı."""
+    _count("bypassed")
+
+def evict_overflow() -> int:
+    """Kayıt sayısı sınırı aştıysa en uzun süredir kullanılmayanları siler."""
+    try:
+        overflow = llm_cache_col.estimated_document_count() - LLM_CACHE_MAX_ENTRIES
+        if overflow <= 0:
+            return 0
+        old_ids = [d["_id"] for d in llm_cache_col.find({}, {"_id": 1}).sort("last_hit_at", 1).limit(overflow)]
+        deleted = llm_cache_col.delete_many({"_id": {"$in": old_ids}}).deleted_count
+    except Exception as e:
+        print(f"⚠️ LLM önbellek temizleme hatası: {e}")
+        return 0
+
+    with _lock:
+        _stats["evicted"] += deleted
+    return deleted
+
+def get_cache_stats() -> dict:
+    """Önbellek sayaçları ve isabet oranı."""
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+    stats["enabled"] = LLM_CACHE_ENABLED
+    return stats
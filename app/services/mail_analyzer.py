@@ -0,0 +1,179 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+
+# Veritabanı Bağlantıları
+from app.database import mails_col, contacts_col, tags_col
+
+# AI Servisleri
+from app.services.mail_classifier import should_reply
+from app.services.reply_generator import generate_reply
+from app.services.extractor import extract_insights_and_tasks, analyze_single_pass
+from app.services.mail_listener import find_thread_tags
+from app.services.ollama_service import is_llm_available, start_rejection_scope, LLMUnavailableError
+from app.utils.body_clean import clean_body, body_for_task
+from app.rag.vector_store import embed_mail, save_mail_vectors
+
+NO_REPLY_DRAFT = "AI bu mail için otomatik cevap gerekmediğini düşündü."
+
+# Tek mailin bağımsız aşamaları (sınıflandırma->taslak, çıkarım, vektör) paralel çalışır.
+# Vektör CPU'da hesaplanırken LLM HTTP beklemeleri üst üste biner.
+# Eşzamanlı LLM çağrısı zaten LLM_MAX_CONCURRENCY ile sınırlı; 1 -> eski seri davranış.
+STAGE_WORKERS = max(1, int(os.getenv("ANALYSIS_STAGE_WORKERS", "6")))
+_stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="analysis-stage")
+
+def is_single_pass() -> bool:
+    """LLM_SINGLE_PASS=1 ise sınıflandırma, çıkarım ve taslak tek LLM çağrısında yapılır."""
+    return os.getenv("LLM_SINGLE_PASS", "0").strip().lower() in ("1", "true", "yes")
+
+def _timed(timings: dict, stage: str, fn, *args, **kwargs):
+    """fn'i çalıştırır, süresini timings[stage] (ms) olarak kaydeder."""
+    start = time.monotonic()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[stage] = round((time.monotonic() - start) * 1000, 1)
+
+def _submit(timings: dict, stage: str, fn, *args, **kwargs):
+    if STAGE_WORKERS == 1:
+        # Seri mod: havuz kullanılmaz, sonuç hazır bir "future" gibi döner
+        future = Future()
+        try:
+            future.set_result(_timed(timings, stage, fn, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    # Bağlam kopyalanır: aşama thread'indeki reddedilen LLM çağrıları analizin kapsamına sayılır
+    return _stage_executor.submit(contextvars.copy_context().run, _timed, timings, stage, fn, *args, **kwargs)
+
+def analyze_mail(mail_id):
+    """
+    Kaydedilmiş (PENDING_ANALYSIS) bir maili AI ile analiz eder ve dokümanı
+    yerinde günceller: sınıflandırma, görev/kategori/etiket çıkarımı,
+    vektör ve cevap taslağı.
+    Hata fırlatırsa analiz kuyruğu işi tekrar dener.
+    """
+    mail = mails_col.find_one({"_id": mail_id})
+    if not mail:
+        # Mail bu arada silinmiş; yapılacak iş yok
+        return
+
+    # LLM sunucusu sağlıksızsa boş cevaplarla analiz üretmek yerine işi ertele
+    if not is_llm_available():
+        raise LLMUnavailableError("LLM devre kesicisi açık")
+    # HALF_OPEN'da tek deneme çağrısı geçer; paralel aşamaların diğerleri reddedilip "" alır
+    llm_scope = start_rejection_scope()
+
+    subject = mail.get("subject", "")
+    # Alıntısız/imzasız gövde; eski kayıtlarda yoksa burada hesaplanıp saklanır
+    if mail.get("body_clean") is None:
+        mail["body_clean"] = clean_body(mail.get("body", ""), mail.get("body_html", ""))
+    sender_email = mail.get("from", "")
+
+    # Rehberdeki ton tercihi
+    contact = contacts_col.find_one({"email": sender_email})
+    tone = contact.get("default_tone", "formal") if contact else "formal"
+
+    print(f"🤖 AI Analizi Yapılıyor: {subject}")
+    available_tags = list(tags_col.find({}, {"_id": 0, "slug": 1, "description": 1}))
+    pre_classifier = mail.get("pre_classifier")
+
+    # Aşama grafiği:
+    #   embedding ──────────────────────────┐
+    #   classify ──(YES)──> reply ──────────┤──> kaydet
+    #   extract ────────────────────────────┘
+    # Tek geçiş modunda classify+extract+reply tek LLM çağrısıdır (analysis).
+    timings = {}
+    total_start = time.monotonic()
+    # Uzun mailler örtüşen parçalar halinde vektörlenir (ilk parça = konu + gövde başı)
+    embedding_future = _submit(timings, "embedding", embed_mail, subject, mail["body_clean"])
+
+    # Header kuralları zaten karar verdiyse tek geçişe gerek yok (tek LLM çağrısı olan extract yeterli).
+    single = None
+    if is_single_pass() and not pre_classifier:
+        single = _timed(
+            timings, "analysis", analyze_single_pass,
+            body_for_task(mail, "analysis"), available_tags=available_tags, tone=tone
+        )
+
+    if single:
+        classify_result = single["classifier"]
+        analysis = single["analysis"]
+        reply_draft = single["reply_draft"] or NO_REPLY_DRAFT
+    else:
+        def classify_then_reply():
+            # 1. Sınıflandırma: Header kuralları kesin karar verdiyse LLM'e hiç gidilmez
+            result = pre_classifier or _timed(
+                timings, "classify", should_reply, body_for_task(mail, "classify")
+            )
+            # 3. Cevap Taslağı: karar YES olur olmaz başlar (otomatik/toplu maillerde üretilmez)
+            if not result["should_reply"]:
+                return result, NO_REPLY_DRAFT
+            return result, _timed(timings, "reply", generate_reply, body_for_task(mail, "reply"), tone=tone)
+
+        reply_future = _submit(timings, "classify_reply", classify_then_reply)
+        # 2. AI Analizi (sınıflandırmadan bağımsız)
+        extract_future = _submit(
+            timings, "extract", extract_insights_and_tasks,
+            body_for_task(mail, "extract"), available_tags=available_tags
+        )
+        analysis = extract_future.result()
+        classify_result, reply_draft = reply_future.result()
+
+    # 4. Vektör (LLM aşamalarıyla paralel hesaplandı)
+    mail_vectors = embedding_future.result()
+    timings["total"] = round((time.monotonic() - total_start) * 1000, 1)
+    timings.pop("classify_reply", None)
+
+    thread_tags = find_thread_tags(mail.get("in_reply_to", ""), mail.get("references", []))
+    analysis_tags = analysis.get("tags", []) if isinstance(analysis.get("tags", []), list) else []
+    tags_for_mail = thread_tags if thread_tags else analysis_tags
+
+    # Analiz sırasında LLM düştüyse veya bir aşama reddedildiyse sonuçlar boş cevaplardan
+    # üretilmiştir (deneme çağrısı başarılı olup kesici kapansa bile): kaydetme, ertele
+    if llm_scope["rejected"]:
+        raise LLMUnavailableError(f"Analiz sırasında {llm_scope['rejected']} LLM çağrısı reddedildi")
+    if not is_llm_available():
+        raise LLMUnavailableError("Analiz sırasında LLM devre kesicisi açıldı")
+
+    # Analiz sonucunu mail dokümanına yaz
+    mails_col.update_one(
+        {"_id": mail_id},
+        {"$set": {
+            "category": analysis.get('category', 'Diğer'),
+            "urgency_score": analysis.get('urgency_score', 0),
+            "tags": tags_for_mail,
+            "classifier": classify_result,
+            "extracted_task": analysis.get('task') if analysis.get('task') else None,
+            "body_clean": mail["body_clean"],
+            "analysis_timings": timings,
+            "analyzed_at": datetime.utcnow(),
+        }, "$unset": {"analysis_error": ""}}
+    )
+
+    # Vektör mails yerine yan koleksiyona (VECTOR_STORAGE)
+    save_mail_vectors(mail_id, mail_vectors, user_email=mail.get("user_email", ""))
+
+    # Kullanıcı bu arada editörde taslak yazdıysa/ürettiyse üzerine yazma
+    mails_col.update_one(
+        {"_id": mail_id, "reply_draft": {"$in": [None, ""]}},
+        {"$set": {"reply_draft": reply_draft}}
+    )
+
+    # Kullanıcı maili bu arada cevapladı/iptal ettiyse durumuna dokunma
+    mails_col.update_one(
+        {"_id": mail_id, "status": "PENDING_ANALYSIS"},
+        {"$set": {"status": "WAITING_APPROVAL"}}
+    )
+
+    # Insight'ı rehbere sadece ilk başarılı analizde ekle (tekrar denemede çoğalmasın)
+    if analysis.get('insight') and not mail.get("analyzed_at"):
+        contacts_col.update_one(
+            {"email": sender_email},
+            {"$push": {"ai_notes": analysis['insight']}}
+        )
+
+    stages = ", ".join(f"{k}={v / 1000:.1f}s" for k, v in timings.items())
+    print(f"✅ Analiz tamamlandı: {subject} ⏱️ {stages}")
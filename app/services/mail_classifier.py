@@ -1,6 +1,92 @@
+import re
+from email.utils import parseaddr
+from typing import Optional
+
 # LLM ile konuşmak için Ollama servis fonksiyonunu import ediyoruz
 from app.services.ollama_service import ask_llm
 
+# --- KURAL TABANLI ÖN SINIFLANDIRICI (LLM'den önce, sadece header'lar) ---
+
+# noreply@, no-reply@, donotreply@, mailer-daemon@, bounce@ ... gibi gönderenler
+_NOREPLY_RE = re.compile(
+    r"^(?:no[-_.]?reply|do[-_.]?not[-_.]?reply|mailer[-_.]?daemon|postmaster|bounces?|notifications?)"
+    r"(?:[-_.+].*)?$",
+    re.IGNORECASE
+)
+
+# Toplu gönderim servislerinin (ESP) eklediği header'lar
+_ESP_HEADERS = (
+    "X-Mailgun-Sid", "X-Mailgun-Tag", "X-SG-EID", "X-SG-ID", "X-SES-Outgoing",
+    "X-MC-User", "X-Mailchimp-Campaign", "X-Campaign", "X-CampaignID", "X-Mandrill-User",
+    "X-Marketo", "X-HubSpot-Message-Id", "X-Sendinblue-Id", "X-Mailjet-Campaign",
+    "X-Postmark-Message-Id", "X-CSA-Complaints",
+)
+# Feedback-ID (Gmail/SES/Postmark) ve X-Auto-Response-Suppress (Outlook/Exchange) insan
+# maillerinde de bulunur; kesin "cevaplama" sinyali sayılmaz, karar LLM'e kalır.
+
+
+def _is_noreply(address: str) -> bool:
+    local = (address or "").split("@")[0]
+    return bool(local) and bool(_NOREPLY_RE.match(local))
+
+
+def pre_classify(headers, sender_email: str = "") -> Optional[dict]:
+    """
+    Mailin cevap gerektirip gerektirmediğini SADECE header'lardan anlamaya çalışır.
+    Otomatik / toplu mail kesin ise LLM'e gitmeden karar verir; emin değilse None döner
+    (karar should_reply ile LLM'e kalır).
+
+    headers: email.message.Message veya {header: değer} sözlüğü
+    return:
+    {
+        "should_reply": False,
+        "decision": "NO",
+        "raw_output": "",
+        "source": "rules",
+        "reason": "AUTO_SUBMITTED" | "PRECEDENCE_BULK" | "MAILING_LIST" |
+                  "ESP_HEADER" | "NOREPLY_SENDER"
+    } veya None
+    """
+    if headers is None:
+        return None
+
+    def header(name):
+        value = headers.get(name)
+        return str(value).strip() if value is not None else ""
+
+    reason = None
+
+    # RFC 3834: "no" dışındaki her değer otomatik üretilmiş mail demek
+    auto_submitted = header("Auto-Submitted").lower()
+    if auto_submitted and auto_submitted != "no":
+        reason = "AUTO_SUBMITTED"
+
+    elif header("Precedence").lower() in ("bulk", "list", "junk"):
+        reason = "PRECEDENCE_BULK"
+
+    elif header("List-Unsubscribe") or header("List-Id"):
+        reason = "MAILING_LIST"
+
+    elif any(header(h) for h in _ESP_HEADERS):
+        reason = "ESP_HEADER"
+
+    elif _is_noreply(sender_email):
+        # noreply@ adresinden gelip insan bir Reply-To veriyorsa emin değiliz
+        _, reply_to = parseaddr(header("Reply-To"))
+        if not reply_to or _is_noreply(reply_to):
+            reason = "NOREPLY_SENDER"
+
+    if not reason:
+        return None
+
+    return {
+        "should_reply": False,
+        "decision": "NO",
+        "raw_output": "",
+        "source": "rules",
+        "reason": reason
+    }
+
 
 def should_reply(mail_text: str) -> dict:
     """
@@ -35,7 +121,7 @@ RESPONSE:
 """
 
     # LLM çağrısı
-    result = ask_llm(prompt)
+    result = ask_llm(prompt, task="classify")
 
     # Fail-safe: model boş / None / patlak cevap dönerse
     # Risk almıyoruz → cevap yaz
@@ -8,25 +8,28 @@ import base64
 import re
 import time
 from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError
 
 # Veritabanı Bağlantıları
 from app.database import mails_col, contacts_col, users_col, accounts_col, tasks_col, tags_col
+from app.services.account_scanner import get_active_accounts, scan_accounts
 
-# AI Servisleri
-from app.services.mail_classifier import should_reply
-from app.services.reply_generator import generate_reply
-from app.services.extractor import extract_insights_and_tasks
+# AI Analiz Kuyruğu (LLM işleri ingest'i bekletmez)
+from app.services.analysis_queue import enqueue_analysis
+from app.services.mail_classifier import pre_classify
+from app.utils.body_clean import clean_body
+from app.rag.search_cache import invalidate_results
 from app.models.contact_model import create_contact
 
-# YENİ EKLENEN: Semantik Arama İçin Vektör Motoru
-try:
-    from app.rag.embeddings import get_embedding
-except ImportError:
-    # Eğer model henüz inmemişse hata vermesin, boş liste dönsün
-    def get_embedding(text): return []
+# IMAP Bağlantı Yardımcıları ve Senkron Checkpoint'leri
+from app.services.imap_client import connect_account, safe_logout, select_folder, uid_search
+from app.services.mail_parser import fetch_messages, fetch_header_fields, build_mail_content
+from app.services.sync_state import (
+    get_checkpoint, reset_checkpoint, advance_checkpoint,
+    record_failed_uid, save_mailbox_state, MAX_UID_ATTEMPTS
+)
 
-# Güvenlik
-from app.core.security import decrypt_password
+INBOX_FOLDER = "INBOX"
 
 def _normalize_mid(value: str) -> str:
     return (value or "").strip().strip("<>").strip()
@@ -38,13 +41,26 @@ def _mid_variants(value: str) -> list:
     variants = {value.strip(), clean, f"<{clean}>"}
     return [v for v in variants if v]
 
+def _known_message_ids(message_ids) -> set:
+    """
+    Verilen Message-ID'lerden veritabanında zaten kayıtlı olanları TEK sorguda bulur.
+    return: Kayıtlı olanların normalize edilmiş (<> siz) halleri
+    """
+    variants = set()
+    for mid in message_ids:
+        variants.update(_mid_variants(mid))
+    if not variants:
+        return set()
+    cursor = mails_col.find({"message_id": {"$in": list(variants)}}, {"_id": 0, "message_id": 1})
+    return {_normalize_mid(doc.get("message_id")) for doc in cursor}
+
 def _find_mail_by_message_id(message_id: str):
     mids = _mid_variants(message_id)
     if not mids:
         return None
     return mails_col.find_one({"message_id": {"$in": mids}})
 
-def _find_thread_tags(in_reply_to: str, references: list) -> list:
+def find_thread_tags(in_reply_to: str, references: list) -> list:
     """
     Thread'e bağlı yeni bir mail gelirse, zincirin tag'lerini sabitlemek için
     daha önce kaydedilmiş bir parent/root mailin tag'lerini döndürür.
@@ -76,265 +92,231 @@ def decode_mime_words(s):
         for word, encoding in decode_header(s)
     )
 
-def process_account_inbox(account):
-    """Tek bir HESABIN (Account) gelen kutusunu kontrol eder ve AI ile analiz yapar"""
+def _ingest_message(fetched: dict, account, email_user: str):
+    """
+    Toplu fetch ile gelen tek bir maili PENDING_ANALYSIS durumunda kaydeder
+    ve AI analizi için kuyruğa ekler.
+    return: yeni kayıt eklendiyse True
+    """
+    msg = fetched["headers"]
+
+    # Başlık ve Gönderen Bilgileri
+    subject = decode_mime_words(msg["Subject"] or "")
+    sender_name, sender_email = parseaddr(msg.get("From"))
+
+    # KENDİNE GÖNDERİLEN MAİLLERİ ATLA
+    if sender_email.lower() == email_user.lower():
+        print(f"⏭️ Kendine gönderilen mail, Sent Listener'a bırakılıyor: {subject}")
+        return False
+
+    message_id = msg.get("Message-ID", "").strip() # Message-ID çekiyoruz
+
+    # Eğer Message-ID yoksa (çok nadir), benzersiz bir ID üretelim
+    if not message_id:
+         import uuid
+         message_id = f"gen-{uuid.uuid4()}"
+
+    # Threading header'ları (Reply zinciri için kritik)
+    in_reply_to = (msg.get("In-Reply-To") or "").strip()
+    references_header = msg.get("References") or ""
+    references = references_header.split() if references_header else []
+
+    # --- BODYSTRUCTURE Tabanlı Parsing (Ek boyutları yapıdan gelir) ---
+    content = build_mail_content(fetched["parts"], fetched["texts"], message_id)
+    body_text = content["body_text"]
+    body_html = content["body_html"]
+    attachments = content["attachments"] # Ek dosyalar (metadata)
+
+    # AI ve Özet için temiz metin
+    body = body_text.strip()
+    if not body and body_html:
+        body = re.sub('<[^<]+?>', '', body_html).strip()
+    # LLM/embedding için alıntısız, imzasız gövde (bir kez hesaplanır, analizde tekrar kullanılır)
+    body_clean = clean_body(body_text.strip(), body_html)
+
+    # Rehber Kontrolü
+    contact = contacts_col.find_one({"email": sender_email})
+    if not contact:
+        contacts_col.insert_one(create_contact({
+            "email": sender_email, 
+            "name": sender_name if sender_name else sender_email.split("@")[0],
+            "owner_account": email_user
+        }))
+
+    # Header'lardan otomatik/toplu mail tespiti (LLM'siz). Eşleşirse analizde
+    # should_reply ve generate_reply atlanır.
+    pre_classifier = pre_classify(msg, sender_email)
+
+    # Ana Mail Kaydı: AI analizi beklenmeden hemen kaydedilir, UI'da görünür.
+    # Sınıflandırma, görev çıkarımı, vektör ve taslak analiz kuyruğunda doldurulur.
+    mail_doc = {
+        "message_id": message_id,
+        "in_reply_to": in_reply_to,
+        "references": references,
+        "user_email": email_user,
+        "account_id": str(account["_id"]),
+        "from": sender_email,
+        "subject": subject,
+        "subject_normalized": subject.lower(),
+        "body": body,
+        "body_clean": body_clean,
+        "body_html": body_html if body_html else body,
+        "category": "Diğer",
+        "urgency_score": 0,
+        "tags": find_thread_tags(in_reply_to, references),
+        "status": "PENDING_ANALYSIS", 
+        "pre_classifier": pre_classifier,
+        "created_at": datetime.utcnow(),
+
+        # Ekler (Base64 yok, sadece link var!)
+        "attachments": attachments,
+    }
+
+    # Upsert: Checkpoint yazılmadan çökülürse aynı mail ikinci kez eklenmesin.
+    # Eşzamanlı iki tarama aynı anda eklemeye çalışırsa benzersiz indeks birini reddeder.
+    try:
+        result = mails_col.update_one({"message_id": message_id}, {"$setOnInsert": mail_doc}, upsert=True)
+    except DuplicateKeyError:
+        print(f"⏭️ Mail başka bir tarama tarafından kaydedildi: {subject}")
+        return False
+    if result.upserted_id is not None:
+        enqueue_analysis(result.upserted_id)
+    print(f"📥 Mail Kaydedildi (Analiz kuyruğunda): {subject} -> {email_user}")
+    return result.upserted_id is not None
+
+
+def process_account_inbox(account, mail=None):
+    """
+    Tek bir HESABIN (Account) gelen kutusunu kontrol eder, yeni mailleri kaydedip analiz kuyruğuna ekler.
+
+    UID/UIDVALIDITY checkpoint'i ile çalışır: her turda sadece son işlenen
+    UID'den sonraki mailler istenir. İlk senkronda veya UIDVALIDITY
+    değiştiğinde okunmamış (UNSEEN) maillerden başlanır.
+
+    mail: Açık bir IMAP oturumu (IDLE dinleyicisi) verilirse yeniden bağlanılmaz
+    ve oturum kapatılmaz; verilmezse her çağrıda yeni bağlantı açılır.
+    """
     
     # 1. KRİTİK: .env dosyasını her döngüde zorla tazele
     load_dotenv(override=True) 
     
     email_user = account.get("email")
+    account_id = str(account["_id"])
     print(f"🔍 {email_user} hesabı kontrol ediliyor...")
+
+    # Oturum dışarıdan geldiyse sahibi çağıran taraftır (logout yapmayız)
+    owns_session = mail is None
     
     try:
-        # Şifre çekme (Accounts tablosundan)
-        enc_pass = account.get("password")
-        
-        if not enc_pass: 
-            print(f"❌ {email_user} için veritabanında şifre bulunamadı.")
-            return
-        
-        # Şifreyi çözüyoruz
-        try:
-            if not os.getenv("ENCRYPTION_KEY"):
-                print("🚨 KRİTİK HATA: .env dosyasında ENCRYPTION_KEY hala eksik!")
+        if owns_session:
+            mail = connect_account(account)
+            if mail is None:
                 return
-            
-            email_pass = decrypt_password(enc_pass)
-        except Exception as e:
-            print(f"❌ Şifre çözme hatası ({email_user}): Anahtar uyuşmazlığı. {e}")
-            return
-        
-        # IMAP Bağlantısı (Şimdilik Gmail - İleride Provider'a göre değişebilir)
-        host = "imap.gmail.com" # Varsayılan
-        if account.get("provider") == "outlook": host = "outlook.office365.com" # Örnek
-        
-        mail = imaplib.IMAP4_SSL(host)
-        try:
-            mail.login(email_user, email_pass)
-        except imaplib.IMAPAuthenticationError:
-            print(f"⛔ Giriş Başarısız: {email_user} (Şifre Yanlış veya İzin Yok)")
-            return
 
-        mail.select("inbox")
-
-        # Sadece OKUNMAMIŞ mailler (UNSEEN)
-        status, messages = mail.search(None, "UNSEEN")
-        mail_ids = messages[0].split()
-
-        if not mail_ids:
+        box = select_folder(mail, INBOX_FOLDER)
+        checkpoint = get_checkpoint(account_id, INBOX_FOLDER)
+
+        bootstrap = not checkpoint or checkpoint.get("uidvalidity") != box["uidvalidity"]
+        if bootstrap:
+            if checkpoint:
+                print(f"♻️ {email_user}: UIDVALIDITY değişti, checkpoint sıfırlanıyor.")
+            # İlk senkron: eski davranıştaki gibi sadece OKUNMAMIŞ mailler
+            uids = uid_search(mail, "UNSEEN")
+            last_uid = (box["uidnext"] - 1) if box["uidnext"] else max(uids or [0])
+            reset_checkpoint(
+                account_id, INBOX_FOLDER, box["uidvalidity"], last_uid,
+                box["highestmodseq"], pending_uids=uids
+            )
+        else:
+            last_uid = checkpoint.get("last_uid", 0)
+            retry_uids = sorted(int(u) for u in (checkpoint.get("pending_uids") or {}))
+
+            # CONDSTORE: Kutuda hiçbir şey değişmediyse sunucuya soru bile sorma
+            unchanged = (
+                box["highestmodseq"] is not None
+                and box["highestmodseq"] == checkpoint.get("highestmodseq")
+            )
+            no_new_uid = box["uidnext"] is not None and box["uidnext"] <= last_uid + 1
+
+            new_uids = []
+            if not (unchanged or no_new_uid):
+                # "n:*" aralığı yeni mail yokken son maili döndürür, o yüzden filtreliyoruz
+                new_uids = [u for u in uid_search(mail, "UID", f"{last_uid + 1}:*") if u > last_uid]
+            uids = retry_uids + new_uids
+
+        if not uids:
             # print(f"📭 Yeni mail yok: {email_user}") # Log kirliliği yapmasın diye kapalı
-            mail.logout()
+            save_mailbox_state(account_id, INBOX_FOLDER, box["highestmodseq"])
+            if owns_session: mail.logout()
             return 
 
-        print(f"📬 {email_user}: {len(mail_ids)} Yeni Mail Bulundu!")
+        # Çifte Kayıt Kontrolü (gövde inmeden ÖNCE):
+        # Tüm adayların Message-ID'si tek IMAP komutuyla, DB kontrolü tek $in sorgusuyla yapılır.
+        # Checkpoint kaybı / yeniden tarama durumunda kayıtlı mailler boşuna indirilmez.
+        header_map = fetch_header_fields(mail, uids, ["MESSAGE-ID"])
+        known = _known_message_ids(h.get("Message-ID", "") for h in header_map.values())
+        known_uids = {
+            uid for uid, header in header_map.items()
+            if _normalize_mid(header.get("Message-ID", "")) in known
+        }
+        for uid in known_uids:
+            advance_checkpoint(account_id, INBOX_FOLDER, uid)
+        if known_uids:
+            print(f"⏭️ {email_user}: {len(known_uids)} mail zaten kayıtlı, atlanıyor.")
+        uids = [u for u in uids if u not in known_uids]
+
+        if not uids:
+            save_mailbox_state(account_id, INBOX_FOLDER, box["highestmodseq"])
+            if owns_session: mail.logout()
+            return
+
+        print(f"📬 {email_user}: {len(uids)} Yeni Mail Bulundu!")
 
-        for mail_id in mail_ids:
+        # Toplu fetch: Header + BODYSTRUCTURE ve metin parçaları parti başına birkaç komutta gelir.
+        # BODY.PEEK: Fetch işlemi maili \Seen yapmasın (kullanıcının okunmamışları bozulmasın)
+        seen_uids = set()
+        inserted = 0
+        for fetched in fetch_messages(mail, uids):
+            uid = fetched["uid"]
+            seen_uids.add(uid)
             try:
-                _, msg_data = mail.fetch(mail_id, "(RFC822)")
-                msg = email.message_from_bytes(msg_data[0][1])
-
-                # Başlık ve Gönderen Bilgileri
-                subject = decode_mime_words(msg["Subject"] or "")
-                sender_name, sender_email = parseaddr(msg.get("From"))
-                
-                # KENDİNE GÖNDERİLEN MAİLLERİ ATLA
-                if sender_email.lower() == email_user.lower():
-                    print(f"⏭️ Kendine gönderilen mail, Sent Listener'a bırakılıyor: {subject}")
-                    continue
-                
-                message_id = msg.get("Message-ID", "").strip() # Message-ID çekiyoruz
-
-                # Eğer Message-ID yoksa (çok nadir), benzersiz bir ID üretelim
-                if not message_id:
-                     import uuid
-                     message_id = f"gen-{uuid.uuid4()}"
-
-                # Threading header'ları (Reply zinciri için kritik)
-                in_reply_to = (msg.get("In-Reply-To") or "").strip()
-                references_header = msg.get("References") or ""
-                references = references_header.split() if references_header else []
-
-                # --- Gelişmiş Parsing (Stream Destekli - HIZLI MOD) ---
-                body_text = ""
-                body_html = ""
-                cid_map = {} # cid -> stream_url
-                attachments = [] # Ek dosyalar (metadata)
-
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        ctype = part.get_content_type()
-                        cdisp = str(part.get("Content-Disposition"))
-                        content_id = part.get("Content-ID")
-                        
-                        # Payload decode (Sadece TEXT ise indir, dosya ise İNDİRME!)
-                        try:
-                            if ctype.startswith("text/"):
-                                part_data = part.get_payload(decode=True)
-                                payload = part_data.decode(errors="ignore")
-                            else:
-                                # HIZ İÇİN: Dosya içeriğini belleğe alma!
-                                part_data = None 
-                                payload = ""
-                        except:
-                            part_data = None
-                            payload = ""
-
-                        # 1. INLINE RESİMLER (CID) -> STREAM URL
-                        # Base64 YERİNE sadece stream linki oluşturuyoruz
-                        if content_id and ctype.startswith("image/"):
-                            clean_cid = content_id.strip("<> ")
-                            if clean_cid:
-                                # Bu link, ui.py'de yapacağımız yönlendirme ile anlık çalışacak
-                                stream_url = f"/ui/stream/{message_id}/{clean_cid}"
-                                cid_map[clean_cid] = stream_url
-
-                        # 2. ATTACHMENTS (EK DOSYALAR) -> DOWNLOAD LINK
-                        # Dosyayı indirmiyoruz, sadece varlığını kaydediyoruz
-                        if "attachment" in cdisp or part.get_filename():
-                            filename = part.get_filename()
-                            if filename:
-                                try:
-                                    filename = decode_mime_words(filename)
-                                    # Buraya dikkat: Base64 yok! Dosya verisi yok!
-                                    attachments.append({
-                                        "filename": filename,
-                                        "content_type": ctype,
-                                        "size": 0, # Hız için 0 bırakıyoruz, istenirse headerdan okunabilir
-                                        "url": f"/ui/download/{message_id}/{filename}" # İndirme linki
-                                    })
-                                except Exception as e:
-                                    print(f"Attachment parse error: {e}")
-
-                        if ctype == "text/plain" and "attachment" not in cdisp:
-                            body_text += payload
-                        elif ctype == "text/html" and "attachment" not in cdisp:
-                            body_html += payload
-                else:
-                    # Tek parça
-                    try: 
-                        payload = msg.get_payload(decode=True).decode(errors="ignore")
-                        if msg.get_content_type() == "text/html":
-                            body_html = payload
-                        else:
-                            body_text = payload
-                    except:
-                        pass
-
-                # HTML içindeki cid referanslarını Stream URL ile değiştir
-                if body_html and cid_map:
-                    for cid, stream_url in cid_map.items():
-                        # src="cid:..." -> src="/ui/stream/..."
-                        body_html = body_html.replace(f"cid:{cid}", stream_url)
-
-                # AI ve Özet için temiz metin
-                body = body_text.strip()
-                if not body and body_html:
-                    body = re.sub('<[^<]+?>', '', body_html).strip()
-
-                # Çifte Kayıt Kontrolü
-                exists = mails_col.find_one({"message_id": message_id})
-                if exists:
-                    print(f"⚠️ Mail zaten kayıtlı (ID: {message_id}), atlanıyor.")
+                if fetched.get("error"):
+                    # Bozuk FETCH/BODYSTRUCTURE veya gövde çekilemedi: boş gövdeyle kaydetme
+                    raise ValueError(fetched["error"])
+                inserted += bool(_ingest_message(fetched, account, email_user))
+                advance_checkpoint(account_id, INBOX_FOLDER, uid)
+            except Exception as e:
+                print(f"⚠️ Mail işleme hatası (UID {uid}): {e}")
+                if record_failed_uid(account_id, INBOX_FOLDER, uid):
                     continue
+                print(f"⏭️ UID {uid} {MAX_UID_ATTEMPTS} denemede işlenemedi, atlanıyor.")
+                advance_checkpoint(account_id, INBOX_FOLDER, uid)
 
-                # 1. AI Sınıflandırma
-                classify_result = should_reply(body)
-                
-                # 2. Rehber Kontrolü
-                contact = contacts_col.find_one({"email": sender_email})
-                tone = contact.get("default_tone", "formal") if contact else "formal"
-                
-                if not contact:
-                    contacts_col.insert_one(create_contact({
-                        "email": sender_email, 
-                        "name": sender_name if sender_name else sender_email.split("@")[0],
-                        "owner_account": email_user
-                    }))
-
-                # 3. AI Analizi
-                print(f"🤖 AI Analizi Yapılıyor: {subject}")
-                available_tags = list(tags_col.find({}, {"_id": 0, "slug": 1, "description": 1}))
-                analysis = extract_insights_and_tasks(body, available_tags=available_tags)
-                
-                thread_tags = _find_thread_tags(in_reply_to, references)
-                analysis_tags = analysis.get("tags", []) if isinstance(analysis.get("tags", []), list) else []
-                tags_for_mail = thread_tags if thread_tags else analysis_tags
-
-                if analysis.get('insight'):
-                    contacts_col.update_one(
-                        {"email": sender_email},
-                        {"$push": {"ai_notes": analysis['insight']}}
-                    )
-                
-                # Vektör Oluşturma
-                full_text_for_vector = f"{subject} {body}"
-                vector_embedding = get_embedding(full_text_for_vector)
-
-                # 4. Ana Mail Kaydı
-                mail_doc = {
-                    "message_id": message_id,
-                    "in_reply_to": in_reply_to,
-                    "references": references,
-                    "user_email": email_user,
-                    "account_id": str(account["_id"]),
-                    "from": sender_email,
-                    "subject": subject,
-                    "subject_normalized": subject.lower(),
-                    "body": body,
-                    "body_html": body_html if body_html else body,
-                    "category": analysis.get('category', 'Diğer'),
-                    "urgency_score": analysis.get('urgency_score', 0),
-                    "tags": tags_for_mail,
-                    "status": "WAITING_APPROVAL", 
-                    "classifier": classify_result,
-                    "extracted_task": analysis.get('task') if analysis.get('task') else None,
-                    "created_at": datetime.utcnow(),
-                    
-                    # Ekler (Base64 yok, sadece link var!)
-                    "attachments": attachments,
-                    
-                    "embedding": vector_embedding 
-                }
-
-                if classify_result["should_reply"]:
-                    mail_doc["reply_draft"] = generate_reply(body, tone=tone)
-                else:
-                    mail_doc["reply_draft"] = "AI bu mail için otomatik cevap gerekmediğini düşündü."
-                
-                mails_col.insert_one(mail_doc)
-                print(f"📥 Mail Kaydedildi (Stream Modu): {subject} -> {email_user}")
+        # Yeni mailler kelime aramasında hemen bulunabilir: önbellekteki sonuçlar eskidi (parti başına bir kez)
+        if inserted:
+            invalidate_results()
 
-            except Exception as e:
-                print(f"⚠️ Mail işleme hatası: {e}")
+        # Sunucuda artık olmayan (bu arada silinmiş) UID'ler bekletilmesin
+        for uid in set(uids) - seen_uids:
+            advance_checkpoint(account_id, INBOX_FOLDER, uid)
+
+        save_mailbox_state(account_id, INBOX_FOLDER, box["highestmodseq"])
         
-        mail.logout()
+        if owns_session: mail.logout()
     except Exception as e:
         print(f"🚨 IMAP Genel Hata ({email_user}): {e}")
+        if owns_session: safe_logout(mail)
+        else: raise
 
 def check_all_inboxes():
-    """Veritabanındaki TÜM aktif hesapları (Accounts) tarar"""
+    """Veritabanındaki TÜM aktif hesapları (Accounts) paralel tarar"""
     load_dotenv(override=True)
     
-    active_accounts = list(accounts_col.find({"is_active": True}))
-    
-    if not active_accounts:
-        active_users = list(users_col.find({"is_active": True}))
-        if active_users:
-            print("ℹ️ Accounts tablosu boş, eski User tablosuna bakılıyor...")
-            for user in active_users:
-                temp_account = {
-                    "_id": user["_id"],
-                    "email": user["email"],
-                    "password": user["app_password"],
-                    "provider": "gmail"
-                }
-                process_account_inbox(temp_account)
-            return
+    active_accounts = get_active_accounts()
 
     if not active_accounts:
         print("ℹ️ Hiç aktif hesap bulunamadı, kurulum bekleniyor...")
         return
 
     print(f"🔄 Toplam {len(active_accounts)} hesap taranıyor...")
-    for account in active_accounts:
-        process_account_inbox(account)
\ No newline at end of file
+    scan_accounts(active_accounts, process_account_inbox, kind="inbox")
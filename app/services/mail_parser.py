@@ -0,0 +1,303 @@
+import base64
+import binascii
+import email
+import os
+import quopri
+from email.header import decode_header
+
+from app.services.imap_client import parse_fetch_response, fetch_item, compress_uid_set
+
+# Tek FETCH komutunda istenecek en fazla mail sayısı
+FETCH_BATCH_SIZE = int(os.getenv("IMAP_FETCH_BATCH_SIZE", "50"))
+
+# Gövde olarak indirilecek parçalar (ekler ve resimler ASLA indirilmez)
+BODY_TYPES = ("text/plain", "text/html")
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+def _decode_mime_words(s):
+    return u''.join(
+        word.decode(encoding or 'utf-8', errors="replace") if isinstance(word, bytes) else word
+        for word, encoding in decode_header(s)
+    )
+
+def _params(raw) -> dict:
+    """BODYSTRUCTURE parametre listesini ("CHARSET" "utf-8" ...) sözlüğe çevirir."""
+    if not isinstance(raw, list):
+        return {}
+    return {_text(raw[i]).lower(): _text(raw[i + 1]) for i in range(0, len(raw) - 1, 2)}
+
+def _estimate_decoded_size(size: int, encoding: str) -> int:
+    """
+    BODYSTRUCTURE boyutu kodlanmış (encoded) boyuttur.
+    Base64'te 78 baytlık her satır (76 karakter + CRLF) 57 bayt veri taşır.
+    """
+    if encoding == "base64":
+        return size * 57 // 78
+    return size
+
+def _leaf_info(node: list, section: str) -> dict:
+    ctype = f"{_text(node[0]).lower()}/{_text(node[1]).lower()}"
+    params = _params(node[2])
+    encoding = _text(node[5]).lower() if len(node) > 5 else ""
+    try:
+        size = int(node[6]) if len(node) > 6 and node[6] is not None else 0
+    except (TypeError, ValueError):
+        size = 0
+
+    # Extension alanlarının başladığı index gövde tipine göre değişir (RFC 3501)
+    if ctype.startswith("text/"):
+        disp_index = 9
+    elif ctype == "message/rfc822":
+        disp_index = 11
+    else:
+        disp_index = 8
+
+    disposition, disp_params = None, {}
+    if len(node) > disp_index and isinstance(node[disp_index], list) and node[disp_index]:
+        disposition = _text(node[disp_index][0]).lower()
+        if len(node[disp_index]) > 1:
+            disp_params = _params(node[disp_index][1])
+
+    filename = disp_params.get("filename") or params.get("name")
+    content_id = _text(node[3]).strip("<> ") if len(node) > 3 and node[3] else ""
+
+    return {
+        "section": section,
+        "content_type": ctype,
+        "charset": params.get("charset") or "utf-8",
+        "encoding": encoding,
+        "size": _estimate_decoded_size(size, encoding),
+        "content_id": content_id,
+        "disposition": disposition,
+        "filename": _decode_mime_words(filename) if filename else None,
+    }
+
+def _walk(node: list, section: str, parts: list):
+    if not node:
+        return
+
+    # Multipart: önce alt gövdeler (liste) gelir, sonra subtype
+    if isinstance(node[0], list):
+        index = 0
+        for child in node:
+            if not isinstance(child, list):
+                break
+            index += 1
+            _walk(child, f"{section}.{index}" if section else str(index), parts)
+        return
+
+    leaf_section = section or "1"
+    part = _leaf_info(node, leaf_section)
+    parts.append(part)
+
+    # İletilen mail (message/rfc822): eski msg.walk() gibi iç parçalara da in
+    if part["content_type"] == "message/rfc822" and len(node) > 8 and isinstance(node[8], list):
+        inner = node[8]
+        if inner and isinstance(inner[0], list):
+            _walk(inner, leaf_section, parts)
+        else:
+            _walk(inner, f"{leaf_section}.1", parts)
+
+def parse_bodystructure(tree) -> list:
+    """
+    BODYSTRUCTURE ağacını düz parça listesine çevirir.
+    Her parça: {section, content_type, charset, encoding, size, content_id, disposition, filename}
+    """
+    parts = []
+    if isinstance(tree, list):
+        _walk(tree, "", parts)
+    return parts
+
+def decode_part(data: bytes, encoding: str, charset: str) -> str:
+    """Transfer encoding (base64 / quoted-printable) ve charset çözümü yapar."""
+    if not data:
+        return ""
+    try:
+        if encoding == "base64":
+            data = base64.b64decode(data)
+        elif encoding == "quoted-printable":
+            data = quopri.decodestring(data)
+    except (binascii.Error, ValueError):
+        pass
+
+    try:
+        return data.decode(charset or "utf-8", errors="ignore")
+    except LookupError:
+        # Bilinmeyen charset -> utf-8 ile dene
+        return data.decode("utf-8", errors="ignore")
+
+def body_sections(parts: list) -> list:
+    """İndirilmesi gereken (ek olmayan) text/plain ve text/html parçaları."""
+    return [
+        p for p in parts
+        if p["content_type"] in BODY_TYPES and p["disposition"] != "attachment"
+    ]
+
+# Bozuk FETCH / BODYSTRUCTURE cevabında ayrıştırıcıların fırlatabileceği hatalar
+_PARSE_ERRORS = (ValueError, IndexError, TypeError, AttributeError)
+
+def _fetch_structures(mail, uids: list, messages: dict, failed: dict):
+    """
+    UID'lerin header + BODYSTRUCTURE bilgisini çeker, messages'a ekler.
+    Parti cevabı ayrıştırılamazsa UID'ler tek tek denenir: bozuk mail diğerlerini engellemesin.
+    Ayrıştırılamayan UID'ler failed'e {uid: hata} olarak yazılır.
+    """
+    _, data = mail.uid("FETCH", compress_uid_set(uids), "(UID BODY.PEEK[HEADER] BODYSTRUCTURE)")
+    try:
+        items = parse_fetch_response(data)
+    except _PARSE_ERRORS as e:
+        if len(uids) == 1:
+            failed[uids[0]] = f"FETCH cevabı ayrıştırılamadı: {e}"
+            return
+        for uid in uids:
+            _fetch_structures(mail, [uid], messages, failed)
+        return
+
+    for item in items:
+        # Sunucunun araya kattığı FLAGS bildirimleri gibi eksik cevapları atla
+        if "UID" not in item or "BODYSTRUCTURE" not in item:
+            continue
+        try:
+            parts = parse_bodystructure(item.get("BODYSTRUCTURE"))
+        except _PARSE_ERRORS as e:
+            failed[item["UID"]] = f"BODYSTRUCTURE ayrıştırılamadı: {e}"
+            continue
+        messages[item["UID"]] = {
+            "uid": item["UID"],
+            "headers": email.message_from_bytes(fetch_item(item, "BODY[HEADER") or b""),
+            "parts": parts,
+            "texts": {},
+        }
+
+def _fetch_texts(mail, sections: tuple, group_uids: list, messages: dict, failed: dict):
+    """Aynı parça düzenindeki maillerin metin parçalarını tek komutta çeker."""
+    query = "(UID " + " ".join(f"BODY.PEEK[{sec}]" for sec in sections) + ")"
+    typ, data = mail.uid("FETCH", compress_uid_set(group_uids), query)
+    try:
+        if typ != "OK":
+            raise ValueError(f"sunucu cevabı {typ}")
+        items = parse_fetch_response(data)
+    except _PARSE_ERRORS as e:
+        # Gövdesiz kaydedilmesin: tekrar denenmek üzere hatalı say
+        for uid in group_uids:
+            failed[uid] = f"Gövde çekilemedi: {e}"
+        return
+
+    received = set()
+    for item in items:
+        msg = messages.get(item.get("UID"))
+        if not msg:
+            continue
+        received.add(msg["uid"])
+        for part in body_sections(msg["parts"]):
+            raw = item.get(f"BODY[{part['section']}]")
+            if raw is not None:
+                msg["texts"][part["section"]] = decode_part(raw, part["encoding"], part["charset"])
+
+    for uid in set(group_uids) - received:
+        failed[uid] = "Gövde cevabı gelmedi"
+
+def fetch_messages(mail, uids, batch_size: int = None):
+    """
+    Mailleri toplu (pipelined) çeker ve ayrıştırılan her maili sırayla yield eder.
+    Her parti (batch) için:
+      1) Tek komut: UID FETCH 101:180 (UID BODY.PEEK[HEADER] BODYSTRUCTURE)
+      2) Metin parçaları aynı olan mailler gruplanır, grup başına tek komut:
+         UID FETCH 101,105 (BODY.PEEK[1.1] BODY.PEEK[1.2])
+    Ekler ve inline resimler hiçbir zaman indirilmez; BODY.PEEK -> \\Seen değişmez.
+    yield: {"uid", "headers": email.message.Message, "parts": [...], "texts": {section: str}}
+           veya ayrıştırılamayan / gövdesi çekilemeyen mail için {"uid", "error": str}
+           (çağıran bunu işlenemeyen UID olarak kaydeder, boş gövdeyle kaydetmez)
+    """
+    uids = sorted(int(u) for u in uids)
+    batch_size = batch_size or FETCH_BATCH_SIZE
+
+    for i in range(0, len(uids), batch_size):
+        batch = uids[i:i + batch_size]
+        messages, failed = {}, {}
+        _fetch_structures(mail, batch, messages, failed)
+
+        # Aynı parça düzenine sahip mailleri tek komutta çek (çoğu mail "1" / "1.1 1.2" düzenindedir)
+        groups = {}
+        for msg in messages.values():
+            sections = tuple(p["section"] for p in body_sections(msg["parts"]))
+            if sections:
+                groups.setdefault(sections, []).append(msg["uid"])
+
+        for sections, group_uids in groups.items():
+            _fetch_texts(mail, sections, group_uids, messages, failed)
+
+        for uid in sorted(set(messages) | set(failed)):
+            if uid in failed:
+                yield {"uid": uid, "error": failed[uid]}
+            else:
+                yield messages[uid]
+
+def fetch_message(mail, uid: int):
+    """Tek maili çeker (fetch_messages'ın tekil hali). Mail yoksa veya çekilemediyse None."""
+    fetched = next(fetch_messages(mail, [uid]), None)
+    return None if fetched is None or fetched.get("error") else fetched
+
+def fetch_header_fields(mail, uids, fields) -> dict:
+    """
+    Verilen UID'lerin sadece istenen header alanlarını TEK komutta çeker.
+    return: {uid: email.message.Message}
+    """
+    if not uids:
+        return {}
+    query = f"(UID BODY.PEEK[HEADER.FIELDS ({' '.join(fields)})])"
+    _, data = mail.uid("FETCH", compress_uid_set(uids), query)
+
+    result = {}
+    for item in parse_fetch_response(data):
+        if "UID" in item:
+            result[item["UID"]] = email.message_from_bytes(fetch_item(item, "BODY[HEADER") or b"")
+    return result
+
+def build_mail_content(parts: list, texts: dict, message_id: str) -> dict:
+    """
+    Parça listesinden gövdeyi ve ek/inline resim metadata'sını üretir.
+    Ekler indirilmez; /ui/download ve /ui/stream linkleri anlık IMAP'ten çeker.
+    return: {"body_text", "body_html", "attachments"}
+    """
+    body_text = ""
+    body_html = ""
+    cid_map = {} # cid -> stream_url
+    attachments = [] # Ek dosyalar (metadata)
+
+    for part in parts:
+        ctype = part["content_type"]
+
+        # 1. INLINE RESİMLER (CID) -> STREAM URL
+        if part["content_id"] and ctype.startswith("image/"):
+            cid_map[part["content_id"]] = f"/ui/stream/{message_id}/{part['content_id']}"
+
+        # 2. ATTACHMENTS (EK DOSYALAR) -> DOWNLOAD LINK (boyut BODYSTRUCTURE'dan)
+        if part["disposition"] == "attachment" or part["filename"]:
+            filename = part["filename"]
+            if filename:
+                attachments.append({
+                    "filename": filename,
+                    "content_type": ctype,
+                    "size": part["size"],
+                    "url": f"/ui/download/{message_id}/{filename}"
+                })
+
+        if part["disposition"] != "attachment":
+            if ctype == "text/plain":
+                body_text += texts.get(part["section"], "")
+            elif ctype == "text/html":
+                body_html += texts.get(part["section"], "")
+
+    # HTML içindeki cid referanslarını Stream URL ile değiştir
+    if body_html and cid_map:
+        for cid, stream_url in cid_map.items():
+            body_html = body_html.replace(f"cid:{cid}", stream_url)
+
+    return {"body_text": body_text, "body_html": body_html, "attachments": attachments}
@@ -0,0 +1,195 @@
+import os
+import re
+import threading
+import time
+import requests
+
+from app.services.ollama_service import (
+    OLLAMA_MODEL, OLLAMA_KEEP_ALIVE, LLM_CONNECT_TIMEOUT,
+    _session, _base_url, _build_payload, get_model_last_used, get_routing_table
+)
+
+# Modelin diskten belleğe yüklenmesi CPU'da dakikalar sürebilir
+WARMUP_TIMEOUT = float(os.getenv("LLM_WARMUP_TIMEOUT", "300"))
+# Model Ollama tarafından bellekten atıldıysa (boşta kalma) tekrar ısıtılsın mı?
+REWARM_ENABLED = os.getenv("LLM_REWARM", "1").strip().lower() not in ("0", "false", "no")
+# Ollama'nın aynı anda bellekte tuttuğu model sayısı (sunucudaki OLLAMA_MAX_LOADED_MODELS, CPU'da 3).
+# Bu kadar model yüklüyken tekrar ısıtma başka bir modeli bellekten atar, yapılmaz.
+OLLAMA_MAX_LOADED_MODELS = int(os.getenv("OLLAMA_MAX_LOADED_MODELS", "3"))
+
+
+def _keep_alive_seconds(value: str):
+    """Ollama keep_alive değerini saniyeye çevirir ("30m" -> 1800). Negatif = hep bellekte (None)."""
+    value = (value or "").strip().lower()
+    m = re.fullmatch(r"(-?\d+(?:\.\d+)?)\s*([smh]?)", value)
+    if not m:
+        return 300.0  # Ollama varsayılanı (5 dk)
+    number = float(m.group(1))
+    if number < 0:
+        return None
+    return number * {"": 1, "s": 1, "m": 60, "h": 3600}[m.group(2)]
+
+def _full_name(model: str) -> str:
+    """Ollama etiketsiz isimleri ":latest" olarak listeler."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class ModelResidency:
+    """
+    Yapılandırılmış modellerin Ollama belleğinde olup olmadığını takip eder.
+    İlk kullanıcı isteği model yükleme süresini ödemesin diye modeli önceden yükler
+    (warm-up) ve boşta kalıp atıldığında tekrar yükler.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # model -> {"loaded", "warming", "last_warmup_ms", "warmups", "last_warmup_at", "last_error", "expires_at"}
+        self.state = {}
+        # Son /api/ps'te bellekte olan model sayısı (None: bilinmiyor)
+        self.running_count = None
+
+    def configured_routes(self) -> dict:
+        """Görev yönlendirmesinde kullanılan modeller -> rotaları (model başına tek num_ctx)."""
+        routes = {}
+        for route in get_routing_table().values():
+            routes.setdefault(route["model"], route)
+        return routes
+
+    def configured_models(self) -> list:
+        """Görev yönlendirmesinde kullanılan modeller (tekrarsız, bulunamayanlar hariç)."""
+        return list(self.configured_routes())
+
+    def _entry(self, model: str) -> dict:
+        return self.state.setdefault(model, {
+            "loaded": False, "warming": False, "last_warmup_ms": None, "warmups": 0,
+            "last_warmup_at": None, "last_error": None, "expires_at": None
+        })
+
+    def warm_up(self, model: str) -> bool:
+        """
+        Boş prompt ile modeli belleğe yükler (Ollama: boş prompt = sadece yükle).
+        Gerçek isteklerle aynı options (num_ctx) gönderilir: farklı num_ctx modeli yeniden yükletir.
+        """
+        route = self.configured_routes().get(model)
+        if route is None:
+            return False
+        with self.lock:
+            entry = self._entry(model)
+            if entry["warming"]:
+                return False
+            entry["warming"] = True
+
+        start = time.monotonic()
+        error = None
+        try:
+            response = _session.post(
+                f"{_base_url()}/api/generate",
+                json=_build_payload("", json_mode=False, stream=False, route=route),
+                timeout=(LLM_CONNECT_TIMEOUT, WARMUP_TIMEOUT)
+            )
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except requests.RequestException as e:
+            error = str(e)
+
+        elapsed_ms = round((time.monotonic() - start) * 1000, 1)
+        with self.lock:
+            entry = self._entry(model)
+            entry["warming"] = False
+            entry["last_error"] = error
+            if error is None:
+                entry["loaded"] = True
+                entry["warmups"] += 1
+                entry["last_warmup_ms"] = elapsed_ms
+                entry["last_warmup_at"] = time.time()
+
+        if error:
+            print(f"⚠️ Model ısıtılamadı ({model}): {error}")
+            return False
+        print(f"🔥 Model belleğe yüklendi: {model} ({elapsed_ms / 1000:.1f} sn)")
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Ollama /api/ps ile hangi modellerin şu an bellekte olduğunu günceller.
+        return: Bilgi alınabildiyse True
+        """
+        try:
+            response = _session.get(f"{_base_url()}/api/ps", timeout=(LLM_CONNECT_TIMEOUT, 10))
+            running = {m.get("name"): m for m in response.json().get("models", [])}
+        except (requests.RequestException, ValueError):
+            return False
+
+        with self.lock:
+            self.running_count = len(running)
+            for model in self.configured_models():
+                entry = self._entry(model)
+                info = running.get(_full_name(model)) or running.get(model)
+                entry["loaded"] = info is not None
+                entry["expires_at"] = info.get("expires_at") if info else None
+        return True
+
+    def _used_within_keep_alive(self, model: str) -> bool:
+        keep_alive = _keep_alive_seconds(OLLAMA_KEEP_ALIVE)
+        last_used = get_model_last_used(model)
+        if last_used is None:
+            return False
+        return keep_alive is None or time.monotonic() - last_used <= keep_alive
+
+    def _probably_evicted(self, model: str) -> bool:
+        """/api/ps'e ulaşılamazsa: son kullanım keep_alive süresinden eskiyse atılmış say."""
+        keep_alive = _keep_alive_seconds(OLLAMA_KEEP_ALIVE)
+        if keep_alive is None:
+            return False
+        with self.lock:
+            warmed_at = self._entry(model)["last_warmup_at"]
+        last_used = get_model_last_used(model)
+        idle_for = min(
+            (time.monotonic() - last_used) if last_used else float("inf"),
+            (time.time() - warmed_at) if warmed_at else float("inf")
+        )
+        return idle_for > keep_alive
+
+    def warm_all(self):
+        """Sunucu açılırken: yapılandırılmış tüm modelleri sırayla yükler."""
+        for model in self.configured_models():
+            self.warm_up(model)
+
+    def rewarm_idle(self):
+        """
+        Periyodik: Bellekten atılmış modelleri tekrar yükler.
+        Sadece varsayılan model ve keep_alive süresi içinde kullanılmış görev modelleri ısıtılır;
+        kullanılmayan görev modellerinin keep_alive ile boşaltılmasına izin verilir.
+        """
+        if not REWARM_ENABLED:
+            return
+        refreshed = self.refresh()
+        for model in self.configured_models():
+            if model != OLLAMA_MODEL and not self._used_within_keep_alive(model):
+                continue
+            with self.lock:
+                loaded = self._entry(model)["loaded"]
+                running_count = self.running_count
+            evicted = not loaded if refreshed else self._probably_evicted(model)
+            if not evicted:
+                continue
+            if refreshed and running_count >= OLLAMA_MAX_LOADED_MODELS:
+                # Yer yok: ısıtmak başka bir modeli atar, modeller birbirini döngüyle boşaltır
+                continue
+            print(f"♻️ Model bellekte değil, tekrar ısıtılıyor: {model}")
+            if self.warm_up(model):
+                with self.lock:
+                    self.running_count = (self.running_count or 0) + 1
+
+    def status(self) -> dict:
+        """/health için residency özeti."""
+        with self.lock:
+            return {
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "running": self.running_count,
+                "max_loaded": OLLAMA_MAX_LOADED_MODELS,
+                "models": {model: dict(self._entry(model)) for model in self.configured_models()}
+            }
+
+
+residency = ModelResidency()
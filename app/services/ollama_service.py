@@ -1,10 +1,18 @@
 import os
+import time
+import threading
+import contextvars
+import queue
 import requests
 import json
+from collections import deque
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+# LLM cevap önbelleği
+from app.services.llm_cache import cache_key, get_cached, store_cached, record_bypass, get_cache_stats
 
-# .env dosyasını yükle 
+# .env dosyasını yükle
 load_dotenv()
 
 # Önce .env'e bakar, bulamazsa ikinci parametreyi (varsayılanı) kullanır.
@@ -12,64 +20,599 @@ load_dotenv()
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral") # Veya qwen2.5
 
-def ask_llm(prompt: str, json_mode: bool = False) -> str:
+# Aynı anda Ollama'ya gidebilecek en fazla istek (fazlası sırada bekler).
+# Ollama istekleri zaten sıraya koyar; sınır, bekleyen isteklerin timeout'a düşmesini önler.
+LLM_MAX_CONCURRENCY = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "2")))
+# Bağlantı kurma ve cevap bekleme süreleri (sn)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# Bağlantı hatası / 5xx durumunda tekrar deneme sayısı
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
+# Art arda bu kadar hata olursa devre açılır ve LLM_BREAKER_COOLDOWN sn boyunca istek atılmaz
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Model her istekten sonra bu süre boyunca bellekte tutulur (Ollama keep_alive: "30m", "-1" = hep)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Modeller için context penceresi (LLM_<GÖREV>_NUM_CTX yoksa). Her istekte gönderilir:
+# gövde bütçesi buna göre hesaplanır, Ollama'nın varsayılanına (model/sürüme göre değişir) güvenilmez.
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "4096"))
+
+
+class LLMUnavailableError(Exception):
+    """Devre kesici açık: LLM sunucusu şu an sağlıksız, iş ertelenmeli."""
+
+
+# --- BAĞLANTI HAVUZU (keep-alive) ---
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_MAX_CONCURRENCY)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+# Akışlı çağrıda Ollama'dan okunup istemciye henüz iletilmemiş en fazla parça (token) sayısı
+LLM_STREAM_BUFFER = int(os.getenv("LLM_STREAM_BUFFER", "8192"))
+_STREAM_END = object()
+
+
+class CircuitBreaker:
     """
-    Ollama LLM'e prompt gönderir.
-    SADECE model cevabını string olarak döndürür.
+    CLOSED: Normal çalışma.
+    OPEN: Art arda hata eşiği aşıldı; cooldown bitene kadar istekler hemen reddedilir.
+    HALF_OPEN: Cooldown bitti; tek bir deneme isteği geçer, başarılıysa CLOSED olur.
     """
 
-    
-    # Prompt boşsa veya çok kısaysa boş dön
-    if not prompt or len(prompt.strip()) < 2:
-        return ""
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "CLOSED"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "HALF_OPEN"
+        return "OPEN"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self._state()
+            if state == "CLOSED":
+                return True
+            if state == "HALF_OPEN" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def cancel_trial(self):
+        """Deneme isteği sonuçlanmadan iptal edildi; bir sonraki istek deneme olabilir."""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    print(f"🔌 LLM devre kesici AÇILDI ({self.failures} hata), {self.cooldown:.0f} sn istek atılmayacak.")
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+_breaker = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN)
+
+# Çok aşamalı işler (mail analizi) devre kesicinin reddettiği çağrıları buradan öğrenir:
+# reddedilen çağrı "" döner ve çağıran bunu model cevabından ayırt edemez.
+_rejection_scope = contextvars.ContextVar("llm_rejection_scope", default=None)
+
+
+def start_rejection_scope() -> dict:
+    """
+    Bu bağlamda (ve contextvars.copy_context ile taşınan thread'lerde) reddedilen
+    LLM çağrılarını sayar. return: {"rejected": int}
+    """
+    scope = {"rejected": 0}
+    _rejection_scope.set(scope)
+    return scope
+
+
+def _reject(task: str):
+    _record(rejected=True, task=task)
+    scope = _rejection_scope.get()
+    if scope is not None:
+        scope["rejected"] += 1
+
+
+# --- GÖREV BAZLI MODEL YÖNLENDİRME ---
+# Her görev kendi model ve ayarlarını .env'den alabilir (tanımsız olan varsayılana düşer):
+#   LLM_<GÖREV>_MODEL, LLM_<GÖREV>_NUM_CTX, LLM_<GÖREV>_NUM_PREDICT, LLM_<GÖREV>_TIMEOUT
+# Örn: LLM_CLASSIFY_MODEL=qwen2.5:0.5b  -> YES/NO triage küçük modelde, taslaklar OLLAMA_MODEL'de.
+TASKS = ("classify", "extract", "reply", "decision", "analysis")
+DEFAULT_TASK = "default"
 
+# Görevlerin doğal çıktı boyutu (LLM_<GÖREV>_NUM_PREDICT tanımsızsa kullanılan üst sınır).
+# Serbest metin üreten görevler (reply, decision, writer) sınırsızdır: taslak cümle ortasında
+# kesilmesin. analysis'in JSON'u sınırda kesilirse şemaya uymaz ve ayrı çağrılara dönülür.
+_TASK_NUM_PREDICT = {"classify": 8, "extract": 512, "analysis": 1024}
+
+# Ollama'da bulunamayan (404) görev modelleri: bir daha denenmez, varsayılana düşülür
+_missing_models = set()
+
+def _env_int(name: str):
+    value = os.getenv(name)
+    try:
+        return int(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+def _task_model(task: str):
+    """return: (model, fallback) -> fallback: görev modeli bulunamadığı için varsayılana düşüldü"""
+    model = os.getenv(f"LLM_{task.upper()}_MODEL") if task in TASKS else None
+    if not model or model in _missing_models:
+        return OLLAMA_MODEL, bool(model)
+    return model, False
+
+def _model_num_ctx(model: str) -> int:
+    """
+    Modelin context penceresi: o modele yönlenen görevlerin num_ctx'lerinin en büyüğü.
+    Ollama num_ctx değişince modeli yeniden yükler; aynı modeli kullanan görevler farklı
+    num_ctx gönderirse her görev geçişinde yükleme süresi ödenir.
+    """
+    return max(
+        _env_int(f"LLM_{task.upper()}_NUM_CTX") or LLM_NUM_CTX
+        for task in (DEFAULT_TASK,) + TASKS
+        if _task_model(task)[0] == model
+    )
+
+def get_route(task: str = DEFAULT_TASK) -> dict:
+    """Görev için model ve ayarları döner: {task, model, num_ctx, num_predict, timeout, fallback}"""
+    prefix = f"LLM_{task.upper()}_"
+    model, fallback = _task_model(task)
+
+    num_predict = _env_int(prefix + "NUM_PREDICT")
+    timeout = _env_int(prefix + "TIMEOUT")
+    return {
+        "task": task,
+        "model": model,
+        "num_ctx": _model_num_ctx(model),
+        "num_predict": num_predict if num_predict is not None else _TASK_NUM_PREDICT.get(task),
+        "timeout": float(timeout) if timeout else LLM_TIMEOUT,
+        "fallback": fallback,
+    }
+
+def get_routing_table() -> dict:
+    return {task: get_route(task) for task in (DEFAULT_TASK,) + TASKS}
+
+def _mark_missing(model: str, task: str):
+    if model != OLLAMA_MODEL and model not in _missing_models:
+        _missing_models.add(model)
+        print(f"⚠️ '{task}' görevi için model bulunamadı ({model}), varsayılan modele ({OLLAMA_MODEL}) dönülüyor.")
+
+
+# --- METRİKLER ---
+_metrics_lock = threading.Lock()
+
+def _empty_metrics() -> dict:
+    return {
+        "calls": 0,
+        "errors": 0,
+        "timeouts": 0,
+        "rejected": 0,  # Devre açıkken reddedilen çağrılar
+        "prompt_eval_count": 0,
+        "eval_count": 0,
+        "eval_duration_ns": 0,
+        "prompt_eval_duration_ns": 0,
+        "total_latency_ms": 0.0,
+    }
+
+_metrics = _empty_metrics()
+_task_metrics = {}  # görev -> _empty_metrics() + "model"
+_latencies = deque(maxlen=500)  # Son çağrıların süreleri (ms), p50/p95 için
+_ttfts = deque(maxlen=500)      # Akışlı çağrılarda ilk parçanın gelme süresi (ms)
+
+def _record_ttft(ttft_ms: float):
+    with _metrics_lock:
+        _ttfts.append(ttft_ms)
+
+def _record(latency_ms: float = None, data: dict = None, error: bool = False,
+            timeout: bool = False, rejected: bool = False, task: str = DEFAULT_TASK, model: str = None):
+    with _metrics_lock:
+        per_task = _task_metrics.setdefault(task, _empty_metrics())
+        if model:
+            per_task["model"] = model
+        if latency_ms is not None:
+            _latencies.append(latency_ms)
+
+        for m in (_metrics, per_task):
+            if rejected:
+                m["rejected"] += 1
+                continue
+            m["calls"] += 1
+            if error:
+                m["errors"] += 1
+            if timeout:
+                m["timeouts"] += 1
+            if latency_ms is not None:
+                m["total_latency_ms"] += latency_ms
+            if data:
+                m["prompt_eval_count"] += data.get("prompt_eval_count", 0) or 0
+                m["eval_count"] += data.get("eval_count", 0) or 0
+                m["eval_duration_ns"] += data.get("eval_duration", 0) or 0
+                m["prompt_eval_duration_ns"] += data.get("prompt_eval_duration", 0) or 0
+
+def _percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1)
+
+def _summarize(m: dict) -> dict:
+    calls = m["calls"]
+    eval_seconds = m["eval_duration_ns"] / 1e9
+    prompt_seconds = m["prompt_eval_duration_ns"] / 1e9
+    return {
+        "calls": calls,
+        "errors": m["errors"],
+        "timeouts": m["timeouts"],
+        "rejected": m["rejected"],
+        "error_rate": round(m["errors"] / calls, 3) if calls else 0.0,
+        "avg_latency_ms": round(m["total_latency_ms"] / calls, 1) if calls else None,
+        "prompt_eval_count": m["prompt_eval_count"],
+        "eval_count": m["eval_count"],
+        "eval_duration_s": round(eval_seconds, 1),
+        "prompt_tokens_per_s": round(m["prompt_eval_count"] / prompt_seconds, 1) if prompt_seconds else None,
+        "eval_tokens_per_s": round(m["eval_count"] / eval_seconds, 1) if eval_seconds else None,
+    }
+
+def get_llm_metrics() -> dict:
+    """LLM çağrı istatistikleri (/health için): toplam, görev bazında ve yönlendirme tablosu."""
+    with _metrics_lock:
+        m = dict(_metrics)
+        per_task = {task: dict(tm) for task, tm in _task_metrics.items()}
+        latencies = list(_latencies)
+        ttfts = list(_ttfts)
+
+    summary = {
+        "model": OLLAMA_MODEL,
+        "breaker": _breaker.state,
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+    }
+    summary.update(_summarize(m))
+    summary.update({
+        "p50_latency_ms": _percentile(latencies, 0.50),
+        "p95_latency_ms": _percentile(latencies, 0.95),
+        "p50_first_token_ms": _percentile(ttfts, 0.50),
+        "tasks": {task: dict(_summarize(tm), model=tm.get("model")) for task, tm in per_task.items()},
+        "routing": get_routing_table(),
+        "missing_models": sorted(_missing_models),
+        "cache": get_cache_stats(),
+    })
+    return summary
+
+def is_llm_available() -> bool:
+    """Devre kesici açık değilse True (kuyruk işçileri işi ertelemek için kullanır)."""
+    return _breaker.state != "OPEN"
+
+
+def _base_url() -> str:
     # Base URL temizleme (Sonunda / varsa siler, /api/generate varsa siler)
     # Amacımız temiz bir "http://localhost:11434" elde etmek
     base_url = OLLAMA_BASE_URL.rstrip("/")
     if base_url.endswith("/api/generate"):
         base_url = base_url.replace("/api/generate", "")
+    return base_url
 
+def _generate_url() -> str:
     # İstek atılacak tam adres
-    url = f"{base_url}/api/generate"
+    return f"{_base_url()}/api/generate"
 
 
-    try:
-        response = requests.post(
-            url,
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "format": "json" if json_mode else None,
-                # Temperature 0: Modelin halüsinasyon görmesini engeller, mantıklı cevap verir.
-                "options": {
-                    "temperature": 0.0
-                }
-            },
-            timeout=60  # 60 saniye içinde cevap gelmezse iptal et
-        )
-    except requests.RequestException as e:
-        print(f" Ollama Bağlantı Hatası: {e}")
-        # Bağlantı hatasında boş dön ki sistem çökmesin
+# Model -> son başarılı kullanım zamanı (time.monotonic). Residency yöneticisi okur.
+_model_last_used = {}
+
+def _mark_used(model: str):
+    _model_last_used[model] = time.monotonic()
+
+def get_model_last_used(model: str):
+    return _model_last_used.get(model)
+
+
+def _build_payload(prompt: str, json_mode: bool, stream: bool, route: dict) -> dict:
+    # Temperature 0: Modelin halüsinasyon görmesini engeller, mantıklı cevap verir.
+    options = {"temperature": 0.0}
+    if route.get("num_ctx"):
+        options["num_ctx"] = route["num_ctx"]
+    if route.get("num_predict"):
+        options["num_predict"] = route["num_predict"]
+
+    return {
+        "model": route["model"],
+        "prompt": prompt,
+        "stream": stream,
+        "format": "json" if json_mode else None,
+        # Model bu süre boyunca bellekte kalır (her istekte tazelenir)
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": options
+    }
+
+
+def _post_generate(payload: dict, route: dict):
+    """
+    /api/generate'e (tekrar denemeli) istek atar.
+    return: (cevap JSON'u veya None, HTTP durum kodu veya None)
+    """
+    task = route["task"]
+    for attempt in range(LLM_RETRIES + 1):
+        start = time.monotonic()
+        try:
+            response = _session.post(
+                _generate_url(),
+                json=payload,
+                timeout=(LLM_CONNECT_TIMEOUT, route["timeout"])
+            )
+        except requests.Timeout as e:
+            # Model cevap üretirken zaman aşımı: tekrar denemek aynı süreyi harcar
+            _record((time.monotonic() - start) * 1000, error=True, timeout=True, task=task, model=payload["model"])
+            print(f" Ollama Zaman Aşımı: {e}")
+            return None, None
+        except requests.RequestException as e:
+            _record((time.monotonic() - start) * 1000, error=True, task=task, model=payload["model"])
+            print(f" Ollama Bağlantı Hatası: {e}")
+            if attempt < LLM_RETRIES:
+                time.sleep(0.5 * (attempt + 1))
+                continue
+            return None, None
+
+        latency_ms = (time.monotonic() - start) * 1000
+
+        # HTTP Hatası varsa (Örn: 404, 500)
+        if response.status_code != 200:
+            _record(latency_ms, error=True, task=task, model=payload["model"])
+            print(f"Ollama HTTP Hatası: {response.status_code}")
+            print("Detay:", response.text)
+            if response.status_code >= 500 and attempt < LLM_RETRIES:
+                time.sleep(0.5 * (attempt + 1))
+                continue
+            return None, response.status_code
+
+        # JSON Parse
+        try:
+            data = response.json()
+        except json.JSONDecodeError:
+            _record(latency_ms, error=True, task=task, model=payload["model"])
+            print("Ollama cevabı JSON formatında değil.")
+            return None, response.status_code
+
+        _record(latency_ms, data=data, task=task, model=payload["model"])
+        return data, response.status_code
+
+    return None, None
+
+
+def ask_llm(prompt: str, json_mode: bool = False, bypass_cache: bool = False, task: str = DEFAULT_TASK) -> str:
+    """
+    Ollama LLM'e prompt gönderir.
+    SADECE model cevabını string olarak döndürür.
+    Hata durumunda (veya devre kesici açıkken beklemeden) boş string döner.
+
+    Temperature 0 olduğundan aynı girdi aynı cevabı verir: cevaplar
+    (model, prompt, format, options) anahtarıyla önbelleğe alınır.
+    bypass_cache: Kullanıcı açıkça yeniden üretim istediğinde (regenerate)
+    önbellek okunmaz; yeni cevap önbelleğe yazılır.
+    task: "classify" / "extract" / "reply" / "decision" / "analysis" -> görevin modeli ve ayarları
+    """
+
+
+    # Prompt boşsa veya çok kısaysa boş dön
+    if not prompt or len(prompt.strip()) < 2:
         return ""
-  
-    # HTTP Hatası varsa (Örn: 404, 500)
-    if response.status_code != 200:
-        print(f"Ollama HTTP Hatası: {response.status_code}")
-        print("Detay:", response.text)
+
+    route = get_route(task)
+    payload = _build_payload(prompt, json_mode, stream=False, route=route)
+
+    key = cache_key(payload["model"], prompt, payload["format"], payload["options"])
+    if bypass_cache:
+        record_bypass()
+    else:
+        cached = get_cached(key)
+        if cached is not None:
+            return cached
+
+    if not _breaker.allow():
+        _reject(task)
         return ""
 
-    # JSON Parse
-    try:
-        data = response.json()
-    except json.JSONDecodeError:
-        print("Ollama cevabı JSON formatında değil.")
+    with _slots:
+        data, status = _post_generate(payload, route)
+
+        # Görev modeli Ollama'da yoksa varsayılan modelle tekrar dene
+        if status == 404 and payload["model"] != OLLAMA_MODEL:
+            _mark_missing(payload["model"], task)
+            route = get_route(task)
+            payload["model"] = route["model"]
+            key = cache_key(payload["model"], prompt, payload["format"], payload["options"])
+            data, status = _post_generate(payload, route)
+
+    if data is None:
+        _breaker.record_failure()
+        # Bağlantı hatasında boş dön ki sistem çökmesin
         return ""
+    _breaker.record_success()
+    _mark_used(payload["model"])
 
     # Cevabı al
     result = data.get("response", "")
-    
+
     if not isinstance(result, str):
         return ""
 
-    return result.strip()
\ No newline at end of file
+    result = result.strip()
+    store_cached(key, payload["model"], payload["format"], result)
+    return result
+
+
+def _stream_worker(payload: dict, route: dict, task: str, prompt: str, out: queue.Queue,
+                   cancel: threading.Event, holder: dict):
+    """
+    stream_llm'in üretici tarafı: LLM slotunu tutar, Ollama akışını okuyup parçaları out'a yazar.
+    İstemci (SSE) kendi hızında tüketir; slot istemciyi değil sadece Ollama'yı bekler.
+    """
+    chunks = []
+    final = None
+    start = time.monotonic()
+    key = cache_key(payload["model"], prompt, payload["format"], payload["options"])
+    try:
+        with _slots:
+            try:
+                for _ in range(2):
+                    with _session.post(
+                        _generate_url(),
+                        json=payload,
+                        stream=True,
+                        timeout=(LLM_CONNECT_TIMEOUT, route["timeout"])  # Okuma timeout'u her parça için geçerli
+                    ) as response:
+                        holder["response"] = response
+                        # Görev modeli Ollama'da yoksa varsayılan modelle tekrar dene
+                        if response.status_code == 404 and payload["model"] != OLLAMA_MODEL:
+                            _mark_missing(payload["model"], task)
+                            route = get_route(task)
+                            payload["model"] = route["model"]
+                            key = cache_key(payload["model"], prompt, payload["format"], payload["options"])
+                            continue
+
+                        if response.status_code != 200:
+                            print(f"Ollama HTTP Hatası: {response.status_code}")
+                            print("Detay:", response.text)
+                            break
+
+                        # Ollama akışı: satır başına bir JSON {"response": "...", "done": false}
+                        for line in response.iter_lines():
+                            if cancel.is_set():
+                                break
+                            if not line:
+                                continue
+                            try:
+                                data = json.loads(line)
+                            except json.JSONDecodeError:
+                                continue
+                            token = data.get("response", "")
+                            if token:
+                                if not chunks:
+                                    _record_ttft((time.monotonic() - start) * 1000)
+                                chunks.append(token)
+                                # Tampon doluysa istemci okumuyor: okuma timeout'u kadar beklenir, sonra bırakılır
+                                out.put(token, timeout=route["timeout"])
+                            if data.get("done"):
+                                final = data
+                                break
+                        break
+            except queue.Full:
+                cancel.set()
+            except Exception as e:
+                if cancel.is_set():
+                    pass  # İstemci gitti, bağlantıyı stream_llm kapattı
+                elif isinstance(e, requests.Timeout):
+                    _record((time.monotonic() - start) * 1000, error=True, timeout=True, task=task, model=payload["model"])
+                    _breaker.record_failure()
+                    print(f" Ollama Zaman Aşımı: {e}")
+                    return
+                elif isinstance(e, requests.RequestException):
+                    _record((time.monotonic() - start) * 1000, error=True, task=task, model=payload["model"])
+                    _breaker.record_failure()
+                    print(f" Ollama Bağlantı Hatası: {e}")
+                    return
+                else:
+                    raise
+
+        if cancel.is_set():
+            # Kullanıcı sayfadan ayrıldı (SSE bağlantısı kapandı): backend hatası sayılmaz
+            if chunks:
+                _breaker.record_success()
+            else:
+                _breaker.cancel_trial()
+            return
+
+        latency_ms = (time.monotonic() - start) * 1000
+        if final is None:
+            _record(latency_ms, error=True, task=task, model=payload["model"])
+            _breaker.record_failure()
+            return
+
+        _record(latency_ms, data=final, task=task, model=payload["model"])
+        _breaker.record_success()
+        _mark_used(payload["model"])
+        store_cached(key, payload["model"], payload["format"], "".join(chunks).strip())
+    finally:
+        try:
+            out.put_nowait(_STREAM_END)
+        except queue.Full:
+            pass  # Tüketici thread'in bittiğini is_alive ile anlar
+
+
+def stream_llm(prompt: str, json_mode: bool = False, bypass_cache: bool = False, task: str = DEFAULT_TASK):
+    """
+    ask_llm'in akış (stream) versiyonu: Model ürettikçe metin parçalarını yield eder.
+    Kullanıcı ilk kelimeyi cevabın tamamı bitmeden görür (SSE uçları için).
+    Önbellekte varsa cevabın tamamı tek parça olarak gelir.
+    Hata durumunda yield edilen metin eksik/boş kalabilir; sistemi patlatmaz.
+
+    Ollama'yı ayrı bir thread okur (_stream_worker) ve parçaları tampona yazar: yavaş veya
+    terk edilmiş bir tarayıcı sekmesi LLM slotunu (LLM_MAX_CONCURRENCY) tutmaz.
+    """
+    if not prompt or len(prompt.strip()) < 2:
+        return
+
+    route = get_route(task)
+    payload = _build_payload(prompt, json_mode, stream=True, route=route)
+
+    key = cache_key(payload["model"], prompt, payload["format"], payload["options"])
+    if bypass_cache:
+        record_bypass()
+    else:
+        cached = get_cached(key)
+        if cached is not None:
+            yield cached
+            return
+
+    if not _breaker.allow():
+        _reject(task)
+        return
+
+    out = queue.Queue(maxsize=LLM_STREAM_BUFFER)
+    cancel = threading.Event()
+    holder = {}
+    worker = threading.Thread(
+        target=_stream_worker, args=(payload, route, task, prompt, out, cancel, holder),
+        daemon=True, name=f"llm-stream-{task}"
+    )
+    worker.start()
+    try:
+        while True:
+            try:
+                item = out.get(timeout=1)
+            except queue.Empty:
+                if not worker.is_alive() and out.empty():
+                    return
+                continue
+            if item is _STREAM_END:
+                return
+            yield item
+    except GeneratorExit:
+        # SSE bağlantısı kapandı: üretici durur, Ollama bağlantısı hemen kapatılır (üretim kesilir)
+        cancel.set()
+        response = holder.get("response")
+        if response is not None:
+            response.close()
+        raise
@@ -1,6 +1,6 @@
 import json
 import re
-from app.services.ollama_service import ask_llm
+from app.services.ollama_service import ask_llm, stream_llm
 from app.utils.prompt_templates import TONE_INSTRUCTIONS, REPLY_PROMPT_TEMPLATE
 
 def extract_json_safe(text: str) -> dict:
@@ -30,25 +30,31 @@ def extract_json_safe(text: str) -> dict:
     # 3. Eğer hiçbiri çalışmazsa boş döndür (Sistemi patlatma)
     return {}
 
-def generate_reply(mail_text: str, tone: str = "formal") -> str:
+def generate_reply(mail_text: str, tone: str = "formal", bypass_cache: bool = False) -> str:
     """
     Genel mail cevapları üretir (Gelen kutusunda otomatik oluşan taslaklar için).
+    bypass_cache: "Yeniden üret" gibi açık isteklerde önbellekteki taslak kullanılmaz.
     """
+    reply = ask_llm(_build_reply_prompt(mail_text, tone), bypass_cache=bypass_cache, task="reply")
+    return clean_reply(reply)
+
+def _build_reply_prompt(mail_text: str, tone: str) -> str:
     tone = tone.lower()
     tone_instruction = TONE_INSTRUCTIONS.get(tone, TONE_INSTRUCTIONS["formal"])
 
-    prompt = REPLY_PROMPT_TEMPLATE.format(
+    return REPLY_PROMPT_TEMPLATE.format(
         tone_instruction=tone_instruction,
         mail_text=mail_text
     )
 
-    reply = ask_llm(prompt)
-    return _clean_reply(reply)
-
-def generate_decision_reply(mail_text: str, decision: str, tone: str = "formal") -> str:
+def generate_decision_reply(mail_text: str, decision: str, tone: str = "formal", bypass_cache: bool = False) -> str:
     """
     Kullanıcının 'approve' (Kabul) veya 'reject' (Red) kararına göre özel mail üretir.
     """
+    reply = ask_llm(_build_decision_prompt(mail_text, decision, tone), bypass_cache=bypass_cache, task="decision")
+    return clean_reply(reply)
+
+def _build_decision_prompt(mail_text: str, decision: str, tone: str) -> str:
     tone = tone.lower()
     tone_instruction = TONE_INSTRUCTIONS.get(tone, TONE_INSTRUCTIONS["formal"])
     
@@ -58,7 +64,7 @@ def generate_decision_reply(mail_text: str, decision: str, tone: str = "formal")
     else:
         decision_goal = "Kullanıcı bu teklifi/toplantıyı REDDEDİYOR. Nazikçe teşekkür eden ama şu an için uygun olmadığını/olumsuz olduğunu belirten profesyonel bir red cevabı yaz."
 
-    prompt = f"""
+    return f"""
     ### ROL
     Sen profesyonel bir yönetici asistanısın.
 
@@ -78,8 +84,13 @@ def generate_decision_reply(mail_text: str, decision: str, tone: str = "formal")
     - Gereksiz açıklamalar veya 'İşte cevabınız' gibi girişler yapma.
     """
 
-    reply = ask_llm(prompt)
-    return _clean_reply(reply)
+def stream_reply(mail_text: str, tone: str = "formal", bypass_cache: bool = False):
+    """generate_reply'ın akış versiyonu: ham metin parçalarını yield eder (temizlik sonda yapılır)."""
+    yield from stream_llm(_build_reply_prompt(mail_text, tone), bypass_cache=bypass_cache, task="reply")
+
+def stream_decision_reply(mail_text: str, decision: str, tone: str = "formal", bypass_cache: bool = False):
+    """generate_decision_reply'ın akış versiyonu."""
+    yield from stream_llm(_build_decision_prompt(mail_text, decision, tone), bypass_cache=bypass_cache, task="decision")
 
 def analyze_email_for_task(mail_text: str, sender: str = "") -> dict:
     """
@@ -102,12 +113,12 @@ def analyze_email_for_task(mail_text: str, sender: str = "") -> dict:
     {mail_text}
     """
     
-    response = ask_llm(prompt)
+    response = ask_llm(prompt, task="extract")
     
     # İŞTE BURASI: Hata veren json.loads yerine güvenli fonksiyonu kullanıyoruz
     return extract_json_safe(response)
 
-def _clean_reply(reply: str) -> str:
+def clean_reply(reply: str) -> str:
     """AI cevabını temizleyen ve formatlayan yardımcı fonksiyon"""
     if not reply:
         return ""
@@ -11,10 +11,18 @@ from dotenv import load_dotenv
 
 # Veritabanı Bağlantıları
 from app.database import mails_col, accounts_col, users_col
+from app.services.account_scanner import get_active_accounts, scan_accounts
 
 # Güvenlik
 from app.core.security import decrypt_password
 
+# IMAP Yardımcıları (BODYSTRUCTURE tabanlı kısmi fetch)
+from app.services.imap_client import uid_search, IMAP_TIMEOUT
+from app.services.mail_parser import fetch_messages, fetch_header_fields, build_mail_content
+from app.utils.body_clean import clean_body
+from app.rag.vector_store import embed_mail, save_mail_vectors
+from app.rag.search_cache import invalidate_results
+
 # Yardımcı Fonksiyonlar
 def decode_mime_words(s):
     return u''.join(
@@ -30,12 +38,6 @@ def normalize_subject(subject):
         s = re.sub(clean_pattern, '', s)
     return s.strip()
 
-# Embeddings (Opsiyonel)
-try:
-    from app.rag.embeddings import get_embedding
-except ImportError:
-    def get_embedding(text): return []
-
 def _normalize_mid(value: str) -> str:
     return (value or "").strip().strip("<>").strip()
 
@@ -45,6 +47,15 @@ def _mid_variants(value: str) -> list:
     variants = {value.strip(), clean, f"<{clean}>"}
     return [v for v in variants if v]
 
+def _known_message_ids(message_ids) -> set:
+    """Kayıtlı Message-ID'leri TEK $in sorgusuyla bulur (normalize edilmiş halleriyle)."""
+    variants = set()
+    for mid in message_ids:
+        variants.update(_mid_variants(mid))
+    if not variants: return set()
+    cursor = mails_col.find({"message_id": {"$in": list(variants)}}, {"_id": 0, "message_id": 1})
+    return {_normalize_mid(doc.get("message_id")) for doc in cursor}
+
 def _find_mail_by_message_id(message_id: str):
     mids = _mid_variants(message_id)
     if not mids: return None
@@ -87,7 +98,7 @@ def process_account_sent(account):
         host = "imap.gmail.com"
         if account.get("provider") == "outlook": host = "outlook.office365.com"
         
-        mail = imaplib.IMAP4_SSL(host)
+        mail = imaplib.IMAP4_SSL(host, timeout=IMAP_TIMEOUT)
         try:
             mail.login(email_user, email_pass)
         except:
@@ -137,8 +148,7 @@ def process_account_sent(account):
 
         # Sadece son 1 günün maillerini getir (Performans için kritik)
         since_date = (datetime.now() - timedelta(days=1)).strftime("%d-%b-%Y")
-        status, messages = mail.search(None, f'(SINCE "{since_date}")')
-        all_ids = messages[0].split()
+        all_ids = uid_search(mail, f'(SINCE "{since_date}")')
 
         if not all_ids:
             mail.logout()
@@ -146,102 +156,47 @@ def process_account_sent(account):
             
         recent_ids = all_ids[-10:] if len(all_ids) > 10 else all_ids
 
+        # Önce TEK komutta tüm adayların Message-ID header'ını çekip
+        # TEK $in sorgusuyla DB kontrolü yapalım (HIZ İÇİN, gövde inmeden önce)
+        header_map = fetch_header_fields(mail, recent_ids, ["MESSAGE-ID"])
+        known = _known_message_ids(h.get("Message-ID", "") for h in header_map.values())
+        new_ids = []
         for mail_id in recent_ids:
+            header = header_map.get(mail_id)
+            mid = _normalize_mid(header.get("Message-ID", "")) if header else ""
+            if mid and mid in known:
+                continue
+            new_ids.append(mail_id)
+
+        # DB'de olmayanları toplu çekelim: Header + BODYSTRUCTURE + sadece metin parçaları (ekler inmez)
+        inserted_count = 0
+        for fetched in fetch_messages(mail, new_ids):
+            if fetched.get("error"):
+                # Sonraki turda Message-ID kontrolüyle tekrar denenir
+                print(f"⚠️ Sent mail çekilemedi (UID {fetched['uid']}): {fetched['error']}")
+                continue
             try:
-                # Önce sadece Header çekip DB kontrolü yapalım (HIZ İÇİN)
-                _, msg_header = mail.fetch(mail_id, "(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])")
-                header_txt = msg_header[0][1].decode()
-                
-                msg_id_match = re.search(r'Message-ID:\s*(<.*?>)', header_txt, re.IGNORECASE)
-                message_id = msg_id_match.group(1) if msg_id_match else None
-
-                if message_id:
-                     message_id = message_id.strip()
-                     exist = mails_col.find_one({"message_id": message_id})
-                     if exist:
-                         continue 
-                
-                # DB'de yoksa Full Fetch yapalım
-                _, msg_data = mail.fetch(mail_id, "(RFC822)")
-                msg = email.message_from_bytes(msg_data[0][1])
-                
-                if not message_id:
-                    message_id = msg.get("Message-ID", "").strip() or f"gen-{uuid.uuid4()}"
-
-                # İkinci kontrol (Fetch sonrası garanti olsun)
-                if mails_col.find_one({"message_id": message_id}): continue
+                msg = fetched["headers"]
+                message_id = msg.get("Message-ID", "").strip() or f"gen-{uuid.uuid4()}"
 
                 subject = decode_mime_words(msg["Subject"] or "")
                 print(f"📤 Sent Mail Eşleşti: {subject}")
                 sender_name, sender_email = parseaddr(msg.get("From"))
                 
                 # --- 🚀 STREAM MANTIĞI (SENT İÇİN) ---
-                body_text = ""
-                body_html = ""
-                cid_map = {}
-                attachments = [] # Ek dosyalar (metadata)
-
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        ctype = part.get_content_type()
-                        cdisp = str(part.get("Content-Disposition"))
-                        content_id = part.get("Content-ID")
-                        
-                        # Payload decode (Sadece text ise al, dosya ise ALMA)
-                        payload = ""
-                        try:
-                            if ctype.startswith("text/"):
-                                part_data = part.get_payload(decode=True)
-                                payload = part_data.decode(errors="ignore")
-                            else:
-                                part_data = None # İndirmeyi iptal et
-                        except:
-                            part_data = None
-                            payload = ""
-
-                        # 1. INLINE RESİMLER (CID) -> STREAM URL
-                        # Base64 iptal -> /ui/stream linki geldi
-                        if content_id and ctype.startswith("image/"):
-                            clean_cid = content_id.strip("<> ")
-                            if clean_cid:
-                                stream_url = f"/ui/stream/{message_id}/{clean_cid}"
-                                cid_map[clean_cid] = stream_url
-
-                        # 2. ATTACHMENTS (EKLER) -> DOWNLOAD URL
-                        # Base64 iptal -> /ui/download linki geldi
-                        if "attachment" in cdisp or part.get_filename():
-                            filename = part.get_filename()
-                            if filename:
-                                filename = decode_mime_words(filename)
-                                attachments.append({
-                                    "filename": filename,
-                                    "content_type": ctype,
-                                    "size": 0, # Boyut şimdilik 0
-                                    "url": f"/ui/download/{message_id}/{filename}"
-                                })
-
-                        if ctype == "text/plain" and "attachment" not in cdisp:
-                            body_text += payload
-                        elif ctype == "text/html" and "attachment" not in cdisp:
-                            body_html += payload
-                else:
-                    try: 
-                        payload = msg.get_payload(decode=True).decode(errors="ignore")
-                        if msg.get_content_type() == "text/html": body_html = payload
-                        else: body_text = payload
-                    except: pass
-                
-                # HTML içindeki CID referanslarını Stream URL ile değiştir
-                if body_html and cid_map:
-                    for cid, url in cid_map.items():
-                        body_html = body_html.replace(f"cid:{cid}", url)
+                # Ekler ve inline resimler /ui/download ve /ui/stream linkleriyle tutulur (Base64 YOK)
+                content = build_mail_content(fetched["parts"], fetched["texts"], message_id)
+                body_text = content["body_text"]
+                body_html = content["body_html"]
+                attachments = content["attachments"] # Ek dosyalar (metadata)
 
+                body_clean = clean_body(body_text.strip(), body_html)
                 if not body_text and body_html:
                     body_text = re.sub('<[^<]+?>', '', body_html)
                 
-                vector_embedding = []
+                mail_vectors = []
                 try: 
-                     vector_embedding = get_embedding(f"{subject} {body_text}")
+                     mail_vectors = embed_mail(subject, body_clean)
                 except: pass
 
                 # Kaydet
@@ -255,6 +210,7 @@ def process_account_sent(account):
                     "subject": subject,
                     "subject_normalized": normalize_subject(subject),
                     "body": body_text.strip(),
+                    "body_clean": body_clean,
                     "body_html": body_html,
                     "created_at": datetime.utcnow(), 
                     "status": "SENT",
@@ -262,7 +218,6 @@ def process_account_sent(account):
                     "in_reply_to": msg.get("In-Reply-To", ""), 
                     "references": msg.get("References", "").split() if msg.get("References") else [],
                     "attachments": attachments, # Base64 YOK!
-                    "embedding": vector_embedding
                 }
 
                 # Thread'e bağlı giden mail ise tag'leri zincirden devral
@@ -270,11 +225,17 @@ def process_account_sent(account):
                 if inherited_tags:
                     mail_doc["tags"] = inherited_tags
                 
-                mails_col.insert_one(mail_doc)
+                inserted = mails_col.insert_one(mail_doc)
+                inserted_count += 1
+                save_mail_vectors(inserted.inserted_id, mail_vectors, user_email=email_user)
                 print(f"📤 Sent Mail Eşleşti: {subject}")
 
             except Exception:
                 pass
+
+        # Yeni giden mailler kelime aramasında da bulunur (vektörü olmasa bile): parti başına bir kez
+        if inserted_count:
+            invalidate_results()
         
         mail.logout()
     except Exception:
@@ -282,30 +243,14 @@ def process_account_sent(account):
 
 
 def check_all_sent():
-    """Veritabanındaki TÜM aktif hesapların Sent kutusunu tarar"""
+    """Veritabanındaki TÜM aktif hesapların Sent kutusunu paralel tarar"""
     load_dotenv(override=True)
     
-    # 1) Accounts tablosundaki aktif hesaplar (Multi-Account)
-    active_accounts = list(accounts_col.find({"is_active": True}))
-    
-    # 2) Migration/Fallback: Accounts boşsa eski Users tablosu
-    if not active_accounts:
-        active_users = list(users_col.find({"is_active": True}))
-        if active_users:
-            print("ℹ️ Sent Listener: Accounts boş, eski User tablosuna bakılıyor...")
-            for user in active_users:
-                temp_account = {
-                    "_id": user["_id"],
-                    "email": user["email"],
-                    "password": user["app_password"],
-                    "provider": "gmail"
-                }
-                process_account_sent(temp_account)
-            return
+    # Accounts tablosundaki aktif hesaplar (boşsa eski Users tablosu - Migration/Fallback)
+    active_accounts = get_active_accounts()
     
     if not active_accounts:
         return
     
     print(f"🔄 Toplam {len(active_accounts)} hesabın Sent kutusu taranıyor...")
-    for account in active_accounts:
-        process_account_sent(account)
\ No newline at end of file
+    scan_accounts(active_accounts, process_account_sent, kind="sent")
@@ -0,0 +1,69 @@
+from datetime import datetime
+from pymongo import ReturnDocument
+
+# Veritabanı Bağlantıları
+from app.database import sync_state_col
+
+# Bir mail bu kadar denemede işlenemezse checkpoint onu bekletmeyi bırakır
+MAX_UID_ATTEMPTS = 3
+
+def get_checkpoint(account_id: str, folder: str):
+    """Hesap + klasör için kayıtlı senkron durumunu döner (yoksa None)."""
+    return sync_state_col.find_one({"account_id": account_id, "folder": folder})
+
+def reset_checkpoint(account_id: str, folder: str, uidvalidity: int, last_uid: int,
+                     highestmodseq=None, pending_uids=None):
+    """
+    Checkpoint'i sıfırdan yazar. İlk senkronda veya sunucu UIDVALIDITY
+    değiştirdiğinde (eski UID'ler artık geçersiz) kullanılır.
+    pending_uids: last_uid'den küçük ama henüz işlenmemiş UID'ler (ilk senkronun
+    okunmamış mailleri). Yarıda çökülürse bir sonraki tur kaldığı yerden devam eder.
+    """
+    sync_state_col.update_one(
+        {"account_id": account_id, "folder": folder},
+        {"$set": {
+            "uidvalidity": uidvalidity,
+            "last_uid": last_uid,
+            "highestmodseq": highestmodseq,
+            "pending_uids": {str(uid): 0 for uid in (pending_uids or [])},
+            "updated_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+def advance_checkpoint(account_id: str, folder: str, uid: int):
+    """İşlenen UID'i kaydeder. $max sayesinde checkpoint asla geri gitmez."""
+    sync_state_col.update_one(
+        {"account_id": account_id, "folder": folder},
+        {
+            "$max": {"last_uid": uid},
+            "$unset": {f"pending_uids.{uid}": ""},
+            "$set": {"updated_at": datetime.utcnow()}
+        }
+    )
+
+def record_failed_uid(account_id: str, folder: str, uid: int) -> bool:
+    """
+    İşlenemeyen UID'i bekleyenler listesine alır ve deneme sayısını artırır.
+    return: Tekrar denenecekse True, deneme hakkı bittiyse False
+    """
+    state = sync_state_col.find_one_and_update(
+        {"account_id": account_id, "folder": folder},
+        {"$inc": {f"pending_uids.{uid}": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    attempts = ((state or {}).get("pending_uids") or {}).get(str(uid), 0)
+    if attempts >= MAX_UID_ATTEMPTS:
+        sync_state_col.update_one(
+            {"account_id": account_id, "folder": folder},
+            {"$unset": {f"pending_uids.{uid}": ""}}
+        )
+        return False
+    return True
+
+def save_mailbox_state(account_id: str, folder: str, highestmodseq=None):
+    """Tur sonunda kutunun HIGHESTMODSEQ değerini saklar (CONDSTORE destekleyen sunucular)."""
+    sync_state_col.update_one(
+        {"account_id": account_id, "folder": folder},
+        {"$set": {"highestmodseq": highestmodseq, "updated_at": datetime.utcnow()}}
+    )
@@ -15,6 +15,11 @@ document.addEventListener('DOMContentLoaded', () => {
             // Kullanıcı yazmayı bıraktıktan 1000ms (1 saniye) sonra ARKA PLANDA kaydet
             saveTimeout = setTimeout(saveDraft, 1000);
         });
+
+        // Taslak henüz yoksa AI taslağını akışla (SSE) üret
+        if (draftTextarea.dataset.streamDraft === '1') {
+            streamDraft('draft', draftTextarea.getAttribute('data-mail-id'));
+        }
     }
 });
 
@@ -105,6 +110,12 @@ async function handleAction(action, mailId) {
     }
 
     if (confirm(confirmMsg)) {
+        // Tarayıcı akışı (ReadableStream) destekliyorsa cevap kelime kelime gelir
+        if (window.ReadableStream && draftTextarea) {
+            streamDraft(action, mailId);
+            return;
+        }
+
         // Backend (ui.py) POST isteği beklediği için dinamik bir form oluşturup gönderiyoruz.
         // Bu sayede sayfa yenilenir ve yeni AI verisi ekrana gelir.
         const form = document.createElement('form');
@@ -115,4 +126,36 @@ async function handleAction(action, mailId) {
         document.body.appendChild(form);
         form.submit();
     }
+}
+
+// AI taslağını SSE ile akıtır. Sunucu akış bitince taslağı ve versiyon geçmişini kaydeder.
+async function streamDraft(action, mailId) {
+    const aiButtons = document.querySelectorAll('.btn-ai-action');
+    aiButtons.forEach(btn => btn.disabled = true);
+    clearTimeout(saveTimeout);
+
+    let streamed = '';
+    draftTextarea.value = '';
+    draftTextarea.readOnly = true;
+    statusIndicator.innerText = '🤖 AI yazıyor...';
+    statusIndicator.className = 'save-status saving';
+
+    await streamSSE(`/ui/task_action/${mailId}/${action}/stream`, new FormData(), {
+        onToken: (token) => {
+            streamed += token;
+            draftTextarea.value = streamed;
+            draftTextarea.scrollTop = draftTextarea.scrollHeight;
+        },
+        onDone: (data) => {
+            draftTextarea.value = data.draft;
+            showStatus('saved');
+        },
+        onError: (message) => {
+            console.error('Taslak üretilemedi:', message);
+            showStatus('error');
+        }
+    });
+
+    draftTextarea.readOnly = false;
+    aiButtons.forEach(btn => btn.disabled = false);
 }
\ No newline at end of file
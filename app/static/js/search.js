@@ -44,6 +44,10 @@ document.addEventListener('DOMContentLoaded', () => {
     // Eğer bu sayfada (örneğin Ayarlar sayfasında) arama kutusu yoksa, kod çalışmasın.
     if (!searchInput || !searchBtn) return;
 
+    // Sayfalama durumu ("Daha fazla" butonu için)
+    let currentQuery = '';
+    let currentPage = 1;
+
     // --- OLAY DİNLEYİCİLERİ (Event Listeners) ---
 
     // 1. Arama Butonuna Tıklama
@@ -67,6 +71,8 @@ document.addEventListener('DOMContentLoaded', () => {
      */
     async function performSearch() {
         const query = searchInput.value.trim();
+        currentQuery = query;
+        currentPage = 1;
         
         // Boş arama yapılmasını engelle
         if (query.length < 2) {
@@ -84,14 +90,10 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             // Backend API'ye GET isteği at
             // encodeURIComponent: URL içinde özel karakter sorununu çözer
-            const response = await fetch(`/ui/search-api?q=${encodeURIComponent(query)}`);
-            
-            if (!response.ok) throw new Error("API Hatası");
-
-            const data = await response.json();
+            const data = await fetchPage(query, 1);
 
             // Gelen veriyi ekrana bas
-            renderResults(data.results);
+            renderResults(data.results, false, data.has_more);
             
             // Arama ekranını aç
             toggleView(true);
@@ -106,14 +108,42 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    /**
+     * Tek sayfa sonuç getirir (kelime + anlam hibrit arama)
+     */
+    async function fetchPage(query, page) {
+        const response = await fetch(`/ui/search-api?q=${encodeURIComponent(query)}&page=${page}`);
+        if (!response.ok) throw new Error("API Hatası");
+        return response.json();
+    }
+
+    /**
+     * Sonraki sayfayı mevcut sonuçların altına ekler
+     */
+    async function loadMore(button) {
+        button.disabled = true;
+        button.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+        try {
+            const data = await fetchPage(currentQuery, currentPage + 1);
+            currentPage += 1;
+            button.remove();
+            renderResults(data.results, true, data.has_more);
+        } catch (error) {
+            console.error("Arama hatası:", error);
+            button.disabled = false;
+            button.innerHTML = 'Daha Fazla';
+        }
+    }
+
     /**
      * Gelen sonuçları HTML kartlarına çevirip ekrana basar
+     * append: true ise önceki sonuçlar korunur (sayfalama)
      */
-    function renderResults(results) {
-        resultsContainer.innerHTML = ''; // Önceki sonuçları temizle
+    function renderResults(results, append = false, hasMore = false) {
+        if (!append) resultsContainer.innerHTML = ''; // Önceki sonuçları temizle
 
         // Sonuç yoksa
-        if (!results || results.length === 0) {
+        if (!append && (!results || results.length === 0)) {
             resultsContainer.innerHTML = `
                 <div style="text-align: center; padding: 60px; color: #666;">
                     <div style="font-size: 3rem; margin-bottom: 10px;">🤷‍♂️</div>
@@ -124,7 +154,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         // Sonuçları döngüye al
-        results.forEach(mail => {
+        (results || []).forEach(mail => {
             // Tarihi güzelleştir (Örn: 27 Oca 14:30)
             const dateObj = new Date(mail.date);
             const dateStr = dateObj.toLocaleDateString('tr-TR', { day: 'numeric', month: 'short', hour: '2-digit', minute: '2-digit' });
@@ -163,6 +193,16 @@ document.addEventListener('DOMContentLoaded', () => {
             
             resultsContainer.appendChild(card);
         });
+
+        // Sonraki sayfa varsa "Daha Fazla" butonu
+        if (hasMore) {
+            const moreBtn = document.createElement('button');
+            moreBtn.className = 'btn btn-sm btn-secondary';
+            moreBtn.style.cssText = 'display: block; margin: 15px auto;';
+            moreBtn.innerHTML = 'Daha Fazla';
+            moreBtn.addEventListener('click', () => loadMore(moreBtn));
+            resultsContainer.appendChild(moreBtn);
+        }
     }
 
     /**
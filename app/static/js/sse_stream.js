@@ -0,0 +1,54 @@
+// app/static/js/sse_stream.js
+
+// POST isteğiyle Server-Sent Events akışını okur (EventSource sadece GET destekler).
+// onToken(text): Her yeni parça geldiğinde
+// onDone(data):  Akış bitince ({draft: "temizlenmiş metin"})
+// onError(msg):  Sunucu 'error' olayı gönderirse veya bağlantı koparsa
+async function streamSSE(url, formData, { onToken, onDone, onError }) {
+    let response;
+    try {
+        response = await fetch(url, { method: 'POST', body: formData });
+    } catch (error) {
+        if (onError) onError(error.message);
+        return;
+    }
+
+    if (!response.ok || !response.body) {
+        if (onError) onError(`HTTP ${response.status}`);
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Olaylar boş satırla ayrılır
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let dataLine = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLine += line.slice(5).trim();
+            });
+            if (!dataLine) continue;
+
+            const data = JSON.parse(dataLine);
+            if (eventName === 'done') {
+                if (onDone) onDone(data);
+            } else if (eventName === 'error') {
+                if (onError) onError(data.message);
+            } else if (onToken) {
+                onToken(data.token || '');
+            }
+        }
+    }
+}
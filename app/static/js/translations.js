@@ -42,10 +42,13 @@ const translations = {
         "table_ai_status": "AI Durumu",
         "table_action": "İşlem",
         "badge_draft_ready": "TASLAK HAZIR",
+        "badge_analyzing": "ANALİZ EDİLİYOR",
         "btn_inspect": "İncele",
         "dashboard_empty_title": "Bekleyen mail yok!",
         "dashboard_empty_desc": "Tüm bağlı hesapların kontrol ediliyor...",
         "dashboard_btn_check_now": "Şimdi Kontrol Et",
+        "dashboard_newest": "En Yeniler",
+        "dashboard_older": "Daha Eski",
 
         "home_welcome": "Merhaba",
         "home_intro_start": "İşte bugünün özeti ve AI asistanının",
@@ -323,10 +326,13 @@ const translations = {
         "table_ai_status": "AI Status",
         "table_action": "Action",
         "badge_draft_ready": "DRAFT READY",
+        "badge_analyzing": "ANALYZING",
         "btn_inspect": "Inspect",
         "dashboard_empty_title": "No pending mails!",
         "dashboard_empty_desc": "All connected accounts are being monitored...",
         "dashboard_btn_check_now": "Check Now",
+        "dashboard_newest": "Newest",
+        "dashboard_older": "Older",
 
         "home_welcome": "Hello",
         "home_intro_start": "Here is today's summary and AI notes for",
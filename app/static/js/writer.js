@@ -140,10 +140,55 @@ async function generateDraft() {
     btnGenerate.innerText = "⏳ Generating...";
     bodyInput.style.opacity = "0.5";
 
-    try {
-        const formData = new FormData();
-        formData.append('prompt', prompt);
+    const formData = new FormData();
+    formData.append('prompt', prompt);
+
+    // Browsers without ReadableStream get the whole draft in one response
+    if (!window.ReadableStream) {
+        await generateDraftOnce(formData);
+    } else {
+        await streamWriterDraft(formData);
+    }
+
+    // Reset State
+    btnGenerate.disabled = false;
+    btnGenerate.innerText = originalBtnText;
+    bodyInput.style.opacity = "1";
+}
+
+// Tokens are streamed (SSE) into the textarea as the model produces them
+async function streamWriterDraft(formData) {
+    let streamed = '';
+    let firstToken = true;
+
+    await streamSSE('/ui/writer/generate/stream', formData, {
+        onToken: (token) => {
+            if (firstToken) {
+                bodyInput.style.opacity = "1";
+                btnGenerate.innerText = "✍️ Writing...";
+                firstToken = false;
+            }
+            streamed += token;
+            bodyInput.value = streamed;
+            bodyInput.scrollTop = bodyInput.scrollHeight;
+        },
+        onDone: (data) => {
+            // Clean up quotes if AI adds them
+            bodyInput.value = data.draft.replace(/^"|"$/g, '');
 
+            // Save immediately
+            saveWriterDraft();
+        },
+        onError: (message) => {
+            console.error(message);
+            alert("Error generating draft.");
+        }
+    });
+}
+
+// Non-streaming fallback: waits for the full draft from /ui/writer/generate
+async function generateDraftOnce(formData) {
+    try {
         const response = await fetch('/ui/writer/generate', {
             method: 'POST',
             body: formData
@@ -153,25 +198,16 @@ async function generateDraft() {
 
         if (data.draft) {
             // Clean up quotes if AI adds them
-            let cleanText = data.draft.replace(/^"|"$/g, '');
-            
-            // Set text to body
-            bodyInput.value = cleanText;
-            
+            bodyInput.value = data.draft.replace(/^"|"$/g, '');
+
             // Save immediately
             saveWriterDraft();
         } else {
             alert("Error generating draft.");
         }
-
     } catch (error) {
         console.error(error);
         alert("Connection error.");
-    } finally {
-        // Reset State
-        btnGenerate.disabled = false;
-        btnGenerate.innerText = originalBtnText;
-        bodyInput.style.opacity = "1";
     }
 }
 
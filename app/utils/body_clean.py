@@ -0,0 +1,206 @@
+import html
+import os
+import re
+
+# --- MAİL GÖVDESİ ÖN İŞLEME (LLM ve embedding çağrılarından önce) ---
+# Alıntılanmış geçmiş, imza ve yasal uyarılar prompt'u şişirir, modeli yavaşlatır ve
+# uzun thread'lerde context penceresini aşar. Temiz metin mail dokümanına
+# "body_clean" olarak bir kez yazılır, tüm tüketiciler (sınıflandırma, çıkarım,
+# taslak, vektör) onu kendi token bütçesine göre kırparak kullanır.
+
+# Alıntı başlıkları: bu satırdan sonrası önceki mesajlardır
+QUOTE_PATTERNS = [
+    r'On\s+.*,\s+.*at\s+.*wrote:',
+    r'Le\s+.*à\s+.*a\s+écrit\s*:',
+    r'El\s+.*,\s+.*escribió:',
+    r'.*tarihinde\s+.*şunu\s+yazdı\s*:',
+    r'-----\s*Original Message\s*-----',
+    r'-----\s*Orijinal İleti\s*-----',
+    r'From:\s*.*Sent:\s*.*To:\s*.*Subject:',
+    r'________________________________',
+]
+_QUOTE_RE = re.compile("|".join(f"(?:{p})" for p in QUOTE_PATTERNS), re.IGNORECASE)
+
+# İmza ayracı ("-- ") ve mobil imzalar: bu satırdan sonrası atılır
+_SIGNATURE_RE = re.compile(
+    r'^(?:--\s*|Sent from my .*|iPhone\'umdan gönderildi.*|Get Outlook for .*|'
+    r'Android için Outlook.*)$',
+    re.IGNORECASE
+)
+
+# Yasal uyarı / gizlilik metinleri: başladığı satırdan sonrası atılır
+_DISCLAIMER_RE = re.compile(
+    r'^\s*(?:CONFIDENTIALITY NOTICE|DISCLAIMER|This (?:e-?mail|message) (?:and any attachments )?'
+    r'(?:is|may be) (?:confidential|intended)|Bu e-?posta(?:\s+ve\s+ekleri)?\s+.*(?:gizli|yalnızca)|'
+    r'YASAL UYARI|GİZLİLİK)',
+    re.IGNORECASE
+)
+
+# Yaklaşık tokenizer: İngilizce ~4 karakter = 1 token, Türkçe (eklemeli, ASCII dışı harfler)
+# daha fazla token harcar. Bütçe context'i aşmasın diye temkinli oran kullanılır.
+CHARS_PER_TOKEN = 3
+
+# Görev bazlı gövde bütçesi üst sınırı (token). LLM_<GÖREV>_BODY_TOKENS ile değiştirilebilir.
+# embedding: MiniLM zaten 256 word-piece'ten fazlasını okumaz.
+_DEFAULT_BUDGETS = {
+    "classify": 512,
+    "extract": 1500,
+    "reply": 1500,
+    "decision": 1500,
+    "analysis": 2000,
+    "embedding": 256,
+}
+
+# Prompt şablonunun gövde dışındaki kısmı (talimatlar, JSON şeması, etiket listesi), token.
+# Gövde bütçesi = num_ctx - şablon - num_predict: taşan prompt'ta Ollama baştan keser ve
+# ilk atılan talimatlar / şema olur.
+_TEMPLATE_TOKENS = {
+    "classify": 250,
+    "extract": 1200,
+    "reply": 400,
+    "decision": 500,
+    "analysis": 1200,
+}
+# Context ne kadar küçük olursa olsun gövdeye en az bu kadar yer bırakılır
+_MIN_BODY_TOKENS = 128
+# num_predict sınırı olmayan görevlerde (serbest taslak) cevaba ayrılan yer
+_DEFAULT_OUTPUT_TOKENS = 512
+
+
+def strip_quotes(body: str, drop_prefixed: bool = True) -> str:
+    """
+    Mail içeriğindeki alıntı satırlarını (önceki mesajları) temizler.
+    drop_prefixed=False: "> " ile başlayan satırlar korunur (UI'da mail olduğu gibi gösterilir,
+    sadece alıntı başlığından sonrası gizlenir).
+    """
+    if not body:
+        return ""
+    clean_lines = []
+    for line in body.split('\n'):
+        if _QUOTE_RE.search(line):
+            break
+        # "> " ile başlayan satırlar alıntıdır
+        if drop_prefixed and line.lstrip().startswith('>'):
+            continue
+        clean_lines.append(line)
+
+    cleaned_text = "\n".join(clean_lines).strip()
+    return cleaned_text if cleaned_text else body
+
+
+def strip_signature(body: str) -> str:
+    """İmza ayracından ve yasal uyarı metinlerinden sonrasını atar."""
+    lines = body.split('\n')
+    for i, line in enumerate(lines):
+        # İlk satırlar imza sayılmaz (tek satırlık mail "--" ile başlıyor olabilir)
+        if i > 0 and (_SIGNATURE_RE.match(line.strip()) or _DISCLAIMER_RE.match(line)):
+            return "\n".join(lines[:i]).strip()
+    return body
+
+
+def html_to_text(body_html: str) -> str:
+    """HTML gövdeyi düz metne çevirir (style/script atılır, blok etiketleri satır olur)."""
+    if not body_html:
+        return ""
+    text = re.sub(r'(?is)<(style|script|head)[^>]*>.*?</\1>', ' ', body_html)
+    text = re.sub(r'(?i)<br\s*/?>|</(?:p|div|tr|li|h[1-6])>', '\n', text)
+    text = re.sub(r'<[^<]+?>', '', text)
+    return html.unescape(text)
+
+
+def normalize_whitespace(text: str) -> str:
+    """Satır içi boşlukları teke indirir, art arda boş satırları birleştirir."""
+    text = text.replace('\r\n', '\n').replace('\r', '\n').replace('\xa0', ' ')
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def clean_body(body: str, body_html: str = "") -> str:
+    """
+    Ham mail gövdesinden LLM/embedding için temiz metin üretir:
+    alıntılar, imza, yasal uyarılar atılır; boşluklar normalize edilir.
+    Metin gövdesi yoksa HTML gövde kullanılır.
+    """
+    text = body or html_to_text(body_html)
+    if not text:
+        return ""
+    text = normalize_whitespace(text)
+    text = strip_signature(strip_quotes(text))
+    return normalize_whitespace(text)
+
+
+def estimate_tokens(text: str) -> int:
+    """Yaklaşık token sayısı (gerçek tokenizer yüklemeden)."""
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def get_token_budget(task: str) -> int:
+    """
+    Görevin gövde bütçesi: LLM_<GÖREV>_BODY_TOKENS tanımlıysa o, değilse varsayılan sınır
+    ile görevin context penceresinde (num_ctx) şablon ve cevaba kalan yerin küçüğü.
+    """
+    value = os.getenv(f"LLM_{task.upper()}_BODY_TOKENS", "")
+    try:
+        if value:
+            return int(value)
+    except ValueError:
+        pass
+    budget = _DEFAULT_BUDGETS.get(task, 1500)
+    if task not in _TEMPLATE_TOKENS:
+        return budget
+
+    from app.services.ollama_service import get_route  # lazy: utils servislere bağımlı olmasın
+    route = get_route(task)
+    available = route["num_ctx"] - _TEMPLATE_TOKENS[task] - (route["num_predict"] or _DEFAULT_OUTPUT_TOKENS)
+    return max(_MIN_BODY_TOKENS, min(budget, available))
+
+
+def truncate_to_budget(text: str, max_tokens: int) -> str:
+    """Metni token bütçesine kırpar; mümkünse paragraf/cümle/kelime sınırında keser."""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    limit = max_tokens * CHARS_PER_TOKEN
+    cut = text[:limit]
+    for sep in ("\n\n", "\n", ". ", " "):
+        pos = cut.rfind(sep)
+        # Bütçenin yarısından fazlasını atmamak için çok erken kesme
+        if pos > limit // 2:
+            return cut[:pos + len(sep)].rstrip()
+    return cut.rstrip()
+
+
+def body_for_task(mail: dict, task: str) -> str:
+    """
+    Mail dokümanından görevin bütçesine uygun temiz gövdeyi döner.
+    body_clean yoksa (eski kayıtlar) anında hesaplanır.
+    """
+    clean = mail.get("body_clean")
+    if clean is None:
+        clean = clean_body(mail.get("body", ""), mail.get("body_html", ""))
+    return truncate_to_budget(clean, get_token_budget(task))
+
+
+# Embedding parçaları (kelime): MiniLM 256 word-piece okur, ~1.3 word-piece/kelime
+CHUNK_WORDS = int(os.getenv("EMBED_CHUNK_WORDS", "160"))
+CHUNK_OVERLAP = int(os.getenv("EMBED_CHUNK_OVERLAP", "32"))
+MAX_CHUNKS = int(os.getenv("EMBED_MAX_CHUNKS", "16"))
+
+
+def chunk_text(text: str, words_per_chunk: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP,
+               max_chunks: int = MAX_CHUNKS) -> list:
+    """
+    Uzun metni örtüşen parçalara böler (parça sınırındaki cümle iki parçada da bulunur).
+    Kısa metin tek parça döner; boş metin -> [].
+    """
+    words = (text or "").split()
+    if not words:
+        return []
+    step = max(1, words_per_chunk - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + words_per_chunk]))
+        if start + words_per_chunk >= len(words) or len(chunks) >= max_chunks:
+            break
+    return chunks
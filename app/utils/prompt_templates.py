@@ -27,4 +27,47 @@ INCOMING EMAIL:
 {mail_text}
 
 YOUR REPLY (IN THE SAME LANGUAGE):
-"""
\ No newline at end of file
+"""
+
+# Tek geçişli analiz: Sınıflandırma + çıkarım + taslak TEK LLM çağrısında (JSON mode)
+SINGLE_PASS_PROMPT_TEMPLATE = """
+You are a professional executive assistant and email filtering AI.
+Analyze the email below ONCE and return ONLY a JSON object. The email can be in Turkish or English.
+
+AVAILABLE TAG LIST (Use only these slugs):
+{tag_list}
+
+FIELDS:
+1. "decision": "YES" if this is a real human email that requires a reply (questions, meeting requests,
+   confirmations), "NO" if it is spam, advertisement or an automated notification. If unsure, "YES".
+2. "category": One of "Proposal", "Complaint", "Payment", "Question", "Meeting", "Other".
+3. "urgency_score": 0-100.
+   - CRITICAL (80-100): System crash, payment failure, security breach, deadline today.
+   - TIME-SENSITIVE (60-79): Meeting invite, task for today/tomorrow, approval needed.
+   - NORMAL (30-59): Info request, process update, internal comms.
+   - PASSIVE (0-29): Newsletter, announcement, "FYI", casual chat.
+4. "tags": Slugs strictly from the AVAILABLE TAG LIST whose description matches. Empty list if none.
+5. "task": null, or {{"title": "short title", "date": "YYYY-MM-DD or null"}} if there is a meeting, deadline or actionable task.
+6. "insight": Permanent information about the sender/company (e.g. "Leaves early on Fridays"), or null.
+7. "is_proposal": true if this is a proposal or a question requiring approval, else false.
+8. "reply": If "decision" is "YES", the reply body written in the SAME LANGUAGE as the email:
+   - Body only, no subject line, no placeholders like [Name], no made-up addresses or phone numbers.
+   - Short and concise (max 3 sentences).
+   - {tone_instruction}
+   If "decision" is "NO", an empty string.
+
+EMAIL CONTENT:
+{mail_text}
+
+RESPONSE FORMAT (JSON Example - DO NOT COPY VALUES):
+{{
+    "decision": "YES",
+    "category": "Question",
+    "urgency_score": 50,
+    "tags": [],
+    "task": null,
+    "insight": null,
+    "is_proposal": false,
+    "reply": "..."
+}}
+"""
@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 import time
@@ -18,6 +19,9 @@ WHISPER_MODEL_SIZE = "medium"
 
 # 2. Arama Modeli Ayarları (Semantik Arama)
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Modeli değiştirirken veya aynı adla farklı ağırlık indirirken artırın: mevcut vektörler
+# bayat sayılır ve "python -m app.rag.reembed" ile yeniden üretilir.
+EMBEDDING_MODEL_VERSION = "1"
 
 # 3. Modellerin Kaydedileceği Ana Klasör
 MODELS_DIR = "models"
@@ -67,6 +71,9 @@ def download_embedding_model():
             # Modeli indir ve proje içine kaydet
             model = SentenceTransformer(EMBEDDING_MODEL_NAME)
             model.save(EMBEDDING_PATH)
+            # Vektörler bu etiketle saklanır (app/rag/embeddings.py -> get_model_tag)
+            with open(os.path.join(EMBEDDING_PATH, "model_info.json"), "w", encoding="utf-8") as f:
+                json.dump({"name": EMBEDDING_MODEL_NAME, "version": EMBEDDING_MODEL_VERSION}, f)
             
             elapsed_time = time.time() - start_time
             print(f"✅ ARAMA MODELİ İNDİRİLDİ VE KAYDEDİLDİ! ({int(elapsed_time)} saniye sürdü)")
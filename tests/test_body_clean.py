@@ -0,0 +1,68 @@
+from app.utils.body_clean import (
+    CHARS_PER_TOKEN, chunk_text, clean_body, estimate_tokens, html_to_text,
+    strip_quotes, strip_signature, truncate_to_budget
+)
+
+
+def test_strip_quotes_cuts_at_reply_header():
+    body = "Merhaba,\nTeklif ekte.\nOn Mon, 1 Jan 2024 at 10:00, Ali <ali@x.com> wrote:\n> eski mesaj"
+    assert strip_quotes(body) == "Merhaba,\nTeklif ekte."
+
+
+def test_strip_quotes_turkish_header():
+    body = "Tamam.\n12 Mart 2024 tarihinde Ayşe şunu yazdı:\neski"
+    assert strip_quotes(body) == "Tamam."
+
+
+def test_strip_quotes_prefixed_lines():
+    body = "Cevap\n> alıntı\nson satır"
+    assert strip_quotes(body) == "Cevap\nson satır"
+    assert strip_quotes(body, drop_prefixed=False) == body
+
+
+def test_strip_quotes_keeps_body_when_everything_is_quoted():
+    body = "-----Original Message-----\nFrom: a"
+    assert strip_quotes(body) == body
+
+
+def test_strip_signature():
+    assert strip_signature("Selam\nGörüşürüz\n-- \nAli Veli\n0555") == "Selam\nGörüşürüz"
+    # İlk satır imza ayracı sayılmaz
+    assert strip_signature("--\ntek satır") == "--\ntek satır"
+
+
+def test_clean_body_falls_back_to_html():
+    html = "<html><style>p{}</style><p>Merhaba&nbsp;dünya</p><div>ikinci</div></html>"
+    assert clean_body("", html) == "Merhaba dünya\nikinci"
+    assert html_to_text("") == ""
+
+
+def test_truncate_to_budget_short_text_untouched():
+    assert truncate_to_budget("kısa metin", 100) == "kısa metin"
+    assert truncate_to_budget("", 10) == ""
+    assert truncate_to_budget(None, 10) == ""
+
+
+def test_truncate_to_budget_cuts_at_boundary():
+    text = ("Birinci cümle burada. " * 20) + "\n\n" + ("İkinci paragraf. " * 50)
+    out = truncate_to_budget(text, 120)
+    assert len(out) <= 120 * CHARS_PER_TOKEN
+    assert estimate_tokens(out) <= 120
+    # Kelime ortasından kesilmez
+    assert text.startswith(out)
+    assert out.endswith(".")
+
+
+def test_chunk_text_short_and_empty():
+    assert chunk_text("") == []
+    assert chunk_text("bir iki üç", words_per_chunk=10, overlap=2) == ["bir iki üç"]
+
+
+def test_chunk_text_overlap_and_limit():
+    words = [f"k{i}" for i in range(25)]
+    chunks = chunk_text(" ".join(words), words_per_chunk=10, overlap=3)
+    assert chunks[0].split() == words[:10]
+    # Parça sınırındaki kelimeler iki parçada da bulunur
+    assert chunks[1].split()[:3] == words[7:10]
+    assert chunks[-1].split()[-1] == "k24"
+    assert len(chunk_text(" ".join(words), words_per_chunk=10, overlap=3, max_chunks=2)) == 2
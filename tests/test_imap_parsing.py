@@ -0,0 +1,86 @@
+import pytest
+
+# imap_client, app.core.security üzerinden cryptography ve dotenv'e ihtiyaç duyar
+pytest.importorskip("cryptography")
+pytest.importorskip("dotenv")
+
+from app.services.imap_client import _SexpReader, parse_fetch_response, fetch_item, compress_uid_set
+from app.services.mail_parser import parse_bodystructure, body_sections, decode_part
+
+
+def test_sexp_reader_atoms_strings_nil_literal():
+    reader = _SexpReader(b'(a "b c" NIL {3}\r\nxyz (d))')
+    assert reader.read() == [b"a", b"b c", None, b"xyz", [b"d"]]
+    assert reader.at_end()
+
+
+def test_sexp_reader_quoted_escapes():
+    assert _SexpReader(b'("a \\"q\\" b")').read() == [b'a "q" b']
+
+
+def test_sexp_reader_unclosed_list_raises():
+    with pytest.raises(ValueError):
+        _SexpReader(b"(a b").read()
+
+
+def test_parse_fetch_response_literal_and_uid():
+    data = [
+        (b"1 (UID 5 BODY[HEADER] {12}", b"Subject: x\r\n"),
+        b")",
+    ]
+    messages = parse_fetch_response(data)
+    assert len(messages) == 1
+    assert messages[0]["UID"] == 5
+    assert fetch_item(messages[0], "BODY[HEADER") == b"Subject: x\r\n"
+
+
+def test_parse_fetch_response_strips_partial_offset():
+    data = [(b"2 (UID 7 BODY[1]<0> {5}", b"hello"), b")"]
+    assert parse_fetch_response(data)[0]["BODY[1]"] == b"hello"
+
+
+def test_parse_fetch_response_multiple_messages():
+    data = [
+        (b"1 (UID 10 BODY[1] {2}", b"ab"), b")",
+        (b"2 (UID 11 BODY[1] {2}", b"cd"), b")",
+    ]
+    assert [m["UID"] for m in parse_fetch_response(data)] == [10, 11]
+
+
+_MULTIPART = (
+    b'(("text" "plain" ("charset" "utf-8") NIL NIL "quoted-printable" 120 4 NIL NIL NIL NIL)'
+    b'("application" "pdf" ("name" "rapor.pdf") NIL NIL "base64" 7800 NIL '
+    b'("attachment" ("filename" "rapor.pdf")) NIL NIL) "mixed" ("boundary" "x") NIL NIL NIL)'
+)
+
+
+def test_parse_bodystructure_multipart():
+    parts = parse_bodystructure(_SexpReader(_MULTIPART).read())
+    assert [p["section"] for p in parts] == ["1", "2"]
+
+    text, pdf = parts
+    assert text["content_type"] == "text/plain"
+    assert text["encoding"] == "quoted-printable"
+    assert pdf["disposition"] == "attachment"
+    assert pdf["filename"] == "rapor.pdf"
+    # base64 boyutu çözülmüş boyuta göre tahmin edilir
+    assert pdf["size"] == 7800 * 57 // 78
+
+    assert body_sections(parts) == [text]
+
+
+def test_parse_bodystructure_single_part():
+    tree = _SexpReader(b'("text" "html" ("charset" "iso-8859-9") NIL NIL "7bit" 40 2 NIL NIL NIL NIL)').read()
+    parts = parse_bodystructure(tree)
+    assert len(parts) == 1
+    assert parts[0]["section"] == "1"
+    assert parts[0]["charset"] == "iso-8859-9"
+
+
+def test_decode_part_base64_and_unknown_charset():
+    assert decode_part(b"bWVyaGFiYQ==", "base64", "utf-8") == "merhaba"
+    assert decode_part(b"abc", "7bit", "x-unknown") == "abc"
+
+
+def test_compress_uid_set():
+    assert compress_uid_set([5, 1, 2, 3, 7, 8]) == "1:3,5,7:8"
@@ -0,0 +1,101 @@
+import numpy as np
+
+from app.rag.local_index import LocalVectorIndex
+
+
+def _index(tmp_path, dim=8):
+    index = LocalVectorIndex(path=str(tmp_path / "vector_index"), dim=dim, dtype="float32")
+    # Mongo'dan kurulum yerine boş ve hazır indeks
+    index.ready = True
+    return index
+
+
+def _unit(rng, dim):
+    v = rng.normal(size=dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_add_and_search(tmp_path):
+    index = _index(tmp_path)
+    index.add("a", [1, 0, 0, 0, 0, 0, 0, 0])
+    index.add("b", [0, 1, 0, 0, 0, 0, 0, 0])
+    index.add("c", [1, 1, 0, 0, 0, 0, 0, 0])
+
+    results = index.search([1, 0.1, 0, 0, 0, 0, 0, 0], k=2)
+    assert [key for key, _ in results] == ["a", "c"]
+    assert results[0][1] > results[1][1]
+
+
+def test_add_same_id_updates_row(tmp_path):
+    index = _index(tmp_path)
+    index.add("a", [1, 0, 0, 0, 0, 0, 0, 0])
+    index.add("a", [0, 1, 0, 0, 0, 0, 0, 0])
+    assert index.count == 1
+    assert index.search([0, 1, 0, 0, 0, 0, 0, 0], k=1)[0][0] == "a"
+
+
+def test_wrong_dimension_is_ignored(tmp_path):
+    index = _index(tmp_path)
+    index.add("a", [1, 0, 0])
+    assert index.count == 0
+    assert index.search([1, 0, 0, 0, 0, 0, 0, 0]) == []
+
+
+def test_remove_drops_mail_and_chunks(tmp_path):
+    index = _index(tmp_path)
+    index.add("a", [1, 0, 0, 0, 0, 0, 0, 0])
+    index.add("a#1", [0, 1, 0, 0, 0, 0, 0, 0])
+    index.add("b", [0, 0, 1, 0, 0, 0, 0, 0])
+
+    index.remove(["a"])
+    keys = [key for key, _ in index.search([1, 1, 1, 0, 0, 0, 0, 0], k=10)]
+    assert keys == ["b"]
+    assert index.status()["tombstones"] == 2
+
+
+def test_search_allowed_filters_before_scoring(tmp_path):
+    index = _index(tmp_path)
+    index.add("a", [1, 0, 0, 0, 0, 0, 0, 0])
+    index.add("b", [0.9, 0.1, 0, 0, 0, 0, 0, 0])
+    index.add("b#1", [1, 0, 0, 0, 0, 0, 0, 0])
+
+    keys = {key for key, _ in index.search([1, 0, 0, 0, 0, 0, 0, 0], k=10, allowed={"b"})}
+    assert keys == {"b", "b#1"}
+
+
+def test_compact_keeps_live_rows(tmp_path):
+    index = _index(tmp_path)
+    rng = np.random.default_rng(1)
+    vectors = {f"m{i}": _unit(rng, 8) for i in range(20)}
+    for key, v in vectors.items():
+        index.add(key, v)
+    index.remove([f"m{i}" for i in range(10)])
+
+    index.compact()
+    assert index.count == 10
+    assert index.status()["tombstones"] == 0
+    for key in ("m10", "m15", "m19"):
+        assert index.search(vectors[key], k=1)[0][0] == key
+    # Diske yazıldı
+    assert (tmp_path / "vector_index" / "ids.json").exists()
+
+
+def test_ivf_recall(tmp_path):
+    dim = 32
+    index = _index(tmp_path, dim=dim)
+    rng = np.random.default_rng(0)
+    # Gerçek embedding'ler gibi kümelenmiş veri (düz gürültü IVF için en kötü durum)
+    centers = rng.normal(size=(40, dim))
+    data = (centers[rng.integers(0, 40, size=3000)] + rng.normal(scale=0.3, size=(3000, dim))).astype(np.float32)
+    for i, v in enumerate(data):
+        index.add(f"m{i}", v)
+    index.train_ivf()
+    assert index.centroids is not None
+
+    queries = data[rng.choice(len(data), size=50, replace=False)] + rng.normal(scale=0.05, size=(50, dim))
+    hits = 0
+    for q in queries:
+        exact = {key for key, _ in index.search(q, k=10, approximate=False)}
+        approx = {key for key, _ in index.search(q, k=10, approximate=True)}
+        hits += len(exact & approx)
+    assert hits / (50 * 10) >= 0.9
@@ -0,0 +1,58 @@
+import pytest
+
+# mail_classifier, ollama_service (requests, dotenv) ve llm_cache (pymongo) üzerinden yüklenir
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+pytest.importorskip("pymongo")
+
+from app.services.mail_classifier import pre_classify
+
+
+def _reason(headers, sender=""):
+    result = pre_classify(headers, sender)
+    return result["reason"] if result else None
+
+
+def test_auto_submitted():
+    assert _reason({"Auto-Submitted": "auto-replied"}) == "AUTO_SUBMITTED"
+    assert _reason({"Auto-Submitted": "no"}) is None
+
+
+def test_precedence_bulk():
+    assert _reason({"Precedence": "Bulk"}) == "PRECEDENCE_BULK"
+    assert _reason({"Precedence": "first-class"}) is None
+
+
+def test_mailing_list():
+    assert _reason({"List-Id": "<duyuru.example.com>"}) == "MAILING_LIST"
+    assert _reason({"List-Unsubscribe": "<mailto:u@example.com>"}) == "MAILING_LIST"
+
+
+def test_esp_header():
+    assert _reason({"X-Mailgun-Sid": "abc"}) == "ESP_HEADER"
+
+
+def test_ambiguous_headers_left_to_llm():
+    assert _reason({"Feedback-ID": "1:2:ses"}) is None
+    assert _reason({"X-Auto-Response-Suppress": "All"}) is None
+
+
+def test_noreply_sender():
+    assert _reason({}, "no-reply@shop.com") == "NOREPLY_SENDER"
+    assert _reason({}, "mailer-daemon@mx.example.com") == "NOREPLY_SENDER"
+    assert _reason({}, "ahmet@example.com") is None
+
+
+def test_noreply_with_human_reply_to():
+    headers = {"Reply-To": "Destek <destek@shop.com>"}
+    assert _reason(headers, "noreply@shop.com") is None
+    headers = {"Reply-To": "<donotreply@shop.com>"}
+    assert _reason(headers, "noreply@shop.com") == "NOREPLY_SENDER"
+
+
+def test_result_shape_and_missing_headers():
+    result = pre_classify({"Precedence": "list"})
+    assert result["should_reply"] is False
+    assert result["decision"] == "NO"
+    assert result["source"] == "rules"
+    assert pre_classify(None, "noreply@shop.com") is None
@@ -0,0 +1,27 @@
+import pytest
+
+# search, vector_store (pymongo/bson) ve embeddings üzerinden yüklenir
+pytest.importorskip("pymongo")
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+from app.rag.search import _fuse, RRF_K
+
+
+def test_fuse_rewards_ids_in_both_rankings():
+    fused = _fuse(("text", ["a", "b"]), ("vector", ["b", "c"]))
+    assert [mail_id for mail_id, _, _ in fused] == ["b", "a", "c"]
+
+    mail_id, score, ranks = fused[0]
+    assert ranks == {"text": 2, "vector": 1}
+    assert score == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+
+
+def test_fuse_single_ranking_keeps_order():
+    fused = _fuse(("text", ["x", "y", "z"]), ("vector", []))
+    assert [mail_id for mail_id, _, _ in fused] == ["x", "y", "z"]
+    assert fused[0][2] == {"text": 1}
+
+
+def test_fuse_empty():
+    assert _fuse(("text", []), ("vector", [])) == []
@@ -0,0 +1,73 @@
+import pytest
+
+# extractor, ollama_service (requests, dotenv) ve llm_cache (pymongo) üzerinden yüklenir
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+pytest.importorskip("pymongo")
+
+from app.services.extractor import _validate_single_pass
+
+
+def _data(**overrides):
+    data = {
+        "decision": "YES",
+        "reply": "Merhaba, yarın 10:00 uygundur.",
+        "urgency_score": 40,
+        "category": "Meeting",
+        "tags": ["toplanti"],
+        "task": {"title": "Toplantıya katıl"},
+        "insight": "Toplantı talebi",
+        "is_proposal": False,
+    }
+    data.update(overrides)
+    return data
+
+
+def test_valid_yes():
+    result = _validate_single_pass(_data(), {"toplanti"})
+    assert result["classifier"]["should_reply"] is True
+    assert result["classifier"]["source"] == "single_pass"
+    assert result["reply_draft"]
+    assert result["analysis"]["category"] == "Meeting"
+    assert result["analysis"]["task"] == {"title": "Toplantıya katıl"}
+
+
+def test_no_decision_drops_draft():
+    result = _validate_single_pass(_data(decision="no", reply=""), set())
+    assert result["classifier"]["should_reply"] is False
+    assert result["reply_draft"] is None
+
+
+def test_yes_without_reply_is_rejected():
+    assert _validate_single_pass(_data(reply=""), set()) is None
+
+
+@pytest.mark.parametrize("bad", [
+    "not a dict",
+    {"decision": "MAYBE"},
+    {"decision": "YES", "reply": 42},
+])
+def test_bad_shapes_are_rejected(bad):
+    assert _validate_single_pass(bad, set()) is None
+
+
+def test_urgency_is_clamped():
+    assert _validate_single_pass(_data(urgency_score=250), set())["analysis"]["urgency_score"] == 100
+    assert _validate_single_pass(_data(urgency_score=-5), set())["analysis"]["urgency_score"] == 0
+    assert _validate_single_pass(_data(urgency_score="acil"), set()) is None
+
+
+def test_unknown_category_becomes_other():
+    assert _validate_single_pass(_data(category="Spam"), set())["analysis"]["category"] == "Other"
+
+
+def test_tags_filtered_by_valid_slugs():
+    result = _validate_single_pass(_data(tags=["toplanti", "uydurma", 3]), {"toplanti"})
+    assert result["analysis"]["tags"] == ["toplanti"]
+    assert _validate_single_pass(_data(tags="toplanti"), set()) is None
+
+
+def test_task_without_title_and_blank_insight():
+    result = _validate_single_pass(_data(task={"title": ""}, insight="  "), set())
+    assert result["analysis"]["task"] is None
+    assert result["analysis"]["insight"] is None